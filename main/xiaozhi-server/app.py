@@ -5,6 +5,7 @@ import threading
 import traceback
 from config.settings import load_config, check_config_file
 from core.websocket_server import WebSocketServer
+from core.worker_manager import WorkerManager, is_reuse_port_supported
 from core.utils.util import check_ffmpeg_installed
 from config.logger import setup_logging
 
@@ -94,10 +95,37 @@ async def main():
         print("服务器已关闭，程序退出。")
 
 
+def get_worker_count(config):
+    """获取worker进程数，不支持SO_REUSEPORT的平台只能使用单进程"""
+    workers = int(config["server"].get("workers", 1))
+    if workers > 1 and not is_reuse_port_supported():
+        logger.warning("当前平台不支持SO_REUSEPORT，多进程模式已关闭，使用单进程运行")
+        return 1
+    return max(workers, 1)
+
+
+def main_workers(workers):
+    """多进程模式：主进程只负责派生和监控worker进程，组件在各worker中加载"""
+    check_config_file()
+    check_ffmpeg_installed()
+    config = load_config()
+
+    # 角色管理API服务器只在主进程中启动一次
+    if use_role_api:
+        start_role_api_server(config)
+
+    WorkerManager(config, workers).run()
+    print("服务器已关闭，程序退出。")
+
+
 if __name__ == "__main__":
     try:
         logger.info("程序启动中...")
-        asyncio.run(main())
+        workers = get_worker_count(load_config())
+        if workers > 1:
+            main_workers(workers)
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("手动中断，程序终止。")
     except Exception as e:
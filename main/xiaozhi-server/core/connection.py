@@ -30,6 +30,11 @@ from core.mcp.manager import MCPManager
 from config.config_loader import get_private_config_from_api
 from config.manage_api_client import DeviceNotFoundException, DeviceBindException
 from core.utils.output_counter import add_device_output
+from core.utils.loop_queue import LoopQueue
+from core.utils.audio_buffer import UtteranceBuffer
+from core.utils.segmenter import StreamingSegmenter
+from core.utils.tts_scheduler import TTSScheduler
+from core.providers.llm.base import sends_full_dialogue
 
 TAG = __name__
 
@@ -42,7 +47,15 @@ class TTSException(RuntimeError):
 
 class ConnectionHandler:
     def __init__(
-        self, config: Dict[str, Any], _vad, _asr, _llm, _tts, _memory, _intent
+        self,
+        config: Dict[str, Any],
+        _vad,
+        _asr,
+        _llm,
+        _tts,
+        _memory,
+        _intent,
+        _executor=None,
     ):
         self.config = copy.deepcopy(config)
         self.logger = setup_logging()
@@ -67,36 +80,60 @@ class ConnectionHandler:
         # 线程任务相关
         self.loop = asyncio.get_event_loop()
         self.stop_event = threading.Event()
-        self.tts_queue = queue.Queue()
-        self.audio_play_queue = queue.Queue()
-        self.executor = ThreadPoolExecutor(max_workers=10)
+        # 传入共享线程池时使用asyncio模式：TTS排序和音频播放作为事件循环任务运行，
+        # 阻塞调用提交到服务端共享线程池，不再为每个连接创建线程
+        self.use_asyncio_pipeline = _executor is not None
+        if self.use_asyncio_pipeline:
+            self.tts_queue = LoopQueue(self.loop)
+            self.audio_play_queue = LoopQueue(self.loop)
+            self.executor = _executor
+        else:
+            self.tts_queue = queue.Queue()
+            self.audio_play_queue = queue.Queue()
+            self.executor = ThreadPoolExecutor(max_workers=10)
+        self.pipeline_tasks = []
 
         # 依赖的组件
         self.vad = _vad
         self.asr = _asr
+        # 服务端共用的ASR，私有配置另外创建的ASR在连接关闭时释放
+        self.shared_asr = _asr
         self.llm = _llm
         self.tts = _tts
         self.memory = _memory
         self.intent = _intent
 
-        # vad相关变量
-        self.client_audio_buffer = bytearray()
-        self.client_have_voice = False
-        self.client_have_voice_last_time = 0.0
+        # vad相关变量，说话状态由每个连接独立的vad_session保存
+        self.vad_session = self.vad.create_session()
+        # 检测和更换VAD互斥，批量调度器的槽位不能在该连接的推理途中被释放
+        self.vad_lock = asyncio.Lock()
         self.client_no_voice_last_time = 0.0
-        self.client_voice_stop = False
 
         # asr相关变量
-        self.asr_audio = []
+        self.asr_audio = UtteranceBuffer(
+            int(self.config.get("asr_preroll_frames", 10)),
+            int(self.config.get("max_utterance_seconds", 60)) * 1000,
+        )
         self.asr_server_receive = True
+        self.asr_stream = None  # 流式识别时，当前这句话的识别流
+        self.asr_speculation = None  # 推测断句时提前开始的识别任务
 
         # llm相关变量
         self.llm_finish_task = False
         self.dialogue = Dialogue()
+        self.chat_task = None  # 当前这轮对话的任务，在事件循环中运行
+        self.summary_llm = None  # 压缩较早对话使用的LLM，为空时使用主LLM
+        self.summary_task = None
 
         # tts相关变量
         self.tts_first_text_index = -1
         self.tts_last_text_index = -1
+        # 第一段优先合成，后续分段限制同时合成的数量，并统计首段语音延迟
+        self.tts_scheduler = TTSScheduler(
+            self,
+            lookahead=int(self.config.get("tts_lookahead", 2)),
+            priority_workers=int(self.config.get("tts_priority_workers", 4)),
+        )
 
         # iot相关变量
         self.iot_descriptors = {}
@@ -165,17 +202,24 @@ class ConnectionHandler:
             private_config = self._initialize_private_config()
             # 异步初始化
             self.executor.submit(self._initialize_components, private_config)
-            # tts 消化线程
-            self.tts_priority_thread = threading.Thread(
-                target=self._tts_priority_thread, daemon=True
-            )
-            self.tts_priority_thread.start()
+            if self.use_asyncio_pipeline:
+                # tts 消化任务和音频播放任务
+                self.pipeline_tasks = [
+                    asyncio.create_task(self._tts_priority_task()),
+                    asyncio.create_task(self._audio_play_priority_task()),
+                ]
+            else:
+                # tts 消化线程
+                self.tts_priority_thread = threading.Thread(
+                    target=self._tts_priority_thread, daemon=True
+                )
+                self.tts_priority_thread.start()
 
-            # 音频播放 消化线程
-            self.audio_play_priority_thread = threading.Thread(
-                target=self._audio_play_priority_thread, daemon=True
-            )
-            self.audio_play_priority_thread.start()
+                # 音频播放 消化线程
+                self.audio_play_priority_thread = threading.Thread(
+                    target=self._audio_play_priority_thread, daemon=True
+                )
+                self.audio_play_priority_thread.start()
 
             try:
                 async for message in self.websocket:
@@ -196,7 +240,7 @@ class ConnectionHandler:
     async def _save_and_close(self, ws):
         """保存记忆并关闭连接"""
         try:
-            await self.memory.save_memory(self.dialogue.dialogue)
+            await self.memory.save_memory_guarded(self.dialogue.dialogue)
         except Exception as e:
             self.logger.bind(tag=TAG).error(f"保存记忆失败: {e}")
         finally:
@@ -221,6 +265,8 @@ class ConnectionHandler:
         else:
             self.prompt = self.config["prompt"]
             self.change_system_prompt(self.prompt)
+        """设置对话上下文的预算和布局"""
+        self._initialize_dialogue()
         """加载记忆"""
         self._initialize_memory()
         """加载意图识别"""
@@ -229,9 +275,11 @@ class ConnectionHandler:
         self.client_ip_info = get_ip_info(self.client_ip, self.logger)
         if self.client_ip_info is not None and "city" in self.client_ip_info:
             self.logger.bind(tag=TAG).info(f"Client ip info: {self.client_ip_info}")
-            self.prompt = self.prompt + f"\nuser location:{self.client_ip_info}"
+            # 保持系统提示不变时，位置信息随每轮的背景信息发送
+            if not self.dialogue.stable_prefix:
+                self.prompt = self.prompt + f"\nuser location:{self.client_ip_info}"
 
-            self.dialogue.update_system_message(self.prompt)
+                self.dialogue.update_system_message(self.prompt)
 
     def _initialize_private_config(self):
         read_config_from_api = self.config.get("read_config_from_api", False)
@@ -346,7 +394,8 @@ class ConnectionHandler:
             self.logger.bind(tag=TAG).error(f"初始化组件失败: {e}")
             modules = {}
         if modules.get("vad", None) is not None:
-            self.vad = modules["vad"]
+            # 本方法在线程池中执行，VAD的连接资源只能在事件循环中释放和分配
+            asyncio.run_coroutine_threadsafe(self._swap_vad(modules["vad"]), self.loop)
         if modules.get("asr", None) is not None:
             self.asr = modules["asr"]
         if modules.get("llm", None) is not None:
@@ -356,6 +405,87 @@ class ConnectionHandler:
         if modules.get("memory", None) is not None:
             self.memory = modules["memory"]
 
+    async def _swap_vad(self, vad):
+        """更换为私有配置的VAD，等待该连接进行中的检测结束"""
+        async with self.vad_lock:
+            self.vad.release(self)
+            self.vad = vad
+            self.vad_session = vad.create_session()
+
+    def _initialize_dialogue(self):
+        """按所选LLM设置对话上下文的token预算和布局，LLM配置中的值优先于全局配置"""
+        llm_config = self.config["LLM"].get(self.config["selected_module"]["LLM"], {})
+        self.dialogue.max_tokens = int(
+            llm_config.get(
+                "context_max_tokens", self.config.get("dialogue_max_tokens", 0)
+            )
+        )
+        self.dialogue.keep_turns = int(
+            llm_config.get(
+                "context_keep_turns", self.config.get("dialogue_keep_turns", 4)
+            )
+        )
+        self.dialogue.stable_prefix = bool(
+            llm_config.get(
+                "stable_prompt_prefix", self.config.get("stable_prompt_prefix", False)
+            )
+        )
+        if self.dialogue.stable_prefix and not sends_full_dialogue(self.llm):
+            # 背景信息会随提问转发给远程应用，展示给用户并保存在对方的对话记录中
+            self.logger.bind(tag=TAG).warning(
+                "当前LLM只转发最后一条用户消息，不使用stable_prompt_prefix"
+            )
+            self.dialogue.stable_prefix = False
+        if self.dialogue.max_tokens <= 0:
+            return
+
+        summary_llm_name = self.config.get("dialogue_summary_llm")
+        if summary_llm_name and summary_llm_name in self.config["LLM"]:
+            from core.utils import llm as llm_utils
+
+            summary_llm_config = self.config["LLM"][summary_llm_name]
+            summary_llm_type = summary_llm_config.get("type", summary_llm_name)
+            self.summary_llm = llm_utils.create_instance_from_config(
+                summary_llm_type, summary_llm_config, self.config["LLM"]
+            )
+            self.logger.bind(tag=TAG).info(
+                f"为对话摘要创建了专用LLM: {summary_llm_name}, 类型: {summary_llm_type}"
+            )
+
+    def _get_dialogue_context(self):
+        """每轮随用户消息发送的背景信息，只在保持系统提示不变时使用"""
+        if not self.dialogue.stable_prefix:
+            return None
+        context = {"当前时间": time.strftime("%Y-%m-%d %H:%M", time.localtime())}
+        if self.client_ip_info is not None and "city" in self.client_ip_info:
+            context["用户位置"] = str(self.client_ip_info)
+        states = []
+        for name, descriptor in self.iot_descriptors.items():
+            for property_item in descriptor.properties:
+                states.append(f"{name}.{property_item['name']}={property_item['value']}")
+        if states:
+            context["设备状态"] = "，".join(states)
+        return context
+
+    def _schedule_dialogue_summary(self):
+        """对话超出预算时，在后台把较早的对话压缩为摘要，不阻塞本轮回复"""
+        if not self.dialogue.need_summary():
+            return
+        if self.summary_task is not None and not self.summary_task.done():
+            return
+        self.summary_task = asyncio.create_task(self._summarize_dialogue())
+
+    async def _summarize_dialogue(self):
+        start_time = time.time()
+        try:
+            if await self.dialogue.summarize(self.summary_llm or self.llm):
+                self.logger.bind(tag=TAG).info(
+                    f"对话摘要已更新，耗时: {time.time() - start_time:.3f}s，"
+                    f"已压缩{self.dialogue.summary_end}条消息"
+                )
+        except Exception as e:
+            self.logger.bind(tag=TAG).error(f"对话摘要生成失败: {e}")
+
     def _initialize_memory(self):
         """初始化记忆模块"""
         device_id = self.headers.get("device-id", None)
@@ -389,8 +519,8 @@ class ConnectionHandler:
 
                 intent_llm_config = self.config["LLM"][intent_llm_name]
                 intent_llm_type = intent_llm_config.get("type", intent_llm_name)
-                intent_llm = llm_utils.create_instance(
-                    intent_llm_type, intent_llm_config
+                intent_llm = llm_utils.create_instance_from_config(
+                    intent_llm_type, intent_llm_config, self.config["LLM"]
                 )
                 self.logger.bind(tag=TAG).info(
                     f"为意图识别创建了专用LLM: {intent_llm_name}, 类型: {intent_llm_type}"
@@ -415,22 +545,23 @@ class ConnectionHandler:
         # 更新系统prompt至上下文
         self.dialogue.update_system_message(self.prompt)
 
-    def chat(self, query):
+    async def chat(self, query):
+        """在事件循环中完成一轮对话，LLM流式输出，TTS提交到线程池"""
 
         self.dialogue.put(Message(role="user", content=query))
 
         response_message = []
-        processed_chars = 0  # 跟踪已处理的字符位置
+        segmenter = self._create_segmenter()
         try:
             # 使用带记忆的对话
-            future = asyncio.run_coroutine_threadsafe(
-                self.memory.query_memory(query), self.loop
-            )
-            memory_str = future.result()
+            memory_str = await self.memory.query_memory_guarded(query)
 
             self.logger.bind(tag=TAG).debug(f"记忆内容: {memory_str}")
-            llm_responses = self.llm.response(
-                self.session_id, self.dialogue.get_llm_dialogue_with_memory(memory_str)
+            llm_responses = self.llm.aresponse_guarded(
+                self.session_id,
+                self.dialogue.get_llm_dialogue_with_memory(
+                    memory_str, self._get_dialogue_context()
+                ),
             )
         except Exception as e:
             self.logger.bind(tag=TAG).error(f"LLM 处理出错 {query}: {e}")
@@ -438,60 +569,34 @@ class ConnectionHandler:
 
         self.llm_finish_task = False
         text_index = 0
-        for content in llm_responses:
-            response_message.append(content)
-            if self.client_abort:
-                break
+        try:
+            async for content in llm_responses:
+                response_message.append(content)
+                if self.client_abort:
+                    break
 
-            # 合并当前全部文本并处理未分割部分
-            full_text = "".join(response_message)
-            current_text = full_text[processed_chars:]  # 从未处理的位置开始
-
-            # 查找最后一个有效标点
-            punctuations = ("。", "？", "！", "；", "：")
-            last_punct_pos = -1
-            for punct in punctuations:
-                pos = current_text.rfind(punct)
-                if pos > last_punct_pos:
-                    last_punct_pos = pos
-
-            # 找到分割点则处理
-            if last_punct_pos != -1:
-                segment_text_raw = current_text[: last_punct_pos + 1]
-                segment_text = get_string_no_punctuation_or_emoji(segment_text_raw)
-                if segment_text:
-                    # 强制设置空字符，测试TTS出错返回语音的健壮性
-                    # if text_index % 2 == 0:
-                    #     segment_text = " "
-                    text_index += 1
-                    self.recode_first_last_text(segment_text, text_index)
-                    future = self.executor.submit(
-                        self.speak_and_play, segment_text, text_index
-                    )
-                    self.tts_queue.put(future)
-                    processed_chars += len(segment_text_raw)  # 更新已处理字符位置
+                for segment_text in segmenter.feed(content):
+                    text_index = self._submit_tts_segment(segment_text, text_index)
+        finally:
+            # 提前退出时关闭流，释放HTTP连接
+            await llm_responses.aclose()
 
         # 处理最后剩余的文本
-        full_text = "".join(response_message)
-        remaining_text = full_text[processed_chars:]
-        if remaining_text:
-            segment_text = get_string_no_punctuation_or_emoji(remaining_text)
-            if segment_text:
-                text_index += 1
-                self.recode_first_last_text(segment_text, text_index)
-                future = self.executor.submit(
-                    self.speak_and_play, segment_text, text_index
-                )
-                self.tts_queue.put(future)
+        self._submit_tts_segment(segmenter.flush(), text_index)
 
         self.llm_finish_task = True
         self.dialogue.put(Message(role="assistant", content="".join(response_message)))
-        self.logger.bind(tag=TAG).debug(
-            json.dumps(self.dialogue.get_llm_dialogue(), indent=4, ensure_ascii=False)
+        # 惰性求值，DEBUG关闭时不序列化整个对话
+        self.logger.bind(tag=TAG).opt(lazy=True).debug(
+            "{}",
+            lambda: json.dumps(
+                self.dialogue.get_llm_dialogue(), indent=4, ensure_ascii=False
+            ),
         )
+        self._schedule_dialogue_summary()
         return True
 
-    def chat_with_function_calling(self, query, tool_call=False):
+    async def chat_with_function_calling(self, query, tool_call=False):
         self.logger.bind(tag=TAG).debug(f"Chat with function calling start: {query}")
         """Chat with function calling for intent detection using streaming"""
 
@@ -503,23 +608,22 @@ class ConnectionHandler:
         if hasattr(self, "func_handler"):
             functions = self.func_handler.get_functions()
         response_message = []
-        processed_chars = 0  # 跟踪已处理的字符位置
+        segmenter = self._create_segmenter()
 
         try:
             start_time = time.time()
 
             # 使用带记忆的对话
-            future = asyncio.run_coroutine_threadsafe(
-                self.memory.query_memory(query), self.loop
-            )
-            memory_str = future.result()
+            memory_str = await self.memory.query_memory_guarded(query)
 
             # self.logger.bind(tag=TAG).info(f"对话记录: {self.dialogue.get_llm_dialogue_with_memory(memory_str)}")
 
             # 使用支持functions的streaming接口
-            llm_responses = self.llm.response_with_functions(
+            llm_responses = self.llm.aresponse_with_functions_guarded(
                 self.session_id,
-                self.dialogue.get_llm_dialogue_with_memory(memory_str),
+                self.dialogue.get_llm_dialogue_with_memory(
+                    memory_str, self._get_dialogue_context()
+                ),
                 functions=functions,
             )
         except Exception as e:
@@ -536,66 +640,46 @@ class ConnectionHandler:
         function_arguments = ""
         content_arguments = ""
 
-        for response in llm_responses:
-            content, tools_call = response
-
-            if "content" in response:
-                content = response["content"]
-                tools_call = None
-            if content is not None and len(content) > 0:
-                content_arguments += content
-
-            if not tool_call_flag and content_arguments.startswith("<tool_call>"):
-                # print("content_arguments", content_arguments)
-                tool_call_flag = True
-
-            if tools_call is not None:
-                tool_call_flag = True
-                if tools_call[0].id is not None:
-                    function_id = tools_call[0].id
-                if tools_call[0].function.name is not None:
-                    function_name = tools_call[0].function.name
-                if tools_call[0].function.arguments is not None:
-                    function_arguments += tools_call[0].function.arguments
-
-            if content is not None and len(content) > 0:
-                if not tool_call_flag:
-                    response_message.append(content)
-
-                    if self.client_abort:
-                        break
-
-                    end_time = time.time()
-                    # self.logger.bind(tag=TAG).debug(f"大模型返回时间: {end_time - start_time} 秒, 生成token={content}")
-
-                    # 处理文本分段和TTS逻辑
-                    # 合并当前全部文本并处理未分割部分
-                    full_text = "".join(response_message)
-                    current_text = full_text[processed_chars:]  # 从未处理的位置开始
-
-                    # 查找最后一个有效标点
-                    punctuations = ("。", "？", "！", "；", "：")
-                    last_punct_pos = -1
-                    for punct in punctuations:
-                        pos = current_text.rfind(punct)
-                        if pos > last_punct_pos:
-                            last_punct_pos = pos
-
-                    # 找到分割点则处理
-                    if last_punct_pos != -1:
-                        segment_text_raw = current_text[: last_punct_pos + 1]
-                        segment_text = get_string_no_punctuation_or_emoji(
-                            segment_text_raw
-                        )
-                        if segment_text:
-                            text_index += 1
-                            self.recode_first_last_text(segment_text, text_index)
-                            future = self.executor.submit(
-                                self.speak_and_play, segment_text, text_index
+        try:
+            async for response in llm_responses:
+                content, tools_call = response
+
+                if "content" in response:
+                    content = response["content"]
+                    tools_call = None
+                if content is not None and len(content) > 0:
+                    content_arguments += content
+
+                if not tool_call_flag and content_arguments.startswith("<tool_call>"):
+                    # print("content_arguments", content_arguments)
+                    tool_call_flag = True
+
+                if tools_call is not None:
+                    tool_call_flag = True
+                    if tools_call[0].id is not None:
+                        function_id = tools_call[0].id
+                    if tools_call[0].function.name is not None:
+                        function_name = tools_call[0].function.name
+                    if tools_call[0].function.arguments is not None:
+                        function_arguments += tools_call[0].function.arguments
+
+                if content is not None and len(content) > 0:
+                    if not tool_call_flag:
+                        response_message.append(content)
+
+                        if self.client_abort:
+                            break
+
+                        end_time = time.time()
+                        # self.logger.bind(tag=TAG).debug(f"大模型返回时间: {end_time - start_time} 秒, 生成token={content}")
+
+                        # 处理文本分段和TTS逻辑
+                        for segment_text in segmenter.feed(content):
+                            text_index = self._submit_tts_segment(
+                                segment_text, text_index
                             )
-                            self.tts_queue.put(future)
-                            # 更新已处理字符位置
-                            processed_chars += len(segment_text_raw)
+        finally:
+            await llm_responses.aclose()
 
         # 处理function call
         if tool_call_flag:
@@ -613,15 +697,20 @@ class ConnectionHandler:
                     except Exception as e:
                         bHasError = True
                         response_message.append(a)
+                        for segment_text in segmenter.feed(a):
+                            text_index = self._submit_tts_segment(segment_text, text_index)
                 else:
                     bHasError = True
                     response_message.append(content_arguments)
+                    for segment_text in segmenter.feed(content_arguments):
+                        text_index = self._submit_tts_segment(segment_text, text_index)
                 if bHasError:
                     self.logger.bind(tag=TAG).error(
                         f"function call error: {content_arguments}"
                     )
             if not bHasError:
                 response_message.clear()
+                segmenter.reset()
                 self.logger.bind(tag=TAG).debug(
                     f"function_name={function_name}, function_id={function_id}, function_arguments={function_arguments}"
                 )
@@ -633,26 +722,21 @@ class ConnectionHandler:
 
                 # 处理MCP工具调用
                 if self.mcp_manager.is_mcp_tool(function_name):
-                    result = self._handle_mcp_tool_call(function_call_data)
+                    result = await self._handle_mcp_tool_call(function_call_data)
                 else:
-                    # 处理系统函数
-                    result = self.func_handler.handle_llm_function_call(
-                        self, function_call_data
+                    # 处理系统函数，插件函数中可能有阻塞调用，放到线程池中执行
+                    result = await self.loop.run_in_executor(
+                        self.executor,
+                        self.func_handler.handle_llm_function_call,
+                        self,
+                        function_call_data,
                     )
-                self._handle_function_result(result, function_call_data, text_index + 1)
+                await self._handle_function_result(
+                    result, function_call_data, text_index + 1
+                )
 
         # 处理最后剩余的文本
-        full_text = "".join(response_message)
-        remaining_text = full_text[processed_chars:]
-        if remaining_text:
-            segment_text = get_string_no_punctuation_or_emoji(remaining_text)
-            if segment_text:
-                text_index += 1
-                self.recode_first_last_text(segment_text, text_index)
-                future = self.executor.submit(
-                    self.speak_and_play, segment_text, text_index
-                )
-                self.tts_queue.put(future)
+        self._submit_tts_segment(segmenter.flush(), text_index)
 
         # 存储对话内容
         if len(response_message) > 0:
@@ -661,13 +745,37 @@ class ConnectionHandler:
             )
 
         self.llm_finish_task = True
-        self.logger.bind(tag=TAG).debug(
-            json.dumps(self.dialogue.get_llm_dialogue(), indent=4, ensure_ascii=False)
+        # 惰性求值，DEBUG关闭时不序列化整个对话
+        self.logger.bind(tag=TAG).opt(lazy=True).debug(
+            "{}",
+            lambda: json.dumps(
+                self.dialogue.get_llm_dialogue(), indent=4, ensure_ascii=False
+            ),
         )
+        self._schedule_dialogue_summary()
 
         return True
 
-    def _handle_mcp_tool_call(self, function_call_data):
+    def _create_segmenter(self):
+        return StreamingSegmenter(
+            min_chars=int(self.config.get("tts_segment_min_chars", 0)),
+            first_comma=self.config.get("tts_first_segment_comma", True),
+            first_min_chars=int(self.config.get("tts_first_segment_min_chars", 4)),
+            first_max_chars=int(self.config.get("tts_first_segment_max_chars", 0)),
+        )
+
+    def _submit_tts_segment(self, segment_text_raw, text_index):
+        """提交一段文本的TTS任务，返回最新的文本序号"""
+        segment_text = get_string_no_punctuation_or_emoji(segment_text_raw)
+        if not segment_text:
+            return text_index
+        text_index += 1
+        self.recode_first_last_text(segment_text, text_index)
+        future = self.tts_scheduler.submit(segment_text, text_index)
+        self.tts_queue.put(future)
+        return text_index
+
+    async def _handle_mcp_tool_call(self, function_call_data):
         function_arguments = function_call_data["arguments"]
         function_name = function_call_data["name"]
         try:
@@ -683,9 +791,7 @@ class ConnectionHandler:
                         action=Action.REQLLM, result="参数解析失败", response=""
                     )
 
-            tool_result = asyncio.run_coroutine_threadsafe(
-                self.mcp_manager.execute_tool(function_name, args_dict), self.loop
-            ).result()
+            tool_result = await self.mcp_manager.execute_tool(function_name, args_dict)
             # meta=None content=[TextContent(type='text', text='北京当前天气:\n温度: 21°C\n天气: 晴\n湿度: 6%\n风向: 西北 风\n风力等级: 5级', annotations=None)] isError=False
             content_text = ""
             if tool_result is not None and tool_result.content is not None:
@@ -709,11 +815,11 @@ class ConnectionHandler:
 
         return ActionResponse(action=Action.REQLLM, result="工具调用出错", response="")
 
-    def _handle_function_result(self, result, function_call_data, text_index):
+    async def _handle_function_result(self, result, function_call_data, text_index):
         if result.action == Action.RESPONSE:  # 直接回复前端
             text = result.response
             self.recode_first_last_text(text, text_index)
-            future = self.executor.submit(self.speak_and_play, text, text_index)
+            future = self.tts_scheduler.submit(text, text_index)
             self.tts_queue.put(future)
             self.dialogue.put(Message(role="assistant", content=text))
         elif result.action == Action.REQLLM:  # 调用函数后再请求llm生成回复
@@ -742,11 +848,11 @@ class ConnectionHandler:
                 self.dialogue.put(
                     Message(role="tool", tool_call_id=function_id, content=text)
                 )
-                self.chat_with_function_calling(text, tool_call=True)
+                await self.chat_with_function_calling(text, tool_call=True)
         elif result.action == Action.NOTFOUND or result.action == Action.ERROR:
             text = result.result
             self.recode_first_last_text(text, text_index)
-            future = self.executor.submit(self.speak_and_play, text, text_index)
+            future = self.tts_scheduler.submit(text, text_index)
             self.tts_queue.put(future)
             self.dialogue.put(Message(role="assistant", content=text))
         else:
@@ -770,24 +876,7 @@ class ConnectionHandler:
                     self.logger.bind(tag=TAG).debug("正在处理TTS任务...")
                     tts_timeout = int(self.config.get("tts_timeout", 10))
                     tts_file, text, text_index = future.result(timeout=tts_timeout)
-                    if text is None or len(text) <= 0:
-                        self.logger.bind(tag=TAG).error(
-                            f"TTS出错：{text_index}: tts text is empty"
-                        )
-                    elif tts_file is None:
-                        self.logger.bind(tag=TAG).error(
-                            f"TTS出错： file is empty: {text_index}: {text}"
-                        )
-                    else:
-                        self.logger.bind(tag=TAG).debug(
-                            f"TTS生成：文件路径: {tts_file}"
-                        )
-                        if os.path.exists(tts_file):
-                            opus_datas, duration = self.tts.audio_to_opus_data(tts_file)
-                        else:
-                            self.logger.bind(tag=TAG).error(
-                                f"TTS出错：文件不存在{tts_file}"
-                            )
+                    opus_datas = self._tts_file_to_opus(tts_file, text, text_index)
                 except TimeoutError:
                     self.logger.bind(tag=TAG).error("TTS超时")
                 except Exception as e:
@@ -795,12 +884,7 @@ class ConnectionHandler:
                 if not self.client_abort:
                     # 如果没有中途打断就发送语音
                     self.audio_play_queue.put((opus_datas, text, text_index))
-                if (
-                    self.tts.delete_audio_file
-                    and tts_file is not None
-                    and os.path.exists(tts_file)
-                ):
-                    os.remove(tts_file)
+                self._remove_tts_file(tts_file)
             except Exception as e:
                 self.logger.bind(tag=TAG).error(f"TTS任务处理错误: {e}")
                 self.clearSpeakStatus()
@@ -820,6 +904,82 @@ class ConnectionHandler:
                     f"tts_priority priority_thread: {text} {e}"
                 )
 
+    async def _tts_priority_task(self):
+        """asyncio模式下的TTS消化任务，按提交顺序等待TTS结果"""
+        tts_timeout = int(self.config.get("tts_timeout", 10))
+        while not self.stop_event.is_set():
+            text = None
+            try:
+                future = await self.tts_queue.get()
+                if future is None:
+                    continue
+                opus_datas, text_index, tts_file = [], 0, None
+                try:
+                    self.logger.bind(tag=TAG).debug("正在处理TTS任务...")
+                    tts_file, text, text_index = await asyncio.wait_for(
+                        asyncio.wrap_future(future), timeout=tts_timeout
+                    )
+                    opus_datas = await self.loop.run_in_executor(
+                        self.executor,
+                        self._tts_file_to_opus,
+                        tts_file,
+                        text,
+                        text_index,
+                    )
+                except asyncio.TimeoutError:
+                    self.logger.bind(tag=TAG).error("TTS超时")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.logger.bind(tag=TAG).error(f"TTS出错: {e}")
+                if not self.client_abort:
+                    # 如果没有中途打断就发送语音
+                    self.audio_play_queue.put((opus_datas, text, text_index))
+                self._remove_tts_file(tts_file)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.logger.bind(tag=TAG).error(f"TTS任务处理错误: {e}")
+                self.clearSpeakStatus()
+                try:
+                    await self.websocket.send(
+                        json.dumps(
+                            {
+                                "type": "tts",
+                                "state": "stop",
+                                "session_id": self.session_id,
+                            }
+                        )
+                    )
+                except Exception:
+                    pass
+                self.logger.bind(tag=TAG).error(f"tts_priority task: {text} {e}")
+
+    def _tts_file_to_opus(self, tts_file, text, text_index):
+        """检查TTS结果并转换为opus数据，失败时返回空列表"""
+        if text is None or len(text) <= 0:
+            self.logger.bind(tag=TAG).error(f"TTS出错：{text_index}: tts text is empty")
+        elif tts_file is None:
+            self.logger.bind(tag=TAG).error(
+                f"TTS出错： file is empty: {text_index}: {text}"
+            )
+        else:
+            self.logger.bind(tag=TAG).debug(f"TTS生成：文件路径: {tts_file}")
+            if os.path.exists(tts_file):
+                opus_datas, duration = self.tts.audio_to_opus_data(tts_file)
+                return opus_datas
+            else:
+                self.logger.bind(tag=TAG).error(f"TTS出错：文件不存在{tts_file}")
+        return []
+
+    def _remove_tts_file(self, tts_file):
+        if (
+            self.tts.delete_audio_file
+            and tts_file is not None
+            and os.path.exists(tts_file)
+        ):
+            os.remove(tts_file)
+
     def _audio_play_priority_thread(self):
         while not self.stop_event.is_set():
             text = None
@@ -839,6 +999,18 @@ class ConnectionHandler:
                     f"audio_play_priority priority_thread: {text} {e}"
                 )
 
+    async def _audio_play_priority_task(self):
+        """asyncio模式下的音频播放任务"""
+        while not self.stop_event.is_set():
+            text = None
+            try:
+                opus_datas, text, text_index = await self.audio_play_queue.get()
+                await sendAudioMessage(self, opus_datas, text, text_index)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.logger.bind(tag=TAG).error(f"audio_play_priority task: {text} {e}")
+
     def speak_and_play(self, text, text_index=0):
         if text is None or len(text) <= 0:
             self.logger.bind(tag=TAG).info(f"无需tts转换，query为空，{text}")
@@ -878,15 +1050,41 @@ class ConnectionHandler:
         # 触发停止事件并清理资源
         if self.stop_event:
             self.stop_event.set()
-
-        # 立即关闭线程池
+        # 打断仍在共享线程池中运行的llm、tts任务
+        self.client_abort = True
+
+        # 取消消化任务，当前任务（例如播放结束后关闭连接）会因stop_event自行退出
+        current_task = asyncio.current_task()
+        for task in self.pipeline_tasks:
+            if task is not current_task and not task.done():
+                task.cancel()
+        self.pipeline_tasks = []
+        # 结束进行中的对话
+        if self.chat_task is not None and self.chat_task is not current_task:
+            self.chat_task.cancel()
+        if self.summary_task is not None:
+            self.summary_task.cancel()
+
+        # 立即关闭线程池，共享线程池由服务端管理
         if self.executor:
-            self.executor.shutdown(wait=False, cancel_futures=True)
+            if not self.use_asyncio_pipeline:
+                self.executor.shutdown(wait=False, cancel_futures=True)
             self.executor = None
 
         # 清空任务队列
         self._clear_queues()
 
+        # 释放VAD占用的连接资源
+        if self.vad:
+            async with self.vad_lock:
+                self.vad.release(self)
+
+        # 放弃未完成的流式识别
+        if self.asr:
+            self.cancel_asr_stream()
+            if self.asr is not self.shared_asr:
+                await self.asr.close()
+
         if ws:
             await ws.close()
         elif self.websocket:
@@ -898,6 +1096,9 @@ class ConnectionHandler:
         for q in [self.tts_queue, self.audio_play_queue]:
             if not q:
                 continue
+            if isinstance(q, LoopQueue):
+                q.clear()
+                continue
             while not q.empty():
                 try:
                     q.get_nowait()
@@ -908,17 +1109,23 @@ class ConnectionHandler:
             # q.queue.put(None)
 
     def reset_vad_states(self):
-        self.client_audio_buffer = bytearray()
-        self.client_have_voice = False
-        self.client_have_voice_last_time = 0
-        self.client_voice_stop = False
+        self.vad_session.reset()
         self.logger.bind(tag=TAG).debug("VAD states reset.")
 
-    def chat_and_close(self, text):
+    def cancel_asr_stream(self):
+        """放弃当前这句话未完成的识别，包括流式识别和推测断句提前开始的识别"""
+        if self.asr_stream is not None:
+            self.asr.cancel(self.asr_stream)
+            self.asr_stream = None
+        if self.asr_speculation is not None:
+            self.asr_speculation.cancel()
+            self.asr_speculation = None
+
+    async def chat_and_close(self, text):
         """Chat with the user and then close the connection"""
         try:
             # Use the existing chat method
-            self.chat(text)
+            await self.chat(text)
 
             # After chat is complete, close the connection
             self.close_after_chat = True
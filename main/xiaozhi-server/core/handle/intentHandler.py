@@ -114,9 +114,7 @@ async def process_intent_result(conn, intent_result, original_text):
                             else 0
                         )
                         conn.recode_first_last_text(text, text_index)
-                        future = conn.executor.submit(
-                            conn.speak_and_play, text, text_index
-                        )
+                        future = conn.tts_scheduler.submit(text, text_index)
                         conn.llm_finish_task = True
                         conn.tts_queue.put(future)
                         conn.dialogue.put(Message(role="assistant", content=text))
@@ -1,5 +1,6 @@
 from config.logger import setup_logging
 import time
+import asyncio
 from core.utils.util import remove_punctuation_and_length
 from core.handle.sendAudioHandle import send_stt_message
 from core.handle.intentHandler import handle_user_intent
@@ -8,46 +9,142 @@ from core.utils.output_counter import check_device_output_limit
 TAG = __name__
 logger = setup_logging()
 
+SENTENCE_FINAL_PUNCTUATION = "。！？!?…"
+
 
 async def handleAudioMessage(conn, audio):
     if not conn.asr_server_receive:
+        if conn.client_listen_mode == "auto":
+            await probe_truncation(conn, audio)
         logger.bind(tag=TAG).debug(f"前期数据处理中，暂停接收")
         return
     if conn.client_listen_mode == "auto":
-        have_voice = conn.vad.is_vad(conn, audio)
+        async with conn.vad_lock:
+            have_voice = await conn.vad.is_vad_async(conn, audio)
     else:
-        have_voice = conn.client_have_voice
+        have_voice = conn.vad_session.have_voice
 
     # 如果本次没有声音，本段也没声音，就把声音丢弃了
-    if have_voice == False and conn.client_have_voice == False:
+    if have_voice == False and conn.vad_session.have_voice == False:
         await no_voice_close_connect(conn)
-        conn.asr_audio.append(audio)
-        conn.asr_audio = conn.asr_audio[
-            -10:
-        ]  # 保留最新的10帧音频内容，解决ASR句首丢字问题
+        # 保留最新的几帧音频内容，解决ASR句首丢字问题
+        conn.asr_audio.push_preroll(audio)
         return
     conn.client_no_voice_last_time = 0.0
-    conn.asr_audio.append(audio)
+    reach_limit = conn.asr_audio.append(audio)
+    if reach_limit and not conn.vad_session.voice_stop:
+        # 本句已达到时长上限，强制断句送去识别，避免音频无限堆积
+        logger.bind(tag=TAG).warning("单句音频达到时长上限，强制断句")
+        conn.vad_session.voice_stop = True
+    if conn.asr.streaming and (
+        conn.asr_stream is not None or conn.asr.stream_available()
+    ):
+        # 流式识别，说话过程中就把音频送入ASR
+        await feed_asr_stream(conn, audio, have_voice)
+    else:
+        update_asr_speculation(conn)
     # 如果本段有声音，且已经停止了
-    if conn.client_voice_stop:
+    if conn.vad_session.voice_stop:
+        if conn.vad.endpointing.enabled:
+            logger.bind(tag=TAG).debug(
+                f"断句状态: {conn.vad.endpointing.session_state(conn.vad_session)}"
+            )
         conn.client_abort = False
         conn.asr_server_receive = False
         # 音频太短了，无法识别
         if len(conn.asr_audio) < 15:
+            conn.vad.endpointing.discard_endpoint(conn.vad_session)
+            conn.cancel_asr_stream()
             conn.asr_server_receive = True
         else:
-            text, _ = await conn.asr.speech_to_text(conn.asr_audio, conn.session_id)
+            speech_end_time = time.time()
+            if conn.asr_stream is not None:
+                stream, conn.asr_stream = conn.asr_stream, None
+                text, _ = await conn.asr.finish(stream)
+            elif conn.asr_speculation is not None:
+                text = await commit_asr_speculation(conn)
+            else:
+                text, _ = await conn.asr.speech_to_text_guarded(
+                    conn.asr_audio.packets(), conn.session_id
+                )
             logger.bind(tag=TAG).info(f"识别文本: {text}")
             text_len, _ = remove_punctuation_and_length(text)
             if text_len > 0:
-                await startToChat(conn, text)
+                await startToChat(conn, text, speech_end_time)
             else:
+                conn.vad.endpointing.discard_endpoint(conn.vad_session)
                 conn.asr_server_receive = True
         conn.asr_audio.clear()
         conn.reset_vad_states()
 
 
-async def startToChat(conn, text):
+async def probe_truncation(conn, audio):
+    """
+    断句后本轮对话处理期间音频不送ASR，但截断观察窗口内仍然做VAD检测，
+    用户紧接着继续说话说明上一次断句截断了用户的话，由断句控制器加大阈值
+    """
+    if not conn.vad.endpointing.awaiting_truncation(
+        conn.vad_session, time.time() * 1000
+    ):
+        return
+    async with conn.vad_lock:
+        await conn.vad.is_vad_async(conn, audio)
+    # 这段音频不属于任何一句话，不保留说话状态
+    conn.reset_vad_states()
+
+
+async def feed_asr_stream(conn, audio, have_voice):
+    if conn.asr_stream is None:
+        conn.asr_stream = conn.asr.start_stream(conn.session_id)
+        # 先送入句首之前缓存的音频
+        for pre_audio in conn.asr_audio.packets()[:-1]:
+            await conn.asr.feed(conn.asr_stream, pre_audio, False)
+    if audio:
+        await conn.asr.feed(conn.asr_stream, audio, bool(have_voice))
+    if not have_voice and conn.vad_session.have_voice:
+        # 停顿时中间结果以句末标点结尾，说明这句话大概率已经说完，可以更早断句
+        text = conn.asr.partial_text(conn.asr_stream).rstrip()
+        conn.vad_session.sentence_final = text.endswith(
+            tuple(SENTENCE_FINAL_PUNCTUATION)
+        )
+
+
+def update_asr_speculation(conn):
+    """推测断句：静音达到提前标记时就开始识别，期间恢复说话则放弃该结果"""
+    if conn.vad_session.early_stop:
+        if conn.asr_speculation is None and len(conn.asr_audio) >= 15:
+            # 识别的是此刻的音频快照，之后追加的只是句尾静音
+            conn.asr_speculation = asyncio.create_task(
+                conn.asr.speech_to_text_guarded(
+                    list(conn.asr_audio.packets()), conn.session_id
+                )
+            )
+    elif conn.asr_speculation is not None:
+        logger.bind(tag=TAG).debug("推测断句未命中，用户继续说话")
+        conn.cancel_asr_stream()
+
+
+async def commit_asr_speculation(conn):
+    """静音达到断句阈值，直接采用提前开始的识别结果"""
+    task, conn.asr_speculation = conn.asr_speculation, None
+    logger.bind(tag=TAG).debug(
+        f"推测断句命中，断句时识别{'已完成' if task.done() else '进行中'}"
+    )
+    try:
+        text, _ = await task
+        return text
+    except Exception as e:
+        logger.bind(tag=TAG).error(f"推测识别失败，重新识别: {e}")
+        text, _ = await conn.asr.speech_to_text_guarded(
+            conn.asr_audio.packets(), conn.session_id
+        )
+        return text
+
+
+async def startToChat(conn, text, turn_start_time=None):
+    # 首段语音延迟从用户说完话开始计算，文本输入时从这里开始
+    conn.tts_scheduler.start_turn(turn_start_time)
+
     if conn.need_bind:
         await check_bind_device(conn)
         return
@@ -70,11 +167,12 @@ async def startToChat(conn, text):
 
     # 意图未被处理，继续常规聊天流程
     await send_stt_message(conn, text)
+    # 对话在事件循环中运行，不再占用线程
     if conn.use_function_call_mode:
         # 使用支持function calling的聊天方法
-        conn.executor.submit(conn.chat_with_function_calling, text)
+        conn.chat_task = asyncio.create_task(conn.chat_with_function_calling(text))
     else:
-        conn.executor.submit(conn.chat, text)
+        conn.chat_task = asyncio.create_task(conn.chat(text))
 
 
 async def no_voice_close_connect(conn):
@@ -17,6 +17,8 @@ async def sendAudioMessage(conn, audios, text, text_index=0):
     await send_tts_message(conn, "sentence_start", text)
 
     # 播放音频
+    if audios:
+        conn.tts_scheduler.on_audio_start()
     await sendAudio(conn, audios)
 
     await send_tts_message(conn, "sentence_end", text)
@@ -29,17 +29,18 @@ async def handleTextMessage(conn, message):
                 conn.client_listen_mode = msg_json["mode"]
                 logger.bind(tag=TAG).debug(f"客户端拾音模式：{conn.client_listen_mode}")
             if msg_json["state"] == "start":
-                conn.client_have_voice = True
-                conn.client_voice_stop = False
+                conn.vad_session.have_voice = True
+                conn.vad_session.voice_stop = False
             elif msg_json["state"] == "stop":
-                conn.client_have_voice = True
-                conn.client_voice_stop = True
+                conn.vad_session.have_voice = True
+                conn.vad_session.voice_stop = True
                 if len(conn.asr_audio) > 0:
                     await handleAudioMessage(conn, b"")
             elif msg_json["state"] == "detect":
                 conn.asr_server_receive = False
-                conn.client_have_voice = False
+                conn.vad_session.have_voice = False
                 conn.asr_audio.clear()
+                conn.cancel_asr_stream()
                 if "text" in msg_json:
                     text = msg_json["text"]
                     _, text = remove_punctuation_and_length(text)
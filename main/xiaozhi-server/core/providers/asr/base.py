@@ -1,19 +1,241 @@
+import os
+import time
+import uuid
+import wave
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Optional, Tuple, List
 
+import numpy as np
 from config.logger import setup_logging
+from core.utils import opus_codec
 
 TAG = __name__
 logger = setup_logging()
 
+FRAME_DURATION_MS = 60  # 设备上报的每个opus数据包时长
+
+
+class ASRStream:
+    """
+    一次流式识别的状态，由start_stream创建，finish或cancel后失效
+    默认实现按说话中的停顿把音频切成分段，每段在用户说话时就提交识别
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.opus_data = []  # 尚未提交识别的音频
+        self.voice_frames = 0  # opus_data中有声音的帧数
+        self.pause_frames = 0  # 当前连续静音的帧数
+        self.tasks = []  # 已提交识别的分段，按时间顺序排列
+
+
+class PCMStream(ASRStream):
+    """
+    边收边解码的流式识别状态，供通过websocket直接发送PCM的云端识别使用
+    会话在说话开始时异步建立(open_task)，识别结果由receive_task持续接收
+    """
+
+    def __init__(self, session_id: str):
+        super().__init__(session_id)
+        self.decoder = opus_codec.acquire_decoder()
+        self.frame = np.zeros(opus_codec.FRAME_SIZE, dtype=np.int16)
+        self.pcm = bytearray()  # 尚未发送的PCM
+        self.open_task = None
+        self.receive_task = None
+        self.websocket = None
+        self.failed = False
+
+    def decode(self, opus_packet: bytes) -> int:
+        """解码一帧追加到待发送的PCM中，返回待发送的字节数"""
+        samples = opus_codec.decode_opus_into(self.decoder, opus_packet, self.frame)
+        self.pcm += self.frame[:samples].tobytes()
+        return len(self.pcm)
+
+    def take_pcm(self) -> bytes:
+        chunk, self.pcm = bytes(self.pcm), bytearray()
+        return chunk
+
+    async def close(self):
+        """归还解码器并关闭会话，可重复调用"""
+        if self.decoder is not None:
+            opus_codec.release_decoder(self.decoder)
+            self.decoder = None
+        if self.receive_task is not None and not self.receive_task.done():
+            self.receive_task.cancel()
+        if self.websocket is None and self.open_task is not None:
+            if not self.open_task.done():
+                self.open_task.cancel()
+                return
+            if not self.open_task.cancelled() and self.open_task.exception() is None:
+                self.websocket = self.open_task.result()
+        if self.websocket is not None:
+            await self.websocket.close()
+
 
 class ASRProviderBase(ABC):
-    @abstractmethod
+    # 由initialize_modules按配置挂上，见core.utils.util.attach_resilience
+    breaker = None
+    fallback = None
+    # 实现了transcribe的本地模型设为True，才能在ASR进程池中运行
+    supports_transcribe = False
+
+    def __init__(self, config: dict):
+        # 开启后说话过程中就开始识别，说完后只需等待最后一段的识别结果
+        self.streaming = bool(config.get("streaming", False))
+        # 分段识别：已缓存的音频超过该时长后，遇到停顿就提交识别
+        self.stream_min_chunk_ms = int(config.get("stream_min_chunk_ms", 2000))
+        self.stream_pause_ms = int(config.get("stream_pause_ms", 240))
+        # 后台关闭中的流式会话，保留任务引用直到关闭完成
+        self._closing_tasks = set()
+
     def save_audio_to_file(self, opus_data: List[bytes], session_id: str) -> str:
         """解码Opus数据并保存为WAV文件"""
-        pass
+        return self.save_pcm_to_file(opus_codec.decode_packets(opus_data), session_id)
 
     @abstractmethod
     async def speech_to_text(self, opus_data: List[bytes], session_id: str) -> Tuple[Optional[str], Optional[str]]:
         """将语音数据转换为文本"""
         pass
+
+    async def speech_to_text_guarded(self, opus_data: List[bytes], session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        带熔断和备用ASR的speech_to_text，对话流程中应使用该方法
+        识别结果为None或抛出异常时计为失败，失败时改用备用ASR，都失败时返回空文本
+        """
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            if self.fallback is not None:
+                logger.bind(tag=TAG).warning(f"{breaker.name} 已熔断，使用备用ASR")
+                return await self.fallback.speech_to_text_guarded(opus_data, session_id)
+            logger.bind(tag=TAG).warning(f"{breaker.name} 已熔断，跳过识别")
+            return "", None
+
+        start_time = time.monotonic()
+        try:
+            text, file_path = await self.speech_to_text(opus_data, session_id)
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"语音识别失败: {e}")
+            text, file_path = None, None
+        if breaker is not None:
+            breaker.record(text is not None, time.monotonic() - start_time)
+        if text is not None:
+            return text, file_path
+        if self.fallback is not None:
+            logger.bind(tag=TAG).warning("语音识别失败，使用备用ASR")
+            return await self.fallback.speech_to_text_guarded(opus_data, session_id)
+        return "", None
+
+    async def close(self):
+        """服务关闭或私有配置的连接断开时释放provider持有的资源，如共用的HTTP客户端"""
+        if self.fallback is not None:
+            await self.fallback.close()
+
+    def stream_available(self) -> bool:
+        """熔断打开时不再开始新的流式识别，改为说完后整句识别，由speech_to_text_guarded处理"""
+        return self.breaker is None or self.breaker.available()
+
+    def transcribe(self, samples: np.ndarray) -> str:
+        """
+        同步识别一段16kHz单声道float32音频
+        实现该方法的子类需同时将supports_transcribe设为True
+        """
+        raise NotImplementedError(f"{type(self).__name__} 不支持transcribe")
+
+    def save_pcm_to_file(self, pcm: np.ndarray, session_id: str) -> str:
+        """将已解码的16kHz单声道int16 PCM保存为WAV文件，用于调试"""
+        file_name = f"asr_{session_id}_{uuid.uuid4()}.wav"
+        file_path = os.path.join(self.output_dir, file_name)
+        with wave.open(file_path, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)  # 2 bytes = 16-bit
+            wf.setframerate(16000)
+            wf.writeframes(pcm.tobytes())
+        return file_path
+
+    def start_stream(self, session_id: str) -> ASRStream:
+        """开始一次流式识别"""
+        return ASRStream(session_id)
+
+    async def feed(self, stream: ASRStream, opus_packet: bytes, is_voice: bool = True):
+        """
+        送入一帧音频，is_voice为VAD对该帧的判断
+        离线模型的默认实现：缓存足够长的音频后，在说话的停顿处切出一段提交识别
+        """
+        stream.opus_data.append(opus_packet)
+        if is_voice:
+            stream.voice_frames += 1
+            stream.pause_frames = 0
+            return
+        stream.pause_frames += 1
+        if (
+            len(stream.opus_data) * FRAME_DURATION_MS >= self.stream_min_chunk_ms
+            and stream.pause_frames * FRAME_DURATION_MS >= self.stream_pause_ms
+            and stream.voice_frames > 0
+        ):
+            self._submit_chunk(stream)
+
+    async def finish(self, stream: ASRStream) -> Tuple[Optional[str], Optional[str]]:
+        """说话结束，返回整句的识别结果，上一段之后没有新的音频时不再发起识别"""
+        if stream.opus_data and (stream.voice_frames > 0 or not stream.tasks):
+            self._submit_chunk(stream)
+        results = await asyncio.gather(*stream.tasks, return_exceptions=True)
+        stream.tasks = []
+        texts = []
+        file_path = None
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.bind(tag=TAG).error(f"分段识别失败: {result}")
+                continue
+            text, file_path = result
+            if text:
+                texts.append(text)
+        return join_texts(texts), file_path
+
+    def partial_text(self, stream: ASRStream) -> str:
+        """流式识别目前的中间结果，不支持时返回空字符串"""
+        return ""
+
+    def cancel(self, stream: ASRStream):
+        """放弃本次流式识别"""
+        for task in stream.tasks:
+            if not task.done():
+                task.cancel()
+        stream.tasks = []
+        stream.opus_data = []
+
+    def _close_in_background(self, stream: PCMStream):
+        """在同步的cancel中关闭流式会话"""
+        task = asyncio.create_task(stream.close())
+        self._closing_tasks.add(task)
+        task.add_done_callback(self._on_stream_closed)
+
+    def _on_stream_closed(self, task: asyncio.Task):
+        self._closing_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.bind(tag=TAG).warning(f"关闭流式识别会话失败: {task.exception()}")
+
+    def _submit_chunk(self, stream: ASRStream):
+        chunk = stream.opus_data
+        stream.opus_data = []
+        stream.voice_frames = 0
+        stream.pause_frames = 0
+        # 分段识别同样经过熔断器，熔断时改用备用ASR
+        stream.tasks.append(
+            asyncio.create_task(
+                self.speech_to_text_guarded(chunk, stream.session_id)
+            )
+        )
+
+
+def join_texts(texts: List[str]) -> str:
+    """拼接分段识别的文本，中文直接相连，西文之间补空格"""
+    result = ""
+    for text in texts:
+        text = text.strip()
+        if not text:
+            continue
+        if result and result[-1].isascii() and text[0].isascii():
+            result += " "
+        result += text
+    return result
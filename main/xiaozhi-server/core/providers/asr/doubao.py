@@ -7,9 +7,12 @@ import uuid
 import websockets
 import json
 import gzip
+import asyncio
 
 import opuslib_next
-from core.providers.asr.base import ASRProviderBase
+from websockets.protocol import State
+from core.providers.asr.base import ASRProviderBase, PCMStream
+from core.utils import opus_codec
 
 from config.logger import setup_logging
 
@@ -83,44 +86,77 @@ def parse_response(res):
     return result
 
 
+class DoubaoStream(PCMStream):
+    """一次流式识别：说话开始时建立会话，音频边收边以原始PCM发送"""
+
+    def __init__(self, session_id: str):
+        super().__init__(session_id)
+        self.text = ""
+
+
+class DoubaoSessionPool:
+    """
+    预先建立好的识别会话
+    连接和首包在说话之前完成，说话开始时直接取用；空闲过久的会话会被服务端断开，取用时丢弃
+    """
+
+    def __init__(self, open_session, size=0, max_idle=10.0):
+        self.open_session = open_session
+        self.size = size
+        self.max_idle = max_idle
+        self._idle = []
+        self._fill_task = None
+
+    async def acquire(self):
+        while self._idle:
+            websocket, opened_at = self._idle.pop()
+            if time.time() - opened_at < self.max_idle and websocket.state is State.OPEN:
+                self._refill()
+                return websocket
+            await websocket.close()
+        self._refill()
+        return await self.open_session()
+
+    def _refill(self):
+        if self.size > 0 and self._fill_task is None:
+            self._fill_task = asyncio.create_task(self._fill())
+
+    async def _fill(self):
+        try:
+            while len(self._idle) < self.size:
+                websocket = await self.open_session()
+                self._idle.append((websocket, time.time()))
+        except Exception as e:
+            logger.bind(tag=TAG).warning(f"预建ASR会话失败: {e}")
+        finally:
+            self._fill_task = None
+
+
 class ASRProvider(ASRProviderBase):
     def __init__(self, config: dict, delete_audio_file: bool):
+        super().__init__(config)
         self.appid = config.get("appid")
         self.cluster = config.get("cluster")
         self.access_token = config.get("access_token")
         self.output_dir = config.get("output_dir")
 
         self.host = "openspeech.bytedance.com"
-        self.ws_url = f"wss://{self.host}/api/v2/asr"
+        self.ws_url = config.get("ws_url", f"wss://{self.host}/api/v2/asr")
         self.success_code = 1000
         self.seg_duration = 15000
 
+        # 流式识别：每包发送的音频时长，16kHz 16bit单声道每毫秒32字节
+        self.stream_chunk_bytes = int(config.get("stream_chunk_ms", 200)) * 32
+        self.stream_timeout = float(config.get("stream_timeout", 10))
+        self.session_pool = DoubaoSessionPool(
+            self._open_session,
+            size=int(config.get("prewarm_sessions", 0)),
+            max_idle=float(config.get("prewarm_max_idle_s", 10)),
+        )
+
         # 确保输出目录存在
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def save_audio_to_file(self, opus_data: List[bytes], session_id: str) -> str:
-        """将Opus音频数据解码并保存为WAV文件"""
-        file_name = f"asr_{session_id}_{uuid.uuid4()}.wav"
-        file_path = os.path.join(self.output_dir, file_name)
-
-        decoder = opuslib_next.Decoder(16000, 1)  # 16kHz, 单声道
-        pcm_data = []
-
-        for opus_packet in opus_data:
-            try:
-                pcm_frame = decoder.decode(opus_packet, 960)  # 960 samples = 60ms
-                pcm_data.append(pcm_frame)
-            except opuslib_next.OpusError as e:
-                logger.bind(tag=TAG).error(f"Opus解码错误: {e}", exc_info=True)
-
-        with wave.open(file_path, "wb") as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)  # 2 bytes = 16-bit
-            wf.setframerate(16000)
-            wf.writeframes(b"".join(pcm_data))
-
-        return file_path
-
     @staticmethod
     def _generate_header(message_type=CLIENT_FULL_REQUEST, message_type_specific_flags=NO_SEQUENCE) -> bytearray:
         """Generate protocol header."""
@@ -132,7 +168,7 @@ class ASRProvider(ASRProviderBase):
         header.append(0x00)  # reserved
         return header
 
-    def _construct_request(self, reqid) -> dict:
+    def _construct_request(self, reqid, audio_format="wav") -> dict:
         """Construct the request payload."""
         return {
             "app": {
@@ -149,7 +185,7 @@ class ASRProvider(ASRProviderBase):
                 "sequence": 1
             },
             "audio": {
-                "format": "wav",
+                "format": audio_format,
                 "rate": 16000,
                 "language": "zh-CN",
                 "bits": 16,
@@ -158,75 +194,137 @@ class ASRProvider(ASRProviderBase):
             },
         }
 
-    async def _send_request(self, audio_data: List[bytes], segment_size: int) -> Optional[str]:
-        """Send request to Volcano ASR service."""
+    def _build_full_client_request(self, audio_format="wav") -> bytearray:
+        """构造携带识别参数的首包"""
+        request_params = self._construct_request(str(uuid.uuid4()), audio_format)
+        payload_bytes = gzip.compress(str.encode(json.dumps(request_params)))
+        full_client_request = self._generate_header()
+        full_client_request.extend((len(payload_bytes)).to_bytes(4, 'big'))  # payload size(4 bytes)
+        full_client_request.extend(payload_bytes)  # payload
+        return full_client_request
+
+    def _build_audio_request(self, chunk: bytes, last: bool) -> bytearray:
+        """构造音频包，最后一包使用负序号标记"""
+        audio_only_request = self._generate_header(
+            message_type=CLIENT_AUDIO_ONLY_REQUEST,
+            message_type_specific_flags=NEG_SEQUENCE if last else NO_SEQUENCE,
+        )
+        payload_bytes = gzip.compress(chunk)
+        audio_only_request.extend((len(payload_bytes)).to_bytes(4, 'big'))  # payload size(4 bytes)
+        audio_only_request.extend(payload_bytes)  # payload
+        return audio_only_request
+
+    async def _send_request(self, audio_data: List[bytes], segment_size: int) -> str:
+        """
+        Send request to Volcano ASR service.
+        连接失败、超时和服务端错误码直接抛出，由speech_to_text_guarded计为失败；识别为空时返回空文本
+        """
+        auth_header = {'Authorization': 'Bearer; {}'.format(self.access_token)}
+        async with websockets.connect(self.ws_url, additional_headers=auth_header) as websocket:
+            # Send header and metadata
+            await websocket.send(self._build_full_client_request())
+            res = await websocket.recv()
+            result = parse_response(res)
+            if 'payload_msg' in result and result['payload_msg']['code'] != self.success_code:
+                raise RuntimeError(f"ASR error: {result}")
+
+            for chunk, last in self.slice_data(audio_data, segment_size):
+                # Send audio data
+                await websocket.send(self._build_audio_request(chunk, last))
+
+            # Receive response
+            response = await websocket.recv()
+            result = parse_response(response)
+
+            if 'payload_msg' in result and result['payload_msg']['code'] == self.success_code:
+                if len(result['payload_msg']['result']) > 0:
+                    return result['payload_msg']['result'][0]["text"]
+                return ""
+            raise RuntimeError(f"ASR error: {result}")
+
+    async def _open_session(self):
+        """建立连接并发送原始PCM格式的首包，返回可以直接发送音频的连接"""
+        auth_header = {'Authorization': 'Bearer; {}'.format(self.access_token)}
+        websocket = await websockets.connect(self.ws_url, additional_headers=auth_header)
         try:
-            auth_header = {'Authorization': 'Bearer; {}'.format(self.access_token)}
-            async with websockets.connect(self.ws_url, additional_headers=auth_header) as websocket:
-                # Prepare request data
-                request_params = self._construct_request(str(uuid.uuid4()))
-                print(request_params)
-                payload_bytes = str.encode(json.dumps(request_params))
-                payload_bytes = gzip.compress(payload_bytes)
-                full_client_request = self._generate_header()
-                full_client_request.extend((len(payload_bytes)).to_bytes(4, 'big'))  # payload size(4 bytes)
-                full_client_request.extend(payload_bytes)  # payload
-
-                # Send header and metadata
-                # full_client_request
-                await websocket.send(full_client_request)
-                res = await websocket.recv()
-                result = parse_response(res)
-                if 'payload_msg' in result and result['payload_msg']['code'] != self.success_code:
-                    logger.bind(tag=TAG).error(f"ASR error: {result}")
-                    return None
-
-                for seq, (chunk, last) in enumerate(self.slice_data(audio_data, segment_size), 1):
-                    if last:
-                        audio_only_request = self._generate_header(
-                            message_type=CLIENT_AUDIO_ONLY_REQUEST,
-                            message_type_specific_flags=NEG_SEQUENCE
-                        )
-                    else:
-                        audio_only_request = self._generate_header(
-                            message_type=CLIENT_AUDIO_ONLY_REQUEST
-                        )
-                    payload_bytes = gzip.compress(chunk)
-                    audio_only_request.extend((len(payload_bytes)).to_bytes(4, 'big'))  # payload size(4 bytes)
-                    audio_only_request.extend(payload_bytes)  # payload
-                    # Send audio data
-                    await websocket.send(audio_only_request)
-
-                # Receive response
-                response = await websocket.recv()
-                result = parse_response(response)
-
-                if 'payload_msg' in result and result['payload_msg']['code'] == self.success_code:
-                    if len(result['payload_msg']['result']) > 0:
-                        return result['payload_msg']['result'][0]["text"]
-                    return None
-                else:
-                    logger.bind(tag=TAG).error(f"ASR error: {result}")
-                    return None
-
+            await websocket.send(self._build_full_client_request("raw"))
+            result = parse_response(await websocket.recv())
+            if 'payload_msg' in result and result['payload_msg']['code'] != self.success_code:
+                raise RuntimeError(f"ASR error: {result}")
+        except BaseException:
+            await websocket.close()
+            raise
+        return websocket
+
+    def start_stream(self, session_id: str) -> DoubaoStream:
+        stream = DoubaoStream(session_id)
+        stream.open_task = asyncio.create_task(self.session_pool.acquire())
+        return stream
+
+    async def feed(self, stream: DoubaoStream, opus_packet: bytes, is_voice: bool = True):
+        if not opus_packet or stream.decoder is None:
+            return
+        # 保留原始音频，会话失败时退回整句识别
+        stream.opus_data.append(opus_packet)
+        if stream.failed:
+            return
+        try:
+            pending_bytes = stream.decode(opus_packet)
+        except opuslib_next.OpusError as e:
+            logger.bind(tag=TAG).error(f"Opus解码错误: {e}")
+            return
+        if pending_bytes >= self.stream_chunk_bytes:
+            await self._send_stream_audio(stream, last=False)
+
+    async def finish(self, stream: DoubaoStream) -> Tuple[Optional[str], Optional[str]]:
+        try:
+            if not stream.failed:
+                start_time = time.time()
+                await self._send_stream_audio(stream, last=True)
+            if not stream.failed:
+                # 负序号的尾包发出后，服务端返回的最后一个结果即为整句结果
+                await asyncio.wait_for(stream.receive_task, self.stream_timeout)
+                logger.bind(tag=TAG).debug(
+                    f"流式识别收尾耗时: {time.time() - start_time:.3f}s | 结果: {stream.text}"
+                )
+                return stream.text, None
         except Exception as e:
-            logger.bind(tag=TAG).error(f"ASR request failed: {e}", exc_info=True)
-            return None
-
-    @staticmethod
-    def decode_opus(opus_data: List[bytes], session_id: str) -> List[bytes]:
+            logger.bind(tag=TAG).error(f"流式识别失败，改为整句识别: {e}")
+        finally:
+            await stream.close()
+        return await self.speech_to_text_guarded(stream.opus_data, stream.session_id)
 
-        decoder = opuslib_next.Decoder(16000, 1)  # 16kHz, 单声道
-        pcm_data = []
+    def partial_text(self, stream: DoubaoStream) -> str:
+        return stream.text
 
-        for opus_packet in opus_data:
-            try:
-                pcm_frame = decoder.decode(opus_packet, 960)  # 960 samples = 60ms
-                pcm_data.append(pcm_frame)
-            except opuslib_next.OpusError as e:
-                logger.bind(tag=TAG).error(f"Opus解码错误: {e}", exc_info=True)
+    def cancel(self, stream: DoubaoStream):
+        stream.failed = True
+        self._close_in_background(stream)
 
-        return pcm_data
+    async def _send_stream_audio(self, stream: DoubaoStream, last: bool):
+        try:
+            if stream.websocket is None:
+                stream.websocket = await stream.open_task
+                stream.receive_task = asyncio.create_task(self._receive_stream(stream))
+            await stream.websocket.send(
+                self._build_audio_request(stream.take_pcm(), last)
+            )
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"流式识别发送失败: {e}")
+            stream.failed = True
+
+    async def _receive_stream(self, stream: DoubaoStream):
+        async for message in stream.websocket:
+            result = parse_response(message)
+            payload = result.get('payload_msg')
+            if not isinstance(payload, dict):
+                continue
+            if payload.get('code') != self.success_code:
+                raise RuntimeError(f"ASR error: {result}")
+            if payload.get('result'):
+                stream.text = payload['result'][0]["text"]
+            if payload.get('sequence', 0) < 0:
+                break
 
     @staticmethod
     def read_wav_info(data: io.BytesIO = None) -> (int, int, int, int, int):
@@ -256,8 +354,7 @@ class ASRProvider(ASRProviderBase):
         """将语音数据转换为文本"""
         try:
             # 合并所有opus数据包
-            pcm_data = self.decode_opus(opus_data, session_id)
-            combined_pcm_data = b''.join(pcm_data)
+            combined_pcm_data = opus_codec.decode_packets(opus_data).tobytes()
 
             wav_buffer = io.BytesIO()
 
@@ -283,4 +380,4 @@ class ASRProvider(ASRProviderBase):
 
         except Exception as e:
             logger.bind(tag=TAG).error(f"语音识别失败: {e}", exc_info=True)
-            return "", None
+            return None, None
@@ -1,13 +1,13 @@
 import time
-import wave
 import os
 import sys
 import io
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from config.logger import setup_logging
 from typing import Optional, Tuple, List
-import uuid
-import opuslib_next
 from core.providers.asr.base import ASRProviderBase
+from core.utils import opus_codec
 
 from funasr import AutoModel
 from funasr.utils.postprocess_utils import rich_transcription_postprocess
@@ -33,8 +33,101 @@ class CaptureOutput:
             logger.bind(tag=TAG).info(self.output.strip())
 
 
+class SenseVoiceBatchScheduler:
+    """
+    跨连接的ASR批处理调度器
+    在max_wait_ms时间窗口内收集各连接说完的整句音频，合并为一次generate调用；
+    推理在独立的单线程中串行执行，不阻塞事件循环。推理进行期间到达的音频会在
+    本批结束后立即组成下一批，不再额外等待
+    """
+
+    def __init__(self, generate_batch, max_batch_size=8, max_wait_ms=30):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="asr-batch"
+        )
+        # 以下状态只在事件循环线程中访问
+        self._pending = []
+        self._timer = None
+        self._running = False
+
+    async def recognize(self, samples) -> str:
+        """提交一句音频，返回识别文本"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((samples, future))
+        # 推理线程忙时不提交，等本批结束后合并提交
+        if not self._running:
+            if len(self._pending) >= self.max_batch_size or self.max_wait <= 0:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # 丢弃已被取消的请求，例如连接已断开
+        self._pending = [item for item in self._pending if not item[1].done()]
+        if self._running or not self._pending:
+            return
+
+        batch = self._pending[: self.max_batch_size]
+        self._pending = self._pending[self.max_batch_size :]
+        self._running = True
+        loop = asyncio.get_running_loop()
+        job = loop.run_in_executor(
+            self._executor, self._run_batch, [item[0] for item in batch]
+        )
+        job.add_done_callback(lambda f: self._resolve(f, batch))
+
+    def _resolve(self, job, batch):
+        self._running = False
+        if job.cancelled():
+            error = asyncio.CancelledError()
+        else:
+            error = job.exception()
+        texts = None if error else job.result()
+        for i, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(texts[i])
+        if self._pending:
+            self._flush()
+
+    def _run_batch(self, samples_list):
+        start_time = time.time()
+        try:
+            texts = self.generate_batch(samples_list)
+        except Exception as e:
+            if len(samples_list) == 1:
+                raise
+            # 批量推理失败时逐句重试，避免一句异常的音频拖累整批
+            logger.bind(tag=TAG).error(f"批量识别失败，改为逐句识别: {e}")
+            texts = []
+            for samples in samples_list:
+                try:
+                    texts.extend(self.generate_batch([samples]))
+                except Exception as e:
+                    logger.bind(tag=TAG).error(f"语音识别失败: {e}")
+                    texts.append("")
+        logger.bind(tag=TAG).debug(
+            f"批量识别{len(samples_list)}句耗时: {time.time() - start_time:.3f}s"
+        )
+        return texts
+
+
 class ASRProvider(ASRProviderBase):
+    supports_transcribe = True
+
     def __init__(self, config: dict, delete_audio_file: bool):
+        super().__init__(config)
         self.model_dir = config.get("model_dir")
         self.output_dir = config.get("output_dir")  # 修正配置键名
         self.delete_audio_file = delete_audio_file
@@ -50,48 +143,34 @@ class ASRProvider(ASRProviderBase):
                 # device="cuda:0",  # 启用GPU加速
             )
 
-    def save_audio_to_file(self, opus_data: List[bytes], session_id: str) -> str:
-        """将Opus音频数据解码并保存为WAV文件"""
-        file_name = f"asr_{session_id}_{uuid.uuid4()}.wav"
-        file_path = os.path.join(self.output_dir, file_name)
-
-        decoder = opuslib_next.Decoder(16000, 1)  # 16kHz, 单声道
-        pcm_data = []
-
-        for opus_packet in opus_data:
-            try:
-                pcm_frame = decoder.decode(opus_packet, 960)  # 960 samples = 60ms
-                pcm_data.append(pcm_frame)
-            except opuslib_next.OpusError as e:
-                logger.bind(tag=TAG).error(f"Opus解码错误: {e}", exc_info=True)
-
-        with wave.open(file_path, "wb") as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)  # 2 bytes = 16-bit
-            wf.setframerate(16000)
-            wf.writeframes(b"".join(pcm_data))
-
-        return file_path
+        # 识别在独立线程中执行；开启batch_enabled后合并多个连接同时说完的句子
+        if config.get("batch_enabled", False):
+            max_batch_size = int(config.get("batch_max_size", 8))
+            max_wait_ms = float(config.get("batch_max_wait_ms", 30))
+        else:
+            max_batch_size, max_wait_ms = 1, 0
+        self.batch_scheduler = SenseVoiceBatchScheduler(
+            self._generate_batch, max_batch_size, max_wait_ms
+        )
 
     async def speech_to_text(self, opus_data: List[bytes], session_id: str) -> Tuple[Optional[str], Optional[str]]:
-        """语音转文本主处理逻辑"""
+        """语音转文本主处理逻辑，音频在内存中解码后直接送入模型"""
         file_path = None
         try:
-            # 保存音频文件
             start_time = time.time()
-            file_path = self.save_audio_to_file(opus_data, session_id)
-            logger.bind(tag=TAG).debug(f"音频文件保存耗时: {time.time() - start_time:.3f}s | 路径: {file_path}")
+            pcm = opus_codec.decode_packets(opus_data)
+            samples = opus_codec.pcm_to_float32(pcm)
+            # 仅在保留音频时落盘，便于调试
+            if not self.delete_audio_file:
+                file_path = self.save_pcm_to_file(pcm, session_id)
+            logger.bind(tag=TAG).debug(f"音频解码耗时: {time.time() - start_time:.3f}s | 路径: {file_path}")
+
+            if samples.size == 0:
+                return "", file_path
 
             # 语音识别
             start_time = time.time()
-            result = self.model.generate(
-                input=file_path,
-                cache={},
-                language="auto",
-                use_itn=True,
-                batch_size_s=60,
-            )
-            text = rich_transcription_postprocess(result[0]["text"])
+            text = await self.batch_scheduler.recognize(samples)
             logger.bind(tag=TAG).debug(f"语音识别耗时: {time.time() - start_time:.3f}s | 结果: {text}")
 
             return text, file_path
@@ -100,11 +179,16 @@ class ASRProvider(ASRProviderBase):
             logger.bind(tag=TAG).error(f"语音识别失败: {e}", exc_info=True)
             return "", None
 
-        finally:
-            # 文件清理逻辑
-            if self.delete_audio_file and file_path and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    logger.bind(tag=TAG).debug(f"已删除临时音频文件: {file_path}")
-                except Exception as e:
-                    logger.bind(tag=TAG).error(f"文件删除失败: {file_path} | 错误: {e}")
+    def transcribe(self, samples) -> str:
+        return self._generate_batch([samples])[0]
+
+    def _generate_batch(self, samples_list):
+        """在调度器线程中执行，一次识别多句音频，按顺序返回文本"""
+        result = self.model.generate(
+            input=samples_list,
+            cache={},
+            language="auto",
+            use_itn=True,
+            batch_size=len(samples_list),
+        )
+        return [rich_transcription_postprocess(item["text"]) for item in result]
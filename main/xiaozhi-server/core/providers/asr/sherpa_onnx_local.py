@@ -1,13 +1,11 @@
 import time
-import wave
 import os
 import sys
 import io
 from config.logger import setup_logging
 from typing import Optional, Tuple, List
-import uuid
-import opuslib_next
 from core.providers.asr.base import ASRProviderBase
+from core.utils import opus_codec
 
 import numpy as np
 import sherpa_onnx
@@ -36,7 +34,10 @@ class CaptureOutput:
 
 
 class ASRProvider(ASRProviderBase):
+    supports_transcribe = True
+
     def __init__(self, config: dict, delete_audio_file: bool):
+        super().__init__(config)
         self.model_dir = config.get("model_dir")
         self.output_dir = config.get("output_dir")
         self.delete_audio_file = delete_audio_file
@@ -83,69 +84,27 @@ class ASRProvider(ASRProviderBase):
                 use_itn=True,
             )
 
-    def save_audio_to_file(self, opus_data: List[bytes], session_id: str) -> str:
-        """将Opus音频数据解码并保存为WAV文件"""
-        file_name = f"asr_{session_id}_{uuid.uuid4()}.wav"
-        file_path = os.path.join(self.output_dir, file_name)
-
-        decoder = opuslib_next.Decoder(16000, 1)  # 16kHz, 单声道
-        pcm_data = []
-
-        for opus_packet in opus_data:
-            try:
-                pcm_frame = decoder.decode(opus_packet, 960)  # 960 samples = 60ms
-                pcm_data.append(pcm_frame)
-            except opuslib_next.OpusError as e:
-                logger.bind(tag=TAG).error(f"Opus解码错误: {e}", exc_info=True)
-
-        with wave.open(file_path, "wb") as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)  # 2 bytes = 16-bit
-            wf.setframerate(16000)
-            wf.writeframes(b"".join(pcm_data))
-
-        return file_path
-
-    def read_wave(self, wave_filename: str) -> Tuple[np.ndarray, int]:
-        """
-        Args:
-        wave_filename:
-            Path to a wave file. It should be single channel and each sample should
-            be 16-bit. Its sample rate does not need to be 16kHz.
-        Returns:
-        Return a tuple containing:
-        - A 1-D array of dtype np.float32 containing the samples, which are
-        normalized to the range [-1, 1].
-        - sample rate of the wave file
-        """
-
-        with wave.open(wave_filename) as f:
-            assert f.getnchannels() == 1, f.getnchannels()
-            assert f.getsampwidth() == 2, f.getsampwidth()  # it is in bytes
-            num_samples = f.getnframes()
-            samples = f.readframes(num_samples)
-            samples_int16 = np.frombuffer(samples, dtype=np.int16)
-            samples_float32 = samples_int16.astype(np.float32)
-
-            samples_float32 = samples_float32 / 32768
-            return samples_float32, f.getframerate()
+    def transcribe(self, samples: np.ndarray) -> str:
+        s = self.model.create_stream()
+        s.accept_waveform(16000, samples)
+        self.model.decode_stream(s)
+        return s.result.text
 
     async def speech_to_text(self, opus_data: List[bytes], session_id: str) -> Tuple[Optional[str], Optional[str]]:
-        """语音转文本主处理逻辑"""
+        """语音转文本主处理逻辑，音频在内存中解码后直接送入模型"""
         file_path = None
         try:
-            # 保存音频文件
             start_time = time.time()
-            file_path = self.save_audio_to_file(opus_data, session_id)
-            logger.bind(tag=TAG).debug(f"音频文件保存耗时: {time.time() - start_time:.3f}s | 路径: {file_path}")
+            pcm = opus_codec.decode_packets(opus_data)
+            samples = opus_codec.pcm_to_float32(pcm)
+            # 仅在保留音频时落盘，便于调试
+            if not self.delete_audio_file:
+                file_path = self.save_pcm_to_file(pcm, session_id)
+            logger.bind(tag=TAG).debug(f"音频解码耗时: {time.time() - start_time:.3f}s | 路径: {file_path}")
 
             # 语音识别
             start_time = time.time()
-            s = self.model.create_stream()
-            samples, sample_rate = self.read_wave(file_path)
-            s.accept_waveform(sample_rate, samples)
-            self.model.decode_stream(s)
-            text = s.result.text
+            text = self.transcribe(samples)
             logger.bind(tag=TAG).debug(f"语音识别耗时: {time.time() - start_time:.3f}s | 结果: {text}")
 
             return text, file_path
@@ -153,12 +112,3 @@ class ASRProvider(ASRProviderBase):
         except Exception as e:
             logger.bind(tag=TAG).error(f"语音识别失败: {e}", exc_info=True)
             return "", None
-
-        finally:
-            # 文件清理逻辑
-            if self.delete_audio_file and file_path and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    logger.bind(tag=TAG).debug(f"已删除临时音频文件: {file_path}")
-                except Exception as e:
-                    logger.bind(tag=TAG).error(f"文件删除失败: {file_path} | 错误: {e}")
@@ -0,0 +1,150 @@
+import time
+import os
+import asyncio
+from config.logger import setup_logging
+from typing import Optional, Tuple, List
+import opuslib_next
+from core.providers.asr.base import ASRProviderBase, ASRStream
+from core.utils import opus_codec
+
+import numpy as np
+import sherpa_onnx
+
+TAG = __name__
+logger = setup_logging()
+
+SAMPLE_RATE = 16000
+FRAME_SIZE = 960
+
+
+class SherpaOnlineStream(ASRStream):
+    """sherpa-onnx在线识别流，音频逐帧解码后立即送入识别器"""
+
+    def __init__(self, session_id: str, recognizer_stream):
+        super().__init__(session_id)
+        self.stream = recognizer_stream
+        self.decoder = opus_codec.acquire_decoder()
+        self.pcm = np.zeros(FRAME_SIZE, dtype=np.int16)
+
+
+class ASRProvider(ASRProviderBase):
+    """
+    sherpa-onnx流式(在线)识别，使用streaming zipformer等transducer模型
+    始终以流式方式工作，用户说完时识别基本已经完成
+    """
+
+    supports_transcribe = True
+
+    def __init__(self, config: dict, delete_audio_file: bool):
+        super().__init__(config)
+        self.streaming = True
+        self.model_dir = config.get("model_dir")
+        self.output_dir = config.get("output_dir")
+        self.delete_audio_file = delete_audio_file
+
+        # 确保输出目录存在
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        model_files = {
+            "encoder": config.get("encoder", "encoder-epoch-99-avg-1.int8.onnx"),
+            "decoder": config.get("decoder", "decoder-epoch-99-avg-1.onnx"),
+            "joiner": config.get("joiner", "joiner-epoch-99-avg-1.int8.onnx"),
+            "tokens": config.get("tokens", "tokens.txt"),
+        }
+        for key, file_name in model_files.items():
+            file_path = os.path.join(self.model_dir, file_name)
+            if not os.path.isfile(file_path):
+                raise FileNotFoundError(f"模型文件不存在: {file_path}")
+            model_files[key] = file_path
+
+        self.model = sherpa_onnx.OnlineRecognizer.from_transducer(
+            tokens=model_files["tokens"],
+            encoder=model_files["encoder"],
+            decoder=model_files["decoder"],
+            joiner=model_files["joiner"],
+            num_threads=int(config.get("num_threads", 2)),
+            sample_rate=SAMPLE_RATE,
+            feature_dim=80,
+            decoding_method="greedy_search",
+        )
+        # 说话结束时补一段静音，让模型输出最后几个字
+        self.tail_padding = np.zeros(int(SAMPLE_RATE * 0.5), dtype=np.float32)
+
+    def start_stream(self, session_id: str) -> SherpaOnlineStream:
+        return SherpaOnlineStream(session_id, self.model.create_stream())
+
+    async def feed(self, stream: SherpaOnlineStream, opus_packet: bytes, is_voice: bool = True):
+        if not opus_packet or stream.decoder is None:
+            return
+        if not self.delete_audio_file:
+            stream.opus_data.append(opus_packet)
+        try:
+            samples = opus_codec.decode_opus_into(
+                stream.decoder, opus_packet, stream.pcm, FRAME_SIZE
+            )
+        except opuslib_next.OpusError as e:
+            logger.bind(tag=TAG).error(f"Opus解码错误: {e}")
+            return
+        stream.stream.accept_waveform(
+            SAMPLE_RATE, opus_codec.pcm_to_float32(stream.pcm[:samples])
+        )
+        if self.model.is_ready(stream.stream):
+            # 解码放到线程中执行，避免阻塞事件循环
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._decode_ready, stream.stream
+            )
+
+    async def finish(self, stream: SherpaOnlineStream) -> Tuple[Optional[str], Optional[str]]:
+        start_time = time.time()
+        stream.stream.accept_waveform(SAMPLE_RATE, self.tail_padding)
+        stream.stream.input_finished()
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._decode_ready, stream.stream
+        )
+        text = self.model.get_result(stream.stream)
+        logger.bind(tag=TAG).debug(
+            f"流式识别收尾耗时: {time.time() - start_time:.3f}s | 结果: {text}"
+        )
+
+        self._release(stream)
+
+        file_path = None
+        if stream.opus_data:
+            file_path = self.save_audio_to_file(stream.opus_data, stream.session_id)
+        return text, file_path
+
+    def partial_text(self, stream: SherpaOnlineStream) -> str:
+        return self.model.get_result(stream.stream)
+
+    def cancel(self, stream: SherpaOnlineStream):
+        self._release(stream)
+        stream.opus_data = []
+
+    @staticmethod
+    def _release(stream: SherpaOnlineStream):
+        if stream.decoder is not None:
+            opus_codec.release_decoder(stream.decoder)
+            stream.decoder = None
+
+    def transcribe(self, samples: np.ndarray) -> str:
+        recognizer_stream = self.model.create_stream()
+        recognizer_stream.accept_waveform(SAMPLE_RATE, samples)
+        recognizer_stream.accept_waveform(SAMPLE_RATE, self.tail_padding)
+        recognizer_stream.input_finished()
+        self._decode_ready(recognizer_stream)
+        return self.model.get_result(recognizer_stream)
+
+    def _decode_ready(self, recognizer_stream):
+        while self.model.is_ready(recognizer_stream):
+            self.model.decode_stream(recognizer_stream)
+
+    async def speech_to_text(self, opus_data: List[bytes], session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """非流式调用时，一次性送入整段音频"""
+        try:
+            stream = self.start_stream(session_id)
+            for opus_packet in opus_data:
+                await self.feed(stream, opus_packet)
+            return await self.finish(stream)
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"语音识别失败: {e}", exc_info=True)
+            return "", None
@@ -3,73 +3,79 @@ import hashlib
 import hmac
 import json
 import time
+import uuid
+import random
+import asyncio
+import importlib.util
 from datetime import datetime, timezone
+from urllib.parse import quote
 import os
-import uuid
 from typing import Optional, Tuple, List
-import wave
-import opuslib_next
 
-import requests
-from core.providers.asr.base import ASRProviderBase
+import httpx
+import opuslib_next
+import websockets
+from core.providers.asr.base import ASRProviderBase, PCMStream
+from core.utils import opus_codec
 from config.logger import setup_logging
 
 TAG = __name__
 logger = setup_logging()
 
+
+class TencentStream(PCMStream):
+    """实时语音识别的一次会话，结果按句子序号保存，中间结果会被后续结果覆盖"""
+
+    def __init__(self, session_id: str):
+        super().__init__(session_id)
+        self.sentences = {}
+
+    @property
+    def text(self) -> str:
+        return "".join(self.sentences[index] for index in sorted(self.sentences))
+
+
 class ASRProvider(ASRProviderBase):
     API_URL = "https://asr.tencentcloudapi.com"
     API_VERSION = "2019-06-14"
     FORMAT = "pcm"  # 支持的音频格式：pcm, wav, mp3
+    REALTIME_URL = "wss://asr.cloud.tencent.com/asr/v2/"
 
     def __init__(self, config: dict, delete_audio_file: bool = True):
+        super().__init__(config)
+        self.appid = config.get("appid")
         self.secret_id = config.get("secret_id")
         self.secret_key = config.get("secret_key")
         self.output_dir = config.get("output_dir")
+        self.api_url = config.get("api_url", self.API_URL)
+        self.realtime_url = config.get("ws_url", self.REALTIME_URL)
+        self.engine_model_type = config.get("engine_model_type", "16k_zh")
+        self.timeout = float(config.get("timeout", 10))
+        # 流式识别时每包发送的音频时长，16kHz 16bit单声道每毫秒32字节
+        self.stream_chunk_bytes = int(config.get("stream_chunk_ms", 200)) * 32
+
+        # 所有连接共用一个HTTP客户端，复用连接；安装了h2时启用HTTP/2
+        self._client = None
+        # 签名密钥只与日期有关，按天缓存
+        self._signing_key = None
         
         # 确保输出目录存在
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def save_audio_to_file(self, opus_data: List[bytes], session_id: str) -> str:
-        """将Opus音频数据解码并保存为WAV文件"""
-
-        file_name = f"tencent_asr_{session_id}_{uuid.uuid4()}.wav"
-        file_path = os.path.join(self.output_dir, file_name)
-        
-        decoder = opuslib_next.Decoder(16000, 1)  # 16kHz, 单声道
-        pcm_data = []
-        
-        for opus_packet in opus_data:
-            try:
-                pcm_frame = decoder.decode(opus_packet, 960)  # 960 samples = 60ms
-                pcm_data.append(pcm_frame)
-            except opuslib_next.OpusError as e:
-                logger.bind(tag=TAG).error(f"Opus解码错误: {e}", exc_info=True)
-        
-        with wave.open(file_path, "wb") as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)  # 2 bytes = 16-bit
-            wf.setframerate(16000)
-            wf.writeframes(b"".join(pcm_data))
-        
-        return file_path
-
-    @staticmethod
-    def decode_opus(opus_data: List[bytes]) -> bytes:
-        """将Opus音频数据解码为PCM数据"""
-        import opuslib_next
-        
-        decoder = opuslib_next.Decoder(16000, 1)  # 16kHz, 单声道
-        pcm_data = []
-        
-        for opus_packet in opus_data:
-            try:
-                pcm_frame = decoder.decode(opus_packet, 960)  # 960 samples = 60ms
-                pcm_data.append(pcm_frame)
-            except opuslib_next.OpusError as e:
-                logger.bind(tag=TAG).error(f"Opus解码错误: {e}", exc_info=True)
-        
-        return b"".join(pcm_data)
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=importlib.util.find_spec("h2") is not None,
+                timeout=self.timeout,
+                limits=httpx.Limits(keepalive_expiry=60),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        await super().close()
 
     async def speech_to_text(self, opus_data: List[bytes], session_id: str) -> Tuple[Optional[str], Optional[str]]:
         """将语音数据转换为文本"""
@@ -84,7 +90,7 @@ class ASRProvider(ASRProviderBase):
                 return None, None
 
             # 将Opus音频数据解码为PCM
-            pcm_data = self.decode_opus(opus_data)
+            pcm_data = opus_codec.decode_packets(opus_data).tobytes()
             
             # 将音频数据转换为Base64编码
             base64_audio = base64.b64encode(pcm_data).decode('utf-8')
@@ -97,7 +103,7 @@ class ASRProvider(ASRProviderBase):
 
             # 发送请求
             start_time = time.time()
-            result = self._send_request(request_body, timestamp, authorization)
+            result = await self._send_request(request_body, timestamp, authorization)
             
             if result:
                 logger.bind(tag=TAG).debug(f"腾讯云语音识别耗时: {time.time() - start_time:.3f}s | 结果: {result}")
@@ -113,7 +119,7 @@ class ASRProvider(ASRProviderBase):
         request_map = {
             "ProjectId": 0,
             "SubServiceType": 2,  # 一句话识别
-            "EngSerViceType": "16k_zh",  # 中文普通话通用
+            "EngSerViceType": self.engine_model_type,  # 默认16k_zh，中文普通话通用
             "SourceType": 1,  # 音频数据来源为语音文件
             "VoiceFormat": self.FORMAT,  # 音频格式
             "Data": base64_audio,  # Base64编码的音频数据
@@ -177,9 +183,7 @@ class ASRProvider(ASRProviderBase):
                             f"{hashed_canonical_request}"
 
             # 计算签名密钥
-            secret_date = self._hmac_sha256(f"TC3{self.secret_key}", date)
-            secret_service = self._hmac_sha256(secret_date, service)
-            secret_signing = self._hmac_sha256(secret_service, "tc3_request")
+            secret_signing = self._get_signing_key(date, service)
 
             # 计算签名
             signature = self._bytes_to_hex(self._hmac_sha256(secret_signing, string_to_sign))
@@ -196,7 +200,16 @@ class ASRProvider(ASRProviderBase):
             logger.bind(tag=TAG).error(f"生成认证头失败: {e}", exc_info=True)
             raise RuntimeError(f"生成认证头失败: {e}")
 
-    def _send_request(self, request_body: str, timestamp: str, authorization: str) -> Optional[str]:
+    def _get_signing_key(self, date: str, service: str) -> bytes:
+        """TC3签名密钥由日期逐级派生，同一天内不变"""
+        if self._signing_key is None or self._signing_key[0] != date:
+            secret_date = self._hmac_sha256(f"TC3{self.secret_key}", date)
+            secret_service = self._hmac_sha256(secret_date, service)
+            secret_signing = self._hmac_sha256(secret_service, "tc3_request")
+            self._signing_key = (date, secret_signing)
+        return self._signing_key[1]
+
+    async def _send_request(self, request_body: str, timestamp: str, authorization: str) -> Optional[str]:
         """发送请求到腾讯云API"""
         headers = {
             "Content-Type": "application/json; charset=utf-8",
@@ -209,10 +222,12 @@ class ASRProvider(ASRProviderBase):
         }
 
         try:
-            response = requests.post(self.API_URL, headers=headers, data=request_body)
+            response = await self._get_client().post(
+                self.api_url, headers=headers, content=request_body
+            )
             
-            if not response.ok:
-                raise IOError(f"请求失败: {response.status_code} {response.reason}")
+            if not response.is_success:
+                raise IOError(f"请求失败: {response.status_code} {response.reason_phrase}")
             
             response_json = response.json()
             
@@ -234,6 +249,108 @@ class ASRProvider(ASRProviderBase):
             logger.bind(tag=TAG).error(f"发送请求失败: {e}", exc_info=True)
             return None
 
+    def _build_realtime_url(self) -> str:
+        """实时语音识别的连接地址，签名为对不含协议头的地址做HMAC-SHA1"""
+        now = int(time.time())
+        params = {
+            "secretid": self.secret_id,
+            "timestamp": now,
+            "expired": now + 86400,
+            "nonce": random.randint(1, 9999999999),
+            "engine_model_type": self.engine_model_type,
+            "voice_id": str(uuid.uuid4()),
+            "voice_format": 1,  # pcm
+            "needvad": 1,
+        }
+        query = "&".join(f"{key}={params[key]}" for key in sorted(params))
+        url = f"{self.realtime_url}{self.appid}?{query}"
+        sign_str = url.split("://", 1)[1]
+        signature = base64.b64encode(
+            hmac.new(self.secret_key.encode("utf-8"), sign_str.encode("utf-8"), hashlib.sha1).digest()
+        ).decode("utf-8")
+        return f"{url}&signature={quote(signature, safe='')}"
+
+    async def _open_session(self):
+        """建立实时识别连接，等待服务端握手成功的消息"""
+        websocket = await websockets.connect(self._build_realtime_url())
+        try:
+            response = json.loads(await websocket.recv())
+            if response.get("code") != 0:
+                raise RuntimeError(f"实时识别握手失败: {response}")
+        except BaseException:
+            await websocket.close()
+            raise
+        return websocket
+
+    def start_stream(self, session_id: str) -> TencentStream:
+        stream = TencentStream(session_id)
+        stream.open_task = asyncio.create_task(self._open_session())
+        return stream
+
+    async def feed(self, stream: TencentStream, opus_packet: bytes, is_voice: bool = True):
+        if not opus_packet or stream.decoder is None:
+            return
+        # 保留原始音频，实时识别失败时退回一句话识别
+        stream.opus_data.append(opus_packet)
+        if stream.failed:
+            return
+        try:
+            pending_bytes = stream.decode(opus_packet)
+        except opuslib_next.OpusError as e:
+            logger.bind(tag=TAG).error(f"Opus解码错误: {e}")
+            return
+        if pending_bytes >= self.stream_chunk_bytes:
+            await self._send_stream(stream, stream.take_pcm())
+
+    async def finish(self, stream: TencentStream) -> Tuple[Optional[str], Optional[str]]:
+        try:
+            start_time = time.time()
+            if stream.pcm:
+                await self._send_stream(stream, stream.take_pcm())
+            await self._send_stream(stream, json.dumps({"type": "end"}))
+            if not stream.failed:
+                # 发送结束标记后，服务端返回final=1表示全部结果已返回
+                await asyncio.wait_for(stream.receive_task, self.timeout)
+                logger.bind(tag=TAG).debug(
+                    f"实时识别收尾耗时: {time.time() - start_time:.3f}s | 结果: {stream.text}"
+                )
+                return stream.text, None
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"实时识别失败，改为一句话识别: {e}")
+        finally:
+            await stream.close()
+        return await self.speech_to_text_guarded(stream.opus_data, stream.session_id)
+
+    def partial_text(self, stream: TencentStream) -> str:
+        return stream.text
+
+    def cancel(self, stream: TencentStream):
+        stream.failed = True
+        self._close_in_background(stream)
+
+    async def _send_stream(self, stream: TencentStream, message):
+        if stream.failed:
+            return
+        try:
+            if stream.websocket is None:
+                stream.websocket = await stream.open_task
+                stream.receive_task = asyncio.create_task(self._receive_stream(stream))
+            await stream.websocket.send(message)
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"实时识别发送失败: {e}")
+            stream.failed = True
+
+    async def _receive_stream(self, stream: TencentStream):
+        async for message in stream.websocket:
+            response = json.loads(message)
+            if response.get("code") != 0:
+                raise RuntimeError(f"实时识别错误: {response}")
+            result = response.get("result")
+            if result:
+                stream.sentences[result.get("index", 0)] = result.get("voice_text_str", "")
+            if response.get("final") == 1:
+                break
+
     def _sha256_hex(self, data: str) -> str:
         """计算字符串的SHA256哈希值"""
         digest = hashlib.sha256(data.encode('utf-8')).digest()
@@ -248,4 +365,121 @@ class ASRProvider(ASRProviderBase):
 
     def _bytes_to_hex(self, bytes_data: bytes) -> str:
         """字节数组转十六进制字符串"""
-        return ''.join(f"{b:02x}" for b in bytes_data)
\ No newline at end of file
+        return ''.join(f"{b:02x}" for b in bytes_data)
+
+
+def _benchmark(total=200, concurrency=20, latency_ms=30):
+    """
+    一句话识别对本地假服务的延迟/吞吐对比：python -m core.providers.asr.tencent
+    原实现在async函数中同步调用requests.post，并且每次请求重新派生签名密钥；
+    假服务在独立线程的事件循环中运行，每个请求等待latency_ms后返回
+    """
+    import tempfile
+    import numpy as np
+    import threading
+    import requests
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    return
+                length = 0
+                for line in head.decode().split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                await reader.readexactly(length)
+                await asyncio.sleep(latency_ms / 1000)
+                data = b'{"Response": {"Result": "ok", "RequestId": "1"}}'
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+        finally:
+            writer.close()
+
+    server_loop = asyncio.new_event_loop()
+    server = server_loop.run_until_complete(asyncio.start_server(handle, "127.0.0.1", 0))
+    api_url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/"
+    threading.Thread(target=server_loop.run_forever, daemon=True).start()
+
+    with opus_codec.encoder() as enc:
+        pcm = (np.sin(np.arange(opus_codec.FRAME_SIZE * 17) / 20) * 8000).astype(np.int16)
+        opus_data = [
+            enc.encode(pcm[i : i + opus_codec.FRAME_SIZE].tobytes(), opus_codec.FRAME_SIZE)
+            for i in range(0, len(pcm), opus_codec.FRAME_SIZE)
+        ]
+
+    async def run(provider):
+        session = requests.Session()
+
+        async def legacy():
+            pcm_data = opus_codec.decode_packets(opus_data).tobytes()
+            request_body = provider._build_request_body(base64.b64encode(pcm_data).decode("utf-8"))
+            provider._signing_key = None
+            timestamp, authorization = provider._get_auth_headers(request_body)
+            response = session.post(
+                api_url,
+                headers={
+                    "Content-Type": "application/json; charset=utf-8",
+                    "Authorization": authorization,
+                    "X-TC-Timestamp": timestamp,
+                },
+                data=request_body,
+            )
+            return response.json()["Response"]["Result"]
+
+        async def pooled():
+            text, _ = await provider.speech_to_text(opus_data, "benchmark")
+            return text
+
+        for name, func in (("legacy", legacy), ("httpx", pooled)):
+            latencies = []
+            stalls = []
+
+            async def client():
+                for _ in range(total // concurrency):
+                    start_time = time.perf_counter()
+                    assert await func() == "ok"
+                    latencies.append(time.perf_counter() - start_time)
+
+            async def monitor():
+                # 事件循环被阻塞的时长：定时器实际触发时间比预期晚多少
+                while True:
+                    start_time = time.perf_counter()
+                    await asyncio.sleep(0.01)
+                    stalls.append(time.perf_counter() - start_time - 0.01)
+
+            await func()
+            monitor_task = asyncio.create_task(monitor())
+            await asyncio.sleep(0)
+            start_time = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start_time
+            # 等待被阻塞的定时器触发，记下最后一次阻塞
+            await asyncio.sleep(0.02)
+            monitor_task.cancel()
+            latencies.sort()
+            print(
+                f"{name:<8}{len(latencies) / elapsed:8.1f}次/秒"
+                f"  p50 {latencies[len(latencies) // 2] * 1000:7.1f}ms"
+                f"  p90 {latencies[int(len(latencies) * 0.9)] * 1000:7.1f}ms"
+                f"  事件循环最长阻塞 {max(stalls, default=0) * 1000:7.1f}ms"
+            )
+        session.close()
+        await provider.close()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        provider = ASRProvider(
+            {"secret_id": "id", "secret_key": "key", "output_dir": output_dir, "api_url": api_url}
+        )
+        asyncio.run(run(provider))
+    server_loop.call_soon_threadsafe(server_loop.stop)
+
+
+if __name__ == "__main__":
+    _benchmark()
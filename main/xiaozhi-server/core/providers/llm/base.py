@@ -1,15 +1,117 @@
+import time
+import asyncio
+import threading
 from abc import ABC, abstractmethod
+
+import httpx
 from config.logger import setup_logging
 
 TAG = __name__
 logger = setup_logging()
 
+_END = object()
+
+
+class PromptCacheStats:
+    """服务端提示词缓存的命中情况，只统计返回了用量信息的请求，用于上报"""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, usage):
+        """usage为OpenAI兼容接口返回的用量，缓存命中数兼容prompt_tokens_details和DeepSeek的字段"""
+        if usage is None:
+            return None
+        cached_tokens = 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        if details is not None and getattr(details, "cached_tokens", None):
+            cached_tokens = details.cached_tokens
+        elif getattr(usage, "prompt_cache_hit_tokens", None):
+            cached_tokens = usage.prompt_cache_hit_tokens
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+        return prompt_tokens, cached_tokens
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "hit_rate": (
+                    self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0
+                ),
+            }
+
+
+prompt_cache_stats = PromptCacheStats()
+
+
+def sends_full_dialogue(llm) -> bool:
+    """LLM及其备用LLM是否都发送完整的对话，否则本轮用户消息中不能附带背景信息"""
+    while llm is not None:
+        if not llm.sends_full_dialogue:
+            return False
+        llm = llm.fallback
+    return True
+
+
+def is_error_output(item) -> bool:
+    """各LLM出错时会输出【...异常...】提示而不是抛出异常，按失败处理"""
+    text = item[0] if isinstance(item, tuple) else item
+    return isinstance(text, str) and text.startswith("【") and "异常" in text
+
+
+def has_output(item) -> bool:
+    """有实际内容(文本或工具调用)的输出才算首字，只带角色信息的空chunk不算"""
+    if isinstance(item, tuple):
+        return bool(item[0]) or item[1] is not None
+    return bool(item)
+
+
+async def iterate_in_thread(generator):
+    """在线程池中逐个取出同步生成器的数据，用于还没有原生异步实现的LLM"""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            item = await loop.run_in_executor(None, next, generator, _END)
+            if item is _END:
+                break
+            yield item
+    finally:
+        try:
+            generator.close()
+        except ValueError:
+            # 取消时生成器可能仍在线程中执行，由它自行结束
+            pass
+
+
 class LLMProviderBase(ABC):
+    # 由initialize_modules按配置挂上，见core.utils.util.attach_resilience
+    breaker = None
+    fallback = None
+    # 只把最后一条用户消息作为提问转发的实现(如dify、coze)设为False
+    sends_full_dialogue = True
+
     @abstractmethod
     def response(self, session_id, dialogue):
         """LLM response generator"""
         pass
 
+    async def aresponse(self, session_id, dialogue):
+        """
+        异步流式输出，在事件循环中直接使用
+        默认在线程池中迭代同步的response，支持异步客户端的实现应重写该方法
+        """
+        async for token in iterate_in_thread(self.response(session_id, dialogue)):
+            yield token
+
     def response_no_stream(self, system_prompt, user_prompt):
         try:
             # 构造对话格式
@@ -25,15 +127,125 @@ class LLMProviderBase(ABC):
         except Exception as e:
             logger.bind(tag=TAG).error(f"Error in Ollama response generation: {e}")
             return "【LLM服务响应异常】"
-    
+
+    async def aresponse_no_stream(self, system_prompt, user_prompt):
+        """response_no_stream的异步版本"""
+        try:
+            dialogue = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+            result = ""
+            async for part in self.aresponse_guarded("", dialogue):
+                result += part
+            return result
+
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Error in LLM response generation: {e}")
+            return "【LLM服务响应异常】"
+
     def response_with_functions(self, session_id, dialogue, functions=None):
         """
         Default implementation for function calling (streaming)
         This should be overridden by providers that support function calls
-        
+
         Returns: generator that yields either text tokens or a special function call token
         """
         # For providers that don't support functions, just return regular response
         for token in self.response(session_id, dialogue):
             yield token, None
 
+    async def aresponse_with_functions(self, session_id, dialogue, functions=None):
+        """
+        response_with_functions的异步版本，输出(token, tool_calls)
+        只实现了同步function calling的实现在线程池中迭代，否则使用aresponse
+        """
+        if type(self).response_with_functions is not LLMProviderBase.response_with_functions:
+            async for item in iterate_in_thread(
+                self.response_with_functions(session_id, dialogue, functions)
+            ):
+                yield item
+            return
+        async for token in self.aresponse(session_id, dialogue):
+            yield token, None
+
+    async def aresponse_guarded(self, session_id, dialogue):
+        """带熔断和备用LLM的aresponse，对话流程中应使用该方法"""
+        async for token in self._guarded_stream(
+            lambda llm: llm.aresponse(session_id, list(dialogue)),
+            lambda llm: llm.aresponse_guarded(session_id, dialogue),
+            "【LLM服务异常，请稍后再试】",
+        ):
+            yield token
+
+    async def aresponse_with_functions_guarded(self, session_id, dialogue, functions=None):
+        """带熔断和备用LLM的aresponse_with_functions"""
+        async for item in self._guarded_stream(
+            lambda llm: llm.aresponse_with_functions(session_id, list(dialogue), functions),
+            lambda llm: llm.aresponse_with_functions_guarded(session_id, dialogue, functions),
+            ("【LLM服务异常，请稍后再试】", None),
+        ):
+            yield item
+
+    async def _guarded_stream(self, call, call_fallback, unavailable):
+        """
+        熔断打开时直接改用备用LLM，没有备用时立即返回unavailable；
+        没有输出首字就结束或出错时计为失败，并改用备用LLM，已经开始输出后不再切换
+        """
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            if self.fallback is not None:
+                logger.bind(tag=TAG).warning(f"{breaker.name} 已熔断，使用备用LLM")
+                async for item in call_fallback(self.fallback):
+                    yield item
+            else:
+                yield unavailable
+            return
+
+        start_time = time.monotonic()
+        got_output = False
+        error = None
+        generator = call(self)
+        try:
+            async for item in generator:
+                if not got_output:
+                    if is_error_output(item):
+                        error = item
+                        break
+                    if not has_output(item):
+                        continue
+                    got_output = True
+                    if breaker is not None:
+                        breaker.record(True, time.monotonic() - start_time)
+                yield item
+        except Exception as e:
+            if got_output:
+                raise
+            error = e
+        finally:
+            await generator.aclose()
+        if got_output:
+            return
+
+        if breaker is not None:
+            breaker.record(False, time.monotonic() - start_time)
+        if self.fallback is not None:
+            logger.bind(tag=TAG).warning(f"LLM没有输出({error})，使用备用LLM")
+            async for item in call_fallback(self.fallback):
+                yield item
+        elif isinstance(error, Exception):
+            raise error
+        elif error is not None:
+            yield error
+
+    def get_async_client(self, **kwargs) -> httpx.AsyncClient:
+        """所有连接共用的异步HTTP客户端，首次使用时创建，kwargs只在创建时生效"""
+        client = getattr(self, "_async_client", None)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(60, connect=10),
+                limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100),
+                **kwargs,
+            )
+            self._async_client = client
+        return client
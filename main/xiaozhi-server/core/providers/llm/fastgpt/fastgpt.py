@@ -8,52 +8,64 @@ logger = setup_logging()
 
 
 class LLMProvider(LLMProviderBase):
+    # 只转发最后一条用户消息
+    sends_full_dialogue = False
+
     def __init__(self, config):
         self.api_key = config["api_key"]
         self.base_url = config.get("base_url")
         self.detail = config.get("detail", False)
         self.variables = config.get("variables", {})
 
+    def _build_request(self, session_id, dialogue):
+        # 取最后一条用户消息
+        last_msg = next(m for m in reversed(dialogue) if m["role"] == "user")
+        return {
+            "stream": True,
+            "chatId": session_id,
+            "detail": self.detail,
+            "variables": self.variables,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": last_msg["content"]
+                }
+            ]
+        }
+
+    @staticmethod
+    def _parse_line(data):
+        """解析一行流式数据，返回需要输出的文本；返回False表示流已结束"""
+        if data == '[DONE]':
+            return False
+        data = json.loads(data)
+        if 'choices' in data and len(data['choices']) > 0:
+            delta = data['choices'][0].get('delta', {})
+            if delta and 'content' in delta and delta['content'] is not None:
+                content = delta['content']
+                if '<think>' in content or '</think>' in content:
+                    return None
+                return content
+        return None
+
     def response(self, session_id, dialogue):
         try:
-            # 取最后一条用户消息
-            last_msg = next(m for m in reversed(dialogue) if m["role"] == "user")
-
             # 发起流式请求
             with requests.post(
                     f"{self.base_url}/chat/completions",
                     headers={"Authorization": f"Bearer {self.api_key}"},
-                    json={
-                        "stream": True,
-                        "chatId": session_id,
-                        "detail": self.detail,
-                        "variables": self.variables,
-                        "messages": [
-                            {
-                                "role": "user",
-                                "content": last_msg["content"]
-                            }
-                        ]
-                    },
+                    json=self._build_request(session_id, dialogue),
                     stream=True
             ) as r:
                 for line in r.iter_lines():
                     if line:
                         try:
                             if line.startswith(b'data: '):
-                                if line[6:].decode('utf-8') == '[DONE]':
+                                content = self._parse_line(line[6:].decode('utf-8'))
+                                if content is False:
                                     break
-
-                                data = json.loads(line[6:])
-                                if 'choices' in data and len(data['choices']) > 0:
-                                    delta = data['choices'][0].get('delta', {})
-                                    if delta and 'content' in delta and delta['content'] is not None:
-                                        content = delta['content']
-                                        if '<think>' in content:
-                                            continue
-                                        if '</think>' in content:
-                                            continue
-                                        yield content
+                                if content:
+                                    yield content
 
                         except json.JSONDecodeError as e:
                             continue
@@ -62,4 +74,28 @@ class LLMProvider(LLMProviderBase):
 
         except Exception as e:
             logger.bind(tag=TAG).error(f"Error in response generation: {e}")
-            yield "【服务响应异常】"
\ No newline at end of file
+            yield "【服务响应异常】"
+
+    async def aresponse(self, session_id, dialogue):
+        try:
+            async with self.get_async_client().stream(
+                    "POST",
+                    f"{self.base_url}/chat/completions",
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                    json=self._build_request(session_id, dialogue),
+            ) as r:
+                async for line in r.aiter_lines():
+                    if not line.startswith('data: '):
+                        continue
+                    try:
+                        content = self._parse_line(line[6:])
+                    except Exception:
+                        continue
+                    if content is False:
+                        break
+                    if content:
+                        yield content
+
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Error in response generation: {e}")
+            yield "【服务响应异常】"
@@ -10,6 +10,9 @@ logger = setup_logging()
 
 
 class LLMProvider(LLMProviderBase):
+    # 最后一条消息单独作为本轮提问发送
+    sends_full_dialogue = False
+
     def __init__(self, config):
         """初始化Gemini LLM Provider"""
         self.model_name = config.get("model_name", "gemini-1.5-pro")
@@ -58,16 +61,8 @@ class LLMProvider(LLMProviderBase):
             return
 
         try:
-            # 处理对话历史
-            chat_history = []
-            for msg in dialogue[:-1]:  # 历史对话
-                role = "model" if msg["role"] == "assistant" else "user"
-                content = msg["content"].strip()
-                if content:
-                    chat_history.append({"role": role, "parts": [{"text": content}]})
-
-            # 获取当前消息
-            current_msg = dialogue[-1]["content"]
+            # 处理对话历史，获取当前消息
+            chat_history, current_msg = self._build_history(dialogue)
 
             # 构建请求体
             request_body = {
@@ -134,3 +129,65 @@ class LLMProvider(LLMProviderBase):
             yield f"JSON解码错误：{e}"
         except Exception as e:
             yield f"发生错误：{e}"
+
+    async def aresponse(self, session_id, dialogue):
+        """异步生成Gemini对话响应"""
+        if not self.model:
+            yield "【Gemini服务未正确初始化】"
+            return
+
+        try:
+            chat_history, current_msg = self._build_history(dialogue)
+
+            if self.proxies:
+                url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.model_name}:generateContent?key={self.api_key}"
+                request_body = {
+                    "contents": chat_history
+                    + [{"role": "user", "parts": [{"text": current_msg}]}],
+                    "generationConfig": self.generation_config,
+                }
+                # 走代理时使用非流式接口，与同步实现一致
+                client = self.get_async_client(
+                    proxies={
+                        f"{scheme}://": proxy
+                        for scheme, proxy in self.proxies.items()
+                        if proxy
+                    }
+                )
+                response = await client.post(url, json=request_body)
+                data = response.json()
+                if "candidates" in data and data["candidates"]:
+                    yield data["candidates"][0]["content"]["parts"][0]["text"]
+                else:
+                    yield "未找到候选回复。"
+            else:
+                chat = self.model.start_chat(history=chat_history)
+                response = await chat.send_message_async(
+                    current_msg, stream=True, generation_config=self.generation_config
+                )
+                async for chunk in response:
+                    if hasattr(chunk, "text") and chunk.text:
+                        yield chunk.text
+
+        except Exception as e:
+            error_msg = str(e)
+            logger.bind(tag=TAG).error(f"Gemini响应生成错误: {error_msg}")
+
+            # 针对不同错误返回友好提示
+            if "Rate limit" in error_msg:
+                yield "【Gemini服务请求太频繁,请稍后再试】"
+            elif "Invalid API key" in error_msg:
+                yield "【Gemini API key无效】"
+            else:
+                yield f"【Gemini服务响应异常: {error_msg}】"
+
+    @staticmethod
+    def _build_history(dialogue):
+        """转换为Gemini的对话历史格式，返回(历史对话, 当前消息)"""
+        chat_history = []
+        for msg in dialogue[:-1]:  # 历史对话
+            role = "model" if msg["role"] == "assistant" else "user"
+            content = msg["content"].strip()
+            if content:
+                chat_history.append({"role": role, "parts": [{"text": content}]})
+        return chat_history, dialogue[-1]["content"]
@@ -0,0 +1,262 @@
+import time
+import asyncio
+import threading
+
+from config.logger import setup_logging
+from core.providers.llm.base import LLMProviderBase, is_error_output, has_output
+
+TAG = __name__
+logger = setup_logging()
+
+_END = object()
+# 首字延迟直方图的分桶上界(毫秒)，最后一个桶收集超时和失败
+LATENCY_BUCKETS_MS = (50, 100, 200, 300, 500, 800, 1200, 2000, 3000, 5000, 8000, float("inf"))
+
+
+class LatencyHistogram:
+    """单个LLM的首字延迟直方图，失败按最大延迟计入"""
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.samples = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms):
+        for i, upper in enumerate(LATENCY_BUCKETS_MS):
+            if latency_ms <= upper:
+                break
+        with self._lock:
+            self.counts[i] += 1
+            self.samples += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.counts[-1] += 1
+            self.samples += 1
+            self.failures += 1
+
+    def percentile(self, p):
+        """返回第p百分位所在分桶的上界"""
+        with self._lock:
+            if self.samples == 0:
+                return None
+            target = self.samples * p / 100
+            seen = 0
+            for count, upper in zip(self.counts, LATENCY_BUCKETS_MS):
+                seen += count
+                if seen >= target:
+                    return upper
+        return LATENCY_BUCKETS_MS[-1]
+
+    def metrics(self) -> dict:
+        return {
+            "samples": self.samples,
+            "failures": self.failures,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+        }
+
+
+class LLMProvider(LLMProviderBase):
+    """
+    对冲请求：先请求排在第一位的LLM，超过hedge_delay_ms还没有输出首字时再请求下一个，
+    使用最先输出首字的结果，取消其它请求；某个LLM出错时立即请求下一个。
+    每个LLM的首字延迟记录在直方图中，开启auto_order后按p90延迟从低到高排序。
+    llm_configs为本次初始化使用的整份LLM配置，providers按名称从中引用
+    """
+
+    def __init__(self, config, llm_configs):
+        self.hedge_delay = float(config.get("hedge_delay_ms", 800)) / 1000
+        self.auto_order = config.get("auto_order", True)
+        # 每个LLM至少有这么多次记录后才参与自动排序
+        self.min_samples = int(config.get("min_samples", 5))
+        self.order_percentile = float(config.get("order_percentile", 90))
+
+        from core.utils import llm as llm_utils
+
+        self.providers = []
+        for name in config.get("providers", []):
+            llm_config = llm_configs.get(name)
+            if llm_config is None:
+                raise ValueError(f"对冲LLM引用的配置不存在: {name}")
+            llm_type = llm_config.get("type", name)
+            if llm_type == "hedged":
+                raise ValueError(f"对冲LLM不能引用另一个对冲LLM: {name}")
+            self.providers.append((name, llm_utils.create_instance(llm_type, llm_config)))
+        if not self.providers:
+            raise ValueError("对冲LLM至少需要配置一个providers")
+        self.sends_full_dialogue = all(
+            provider.sends_full_dialogue for _, provider in self.providers
+        )
+        self.histograms = {name: LatencyHistogram() for name, _ in self.providers}
+        # 没有输出就被取消的请求只知道首字延迟的下限，单独记录，不混入实际延迟
+        self.censored = {name: LatencyHistogram() for name, _ in self.providers}
+
+    def get_order(self):
+        """本次请求的先后顺序，样本不足时保持配置顺序"""
+        if not self.auto_order or any(
+            self.histograms[name].samples + self.censored[name].samples < self.min_samples
+            for name, _ in self.providers
+        ):
+            return list(self.providers)
+        # sorted是稳定排序，延迟相同时保持配置顺序
+        return sorted(self.providers, key=lambda p: self._order_latency(p[0]))
+
+    def _order_latency(self, name):
+        """
+        排序用的延迟估计：实际首字延迟的分位数
+        被取消的请求只提供下限，只能把估计往上抬；从未输出过首字的LLM排在有实际延迟的LLM之后
+        """
+        latency = self.histograms[name].percentile(self.order_percentile)
+        lower_bound = self.censored[name].percentile(self.order_percentile)
+        if latency is None:
+            return (1, lower_bound)
+        return (0, max(latency, lower_bound or 0))
+
+    def get_metrics(self) -> dict:
+        return {
+            name: {**histogram.metrics(), "censored": self.censored[name].samples}
+            for name, histogram in self.histograms.items()
+        }
+
+    def response(self, session_id, dialogue):
+        """同步接口不做对冲，按顺序请求，没有输出时改用下一个"""
+        for name, provider in self.get_order():
+            got_output = False
+            for token in provider.response(session_id, list(dialogue)):
+                if not got_output and is_error_output(token):
+                    break
+                got_output = True
+                yield token
+            if got_output:
+                return
+            logger.bind(tag=TAG).warning(f"LLM {name} 没有输出，改用下一个")
+
+    def response_with_functions(self, session_id, dialogue, functions=None):
+        for name, provider in self.get_order():
+            got_output = False
+            for item in provider.response_with_functions(
+                session_id, list(dialogue), functions
+            ):
+                if not got_output and is_error_output(item):
+                    break
+                got_output = True
+                yield item
+            if got_output:
+                return
+            logger.bind(tag=TAG).warning(f"LLM {name} 没有输出，改用下一个")
+
+    async def aresponse(self, session_id, dialogue):
+        async for token in self._race(
+            lambda provider: provider.aresponse(session_id, list(dialogue))
+        ):
+            yield token
+
+    async def aresponse_with_functions(self, session_id, dialogue, functions=None):
+        async for item in self._race(
+            lambda provider: provider.aresponse_with_functions(
+                session_id, list(dialogue), functions
+            )
+        ):
+            yield item
+
+    async def _race(self, call):
+        order = self.get_order()
+        queue = asyncio.Queue()
+        tasks = []
+        # 每个请求的发起时间，直方图记录的是各LLM自身的首字延迟
+        launch_times = []
+        start_time = time.monotonic()
+
+        def launch():
+            index = len(tasks)
+            name, provider = order[index]
+            launch_times.append(time.monotonic())
+            tasks.append(
+                asyncio.create_task(self._pump(index, call(provider), queue))
+            )
+            if index > 0:
+                logger.bind(tag=TAG).debug(f"对冲请求LLM: {name}")
+
+        winner = None
+        first_item = None
+        finished = set()
+        try:
+            launch()
+            while winner is None:
+                # 还有备用LLM时，从上一个请求发起算起最多等待hedge_delay
+                timeout = None
+                if len(tasks) < len(order):
+                    timeout = max(0, launch_times[-1] + self.hedge_delay - time.monotonic())
+                try:
+                    index, item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    launch()
+                    continue
+                if item is _END or isinstance(item, Exception) or is_error_output(item):
+                    if index in finished:
+                        continue
+                    finished.add(index)
+                    self.histograms[order[index][0]].record_failure()
+                    logger.bind(tag=TAG).warning(
+                        f"LLM {order[index][0]} 没有输出: {item if item is not _END else '空'}"
+                    )
+                    if len(tasks) < len(order):
+                        launch()
+                    elif len(finished) == len(tasks):
+                        # 全部失败，输出最后一个LLM的错误提示
+                        if is_error_output(item):
+                            yield item
+                        return
+                    continue
+                if not has_output(item):
+                    continue
+                winner = index
+                first_item = item
+
+            now = time.monotonic()
+            self.histograms[order[winner][0]].record((now - launch_times[winner]) * 1000)
+            if len(tasks) > 1:
+                logger.bind(tag=TAG).info(
+                    f"对冲请求由 {order[winner][0]} 胜出，首字延迟: {(now - start_time) * 1000:.0f}ms"
+                )
+            self._cancel_losers(tasks, winner, finished, order, launch_times)
+
+            yield first_item
+            while True:
+                index, item = await queue.get()
+                if index != winner:
+                    continue
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _cancel_losers(self, tasks, winner, finished, order, launch_times):
+        """取消其它请求；没有输出就被取消的请求，已等待的时间只是其首字延迟的下限，单独记录"""
+        now = time.monotonic()
+        for index, task in enumerate(tasks):
+            if index == winner or index in finished:
+                continue
+            task.cancel()
+            self.censored[order[index][0]].record((now - launch_times[index]) * 1000)
+
+    @staticmethod
+    async def _pump(index, generator, queue):
+        """把一个LLM的输出转发到共同的队列，以_END结束，出错时转发异常"""
+        try:
+            async for item in generator:
+                queue.put_nowait((index, item))
+            queue.put_nowait((index, _END))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            queue.put_nowait((index, e))
+        finally:
+            await generator.aclose()
+
@@ -1,5 +1,5 @@
 from config.logger import setup_logging
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import json
 from core.providers.llm.base import LLMProviderBase
 
@@ -20,6 +20,7 @@ class LLMProvider(LLMProviderBase):
             base_url=self.base_url,
             api_key="ollama"  # Ollama doesn't need an API key but OpenAI client requires one
         )
+        self.async_client = AsyncOpenAI(base_url=self.base_url, api_key="ollama")
 
     def response(self, session_id, dialogue):
         try:
@@ -64,3 +65,53 @@ class LLMProvider(LLMProviderBase):
         except Exception as e:
             logger.bind(tag=TAG).error(f"Error in Ollama function call: {e}")
             yield f"【Ollama服务响应异常: {str(e)}】", None
+
+    async def aresponse(self, session_id, dialogue):
+        try:
+            responses = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=dialogue,
+                stream=True
+            )
+            is_active = True
+            # 提前退出(被打断、对冲落败)时也要关闭HTTP响应
+            async with responses:
+                async for chunk in responses:
+                    try:
+                        delta = chunk.choices[0].delta if getattr(chunk, 'choices', None) else None
+                        content = delta.content if hasattr(delta, 'content') else ''
+                        if content:
+                            if '<think>' in content:
+                                is_active = False
+                                content = content.split('<think>')[0]
+                            if '</think>' in content:
+                                is_active = True
+                                content = content.split('</think>')[-1]
+                            if is_active:
+                                yield content
+                    except Exception as e:
+                        logger.bind(tag=TAG).error(f"Error processing chunk: {e}")
+
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Error in Ollama response generation: {e}")
+            yield "【Ollama服务响应异常】"
+
+    async def aresponse_with_functions(self, session_id, dialogue, functions=None):
+        try:
+            stream = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=dialogue,
+                stream=True,
+                tools=functions,
+            )
+
+            # 提前退出(被打断、对冲落败)时也要关闭HTTP响应
+            async with stream:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    yield chunk.choices[0].delta.content, chunk.choices[0].delta.tool_calls
+
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Error in Ollama function call: {e}")
+            yield f"【Ollama服务响应异常: {str(e)}】", None
@@ -1,7 +1,7 @@
 import openai
 from config.logger import setup_logging
 from core.utils.util import check_model_key
-from core.providers.llm.base import LLMProviderBase
+from core.providers.llm.base import LLMProviderBase, prompt_cache_stats
 
 TAG = __name__
 logger = setup_logging()
@@ -24,9 +24,27 @@ class LLMProvider(LLMProviderBase):
         except (ValueError, TypeError):
             max_tokens = 500
         self.max_tokens = max_tokens
+        # 流式输出结束时返回token用量，用于统计提示词缓存命中，需要服务端支持stream_options
+        self.stream_usage = config.get("stream_usage", False)
 
         check_model_key("LLM", self.api_key)
         self.client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.async_client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+
+    def _stream_kwargs(self):
+        if self.stream_usage:
+            return {"stream_options": {"include_usage": True}}
+        return {}
+
+    def _record_usage(self, chunk):
+        """最后一个chunk携带本次请求的用量，没有choices"""
+        usage = getattr(chunk, "usage", None)
+        if usage is None:
+            return
+        result = prompt_cache_stats.record(usage)
+        logger.bind(tag=TAG).debug(
+            f"提示词token: {result[0]}，命中缓存: {result[1]}"
+        )
 
     def response(self, session_id, dialogue):
         try:
@@ -35,10 +53,12 @@ class LLMProvider(LLMProviderBase):
                 messages=dialogue,
                 stream=True,
                 max_tokens=self.max_tokens,
+                **self._stream_kwargs(),
             )
 
             is_active = True
             for chunk in responses:
+                self._record_usage(chunk)
                 try:
                     # 检查是否存在有效的choice且content不为空
                     delta = (
@@ -66,12 +86,79 @@ class LLMProvider(LLMProviderBase):
     def response_with_functions(self, session_id, dialogue, functions=None):
         try:
             stream = self.client.chat.completions.create(
-                model=self.model_name, messages=dialogue, stream=True, tools=functions
+                model=self.model_name,
+                messages=dialogue,
+                stream=True,
+                tools=functions,
+                **self._stream_kwargs(),
             )
 
             for chunk in stream:
+                self._record_usage(chunk)
+                if not chunk.choices:
+                    continue
                 yield chunk.choices[0].delta.content, chunk.choices[0].delta.tool_calls
 
         except Exception as e:
             logger.bind(tag=TAG).error(f"Error in function call streaming: {e}")
             yield f"【OpenAI服务响应异常: {e}】", None
+
+    async def aresponse(self, session_id, dialogue):
+        try:
+            responses = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=dialogue,
+                stream=True,
+                max_tokens=self.max_tokens,
+                **self._stream_kwargs(),
+            )
+
+            is_active = True
+            # 提前退出(被打断、对冲落败)时也要关闭HTTP响应
+            async with responses:
+                async for chunk in responses:
+                    self._record_usage(chunk)
+                    try:
+                        delta = (
+                            chunk.choices[0].delta
+                            if getattr(chunk, "choices", None)
+                            else None
+                        )
+                        content = delta.content if hasattr(delta, "content") else ""
+                    except IndexError:
+                        content = ""
+                    if content:
+                        # 处理标签跨多个chunk的情况
+                        if "<think>" in content:
+                            is_active = False
+                            content = content.split("<think>")[0]
+                        if "</think>" in content:
+                            is_active = True
+                            content = content.split("</think>")[-1]
+                        if is_active:
+                            yield content
+
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Error in response generation: {e}")
+
+    async def aresponse_with_functions(self, session_id, dialogue, functions=None):
+        try:
+            stream = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=dialogue,
+                stream=True,
+                tools=functions,
+                **self._stream_kwargs(),
+            )
+
+            # 提前退出(被打断、对冲落败)时也要关闭HTTP响应
+            async with stream:
+                async for chunk in stream:
+                    self._record_usage(chunk)
+                    if not chunk.choices:
+                        continue
+                    yield chunk.choices[0].delta.content, chunk.choices[0].delta.tool_calls
+
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Error in function call streaming: {e}")
+            yield f"【OpenAI服务响应异常: {e}】", None
@@ -1,5 +1,5 @@
 from config.logger import setup_logging
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import json
 from core.providers.llm.base import LLMProviderBase
 
@@ -23,6 +23,7 @@ class LLMProvider(LLMProviderBase):
                 base_url=self.base_url,
                 api_key="xinference"  # Xinference has a similar setup to Ollama where it doesn't need an actual key
             )
+            self.async_client = AsyncOpenAI(base_url=self.base_url, api_key="xinference")
             logger.bind(tag=TAG).info("Xinference client initialized successfully")
         except Exception as e:
             logger.bind(tag=TAG).error(f"Error initializing Xinference client: {e}")
@@ -82,4 +83,63 @@ class LLMProvider(LLMProviderBase):
 
         except Exception as e:
             logger.bind(tag=TAG).error(f"Error in Xinference function call: {e}")
-            yield {"type": "content", "content": f"【Xinference服务响应异常: {str(e)}】"} 
+            yield {"type": "content", "content": f"【Xinference服务响应异常: {str(e)}】"}
+
+    async def aresponse(self, session_id, dialogue):
+        try:
+            logger.bind(tag=TAG).debug(f"Sending request to Xinference with model: {self.model_name}, dialogue length: {len(dialogue)}")
+            responses = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=dialogue,
+                stream=True
+            )
+            is_active = True
+            # 提前退出(被打断、对冲落败)时也要关闭HTTP响应
+            async with responses:
+                async for chunk in responses:
+                    try:
+                        delta = chunk.choices[0].delta if getattr(chunk, 'choices', None) else None
+                        content = delta.content if hasattr(delta, 'content') else ''
+                        if content:
+                            if '<think>' in content:
+                                is_active = False
+                                content = content.split('<think>')[0]
+                            if '</think>' in content:
+                                is_active = True
+                                content = content.split('</think>')[-1]
+                            if is_active:
+                                yield content
+                    except Exception as e:
+                        logger.bind(tag=TAG).error(f"Error processing chunk: {e}")
+
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Error in Xinference response generation: {e}")
+            yield "【Xinference服务响应异常】"
+
+    async def aresponse_with_functions(self, session_id, dialogue, functions=None):
+        try:
+            logger.bind(tag=TAG).debug(f"Sending function call request to Xinference with model: {self.model_name}, dialogue length: {len(dialogue)}")
+            stream = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=dialogue,
+                stream=True,
+                tools=functions,
+            )
+
+            # 提前退出(被打断、对冲落败)时也要关闭HTTP响应
+            async with stream:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    content = delta.content
+                    tool_calls = delta.tool_calls
+
+                    if content:
+                        yield content, tool_calls
+                    elif tool_calls:
+                        yield None, tool_calls
+
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Error in Xinference function call: {e}")
+            yield f"【Xinference服务响应异常: {str(e)}】", None
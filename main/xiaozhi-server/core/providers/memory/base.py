@@ -1,3 +1,4 @@
+import time
 from abc import ABC, abstractmethod
 from config.logger import setup_logging
 
@@ -5,6 +6,10 @@ TAG = __name__
 logger = setup_logging()
 
 class MemoryProviderBase(ABC):
+    # 由initialize_modules按配置挂上，见core.utils.util.attach_resilience
+    breaker = None
+    fallback = None
+
     def __init__(self, config):
         self.config = config
         self.role_id = None
@@ -12,14 +17,48 @@ class MemoryProviderBase(ABC):
 
     @abstractmethod
     async def save_memory(self, msgs):
-        """Save a new memory for specific role and return memory ID"""
+        """Save a new memory for specific role and return memory ID
+        远程服务出错时直接抛出异常，由save_memory_guarded记入熔断器"""
         print("this is base func", msgs)
 
     @abstractmethod
     async def query_memory(self, query: str) -> str:
-        """Query memories for specific role based on similarity"""
+        """Query memories for specific role based on similarity
+        远程服务出错时直接抛出异常，由query_memory_guarded记入熔断器"""
         return "please implement query method"
 
     def init_memory(self, role_id, llm):
         self.role_id = role_id    
         self.llm = llm
+        if self.fallback is not None:
+            self.fallback.init_memory(role_id, llm)
+
+    async def query_memory_guarded(self, query: str) -> str:
+        """带熔断和备用记忆服务的query_memory，失败时返回空记忆，不影响对话"""
+        return await self._guarded("query_memory", query, default="")
+
+    async def save_memory_guarded(self, msgs):
+        """带熔断和备用记忆服务的save_memory"""
+        return await self._guarded("save_memory", msgs, default=None)
+
+    async def _guarded(self, method, arg, default):
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            if self.fallback is not None:
+                return await self.fallback._guarded(method, arg, default)
+            logger.bind(tag=TAG).warning(f"{breaker.name} 已熔断，跳过{method}")
+            return default
+
+        start_time = time.monotonic()
+        try:
+            result = await getattr(self, method)(arg)
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"记忆服务{method}失败: {e}")
+            if breaker is not None:
+                breaker.record(False, time.monotonic() - start_time)
+            if self.fallback is not None:
+                return await self.fallback._guarded(method, arg, default)
+            return default
+        if breaker is not None:
+            breaker.record(True, time.monotonic() - start_time)
+        return result
@@ -1,70 +1,86 @@
+import time
 import asyncio
 from config.logger import setup_logging
 import os
 import numpy as np
-import opuslib_next
+from core.utils import opus_codec
 from pydub import AudioSegment
 from abc import ABC, abstractmethod
 from core.utils.tts import MarkdownCleaner
+from core.utils.resilience import backoff_delay
 
 TAG = __name__
 logger = setup_logging()
 
 
 class TTSProviderBase(ABC):
+    # 由initialize_modules按配置挂上，见core.utils.util.attach_resilience
+    breaker = None
+    fallback = None
+
     def __init__(self, config, delete_audio_file):
         self.delete_audio_file = delete_audio_file
         self.output_file = config.get("output_dir")
+        # 失败后的重试次数，重试前按指数退避加随机抖动等待
+        self.max_retries = int(config.get("max_retries", 2))
+        self.retry_base_delay = float(config.get("retry_base_delay_ms", 200)) / 1000
+        self.retry_max_delay = float(config.get("retry_max_delay_ms", 2000)) / 1000
 
     @abstractmethod
     def generate_filename(self):
         pass
 
     def to_tts(self, text):
+        text = MarkdownCleaner.clean_markdown(text)
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            logger.bind(tag=TAG).warning(f"{breaker.name} 已熔断，跳过: {text}")
+            return self._fallback_tts(text)
+
         tmp_file = self.generate_filename()
-        try:
-            max_repeat_time = 5
-            text = MarkdownCleaner.clean_markdown(text)
-            
-            # 临时存储返回的opus数据和持续时间
-            opus_data_result = None
-            duration_result = None
-            
-            # 尝试生成TTS
-            while max_repeat_time > 0:
+        for attempt in range(self.max_retries + 1):
+            start_time = time.monotonic()
+            try:
                 # 调用子类的text_to_speak方法
                 result = asyncio.run(self.text_to_speak(text, tmp_file))
-                
-                # 检查是否有直接返回的opus数据（优化的服务提供商会这样做）
-                if isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], list):
-                    # 直接获取opus数据和持续时间
-                    opus_data_result, duration_result = result
-                    logger.bind(tag=TAG).info(f"语音生成成功(内存处理): {text}, 帧数={len(opus_data_result)}, 时长={duration_result:.2f}秒, 重试={5-max_repeat_time}次")
-                    break
-                elif os.path.exists(tmp_file):
-                    # 传统方式：通过文件处理
-                    logger.bind(tag=TAG).info(f"语音生成成功(文件处理): {text}:{tmp_file}, 重试={5-max_repeat_time}次")
-                    break
-                else:
-                    # 两种方式都失败了
-                    max_repeat_time = max_repeat_time - 1
-                    logger.bind(tag=TAG).error(f"语音生成失败: {text}:{tmp_file}, 再试{max_repeat_time}次")
-            
-            # 如果有直接返回的opus数据，优先使用
-            if opus_data_result is not None and duration_result is not None:
+            except Exception as e:
+                logger.bind(tag=TAG).error(f"Failed to generate TTS file: {e}")
+                result = None
+
+            # 检查是否有直接返回的opus数据（优化的服务提供商会这样做）
+            if isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], list):
                 # 将opus数据临时存储在实例中，以便audio_to_opus_data可以访问
-                self._direct_opus_data = opus_data_result
-                self._direct_duration = duration_result
-                return tmp_file  # 返回文件名以保持API兼容性
-            elif max_repeat_time > 0:
-                # 传统方式：返回生成的文件路径
-                return tmp_file
+                self._direct_opus_data, self._direct_duration = result
+                logger.bind(tag=TAG).info(f"语音生成成功(内存处理): {text}, 帧数={len(result[0])}, 时长={result[1]:.2f}秒, 重试={attempt}次")
+            elif os.path.exists(tmp_file):
+                # 传统方式：通过文件处理
+                logger.bind(tag=TAG).info(f"语音生成成功(文件处理): {text}:{tmp_file}, 重试={attempt}次")
             else:
-                # 尝试次数用尽，返回None
-                return None
-        except Exception as e:
-            logger.bind(tag=TAG).error(f"Failed to generate TTS file: {e}")
+                if breaker is not None:
+                    breaker.record(False, time.monotonic() - start_time)
+                logger.bind(tag=TAG).error(f"语音生成失败: {text}:{tmp_file}, 再试{self.max_retries - attempt}次")
+                if attempt == self.max_retries or (breaker is not None and not breaker.allow()):
+                    break
+                time.sleep(backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay))
+                continue
+
+            if breaker is not None:
+                breaker.record(True, time.monotonic() - start_time)
+            return tmp_file  # 返回文件名以保持API兼容性
+        return self._fallback_tts(text)
+
+    def _fallback_tts(self, text):
+        """使用备用TTS，直接返回的opus数据转存到本实例，由本实例的audio_to_opus_data取用"""
+        if self.fallback is None:
             return None
+        logger.bind(tag=TAG).warning(f"使用备用TTS: {text}")
+        tts_file = self.fallback.to_tts(text)
+        if hasattr(self.fallback, "_direct_opus_data"):
+            self._direct_opus_data = self.fallback._direct_opus_data
+            self._direct_duration = self.fallback._direct_duration
+            delattr(self.fallback, "_direct_opus_data")
+            delattr(self.fallback, "_direct_duration")
+        return tts_file
 
     @abstractmethod
     async def text_to_speak(self, text, output_file):
@@ -111,9 +127,6 @@ class TTSProviderBase(ABC):
         raw_data = audio.raw_data
         logger.debug(f"处理后音频: 采样率={output_sample_rate}Hz, 通道数=1, PCM数据长度={len(raw_data)}字节")
 
-        # 初始化Opus编码器 - 使用和解码器相同的参数
-        encoder = opuslib_next.Encoder(output_sample_rate, 1, opuslib_next.APPLICATION_AUDIO)
-
         # 使用小帧长来保证兼容性
         frame_duration = 20  # 20ms per frame
         frame_size = int(output_sample_rate * frame_duration / 1000)  # 320 samples/frame (20ms at 16kHz)
@@ -122,25 +135,27 @@ class TTSProviderBase(ABC):
         opus_datas = []
         max_buffer_size = 0
         
-        # 使用可控的小分片处理PCM数据 - 避免生成过大的帧
-        for i in range(0, len(raw_data), frame_size * 2):  # 16bit=2bytes/sample
-            # 获取当前帧的二进制数据
-            chunk = raw_data[i:i + frame_size * 2]
-
-            # 如果最后一帧不足，补零
-            if len(chunk) < frame_size * 2:
-                padding_size = frame_size * 2 - len(chunk)
-                chunk += b'\x00' * padding_size
-                logger.debug(f"最后一帧数据不足，补充{padding_size}字节的零")
-
-            # 转换为numpy数组处理
-            np_frame = np.frombuffer(chunk, dtype=np.int16)
-
-            # 编码Opus数据
-            opus_data = encoder.encode(np_frame.tobytes(), frame_size)
-            max_buffer_size = max(max_buffer_size, len(opus_data))
-            opus_datas.append(opus_data)
-        
+        # 从编码器池中取出编码器 - 使用和解码器相同的参数
+        with opus_codec.encoder() as encoder:
+            # 使用可控的小分片处理PCM数据 - 避免生成过大的帧
+            for i in range(0, len(raw_data), frame_size * 2):  # 16bit=2bytes/sample
+                # 获取当前帧的二进制数据
+                chunk = raw_data[i:i + frame_size * 2]
+
+                # 如果最后一帧不足，补零
+                if len(chunk) < frame_size * 2:
+                    padding_size = frame_size * 2 - len(chunk)
+                    chunk += b'\x00' * padding_size
+                    logger.debug(f"最后一帧数据不足，补充{padding_size}字节的零")
+
+                # 转换为numpy数组处理
+                np_frame = np.frombuffer(chunk, dtype=np.int16)
+
+                # 编码Opus数据
+                opus_data = encoder.encode(np_frame.tobytes(), frame_size)
+                max_buffer_size = max(max_buffer_size, len(opus_data))
+                opus_datas.append(opus_data)
+
         # 打印详细的调试信息
         logger.info(f"Opus编码完成(文件处理): 帧数={len(opus_datas)}, 最大帧大小={max_buffer_size}字节, 采样率={output_sample_rate}Hz, 帧长={frame_duration}ms")
         
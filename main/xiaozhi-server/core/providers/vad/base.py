@@ -1,9 +1,306 @@
+import time
+from collections import deque
+import numpy as np
+import opuslib_next
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import List
+from core.utils.pcm_buffer import PCMRingBuffer
+
+SAMPLE_RATE = 16000
+CHUNK_SAMPLES = 512  # 16kHz下VAD模型每次处理512个采样点
+PAUSE_HISTORY = 20  # 自适应断句时每个连接保留最近的句中停顿数
+
+
+class VADSession:
+    """
+    单个连接的VAD状态
+    由VADProvider为每个连接创建，provider本身只持有只读的共享模型
+    """
+
+    def __init__(self):
+        self.decoder = opuslib_next.Decoder(SAMPLE_RATE, 1)
+        self.audio_buffer = PCMRingBuffer()
+        self.have_voice = False
+        self.have_voice_last_time = 0.0
+        self.voice_stop = False
+        # 静音已达到推测断句的时长，但还没有达到断句阈值
+        self.early_stop = False
+        # 能量门限相关，跨句子保留
+        self.noise_floor = None
+        self.last_rms = 0.0
+        self.gate_checked = False
+        # 自适应断句相关，跨句子保留
+        self.pauses = deque(maxlen=PAUSE_HISTORY)
+        self.endpoint_threshold_ms = None
+        self.endpoint_bonus_ms = 0.0
+        self.last_endpoint_time = 0.0
+        # 流式识别的中间结果以句末标点结尾，由音频处理流程设置
+        self.sentence_final = False
+
+    def reset(self):
+        """一句话处理完成后重置说话状态"""
+        self.audio_buffer.clear()
+        self.have_voice = False
+        self.have_voice_last_time = 0.0
+        self.voice_stop = False
+        self.early_stop = False
+        self.sentence_final = False
+
+
+class EnergyGate:
+    """
+    神经网络VAD之前的能量/过零率预判
+    未说话时，能量明显低于该连接自适应噪声底的音频块直接判定为静音，跳过模型推理；
+    噪声底由被判定为静音的音频块的能量平滑得到
+    """
+
+    def __init__(self, config):
+        self.enabled = bool(config.get("energy_gate", False))
+        # 高于噪声底多少分贝以内视为静音
+        self.margin = 10 ** (float(config.get("energy_gate_margin_db", 6)) / 20)
+        # 低于该能量一定是静音，高于该能量一定交给模型判断
+        self.min_rms = float(config.get("energy_gate_min_rms", 0.002))
+        self.max_rms = float(config.get("energy_gate_max_rms", 0.02))
+        # 过零率高于该值的低能量音频视为噪声
+        self.noise_zcr = float(config.get("energy_gate_noise_zcr", 0.35))
+        self.floor_alpha = float(config.get("energy_gate_floor_alpha", 0.05))
+
+        self.frames = 0
+        self.skipped = 0
+        self.passed_voice = 0
+        self.passed_silence = 0
+
+    def check(self, session: VADSession, chunk: np.ndarray) -> bool:
+        """返回True表示该音频块可以跳过模型推理"""
+        rms = float(np.sqrt(np.dot(chunk, chunk) / len(chunk)))
+        session.last_rms = rms
+        session.gate_checked = True
+        self.frames += 1
+        if session.noise_floor is None:
+            session.noise_floor = rms
+
+        threshold = min(
+            max(session.noise_floor * self.margin, self.min_rms), self.max_rms
+        )
+        skip = rms < threshold
+        if not skip and rms < threshold * 2:
+            signs = np.signbit(chunk)
+            zcr = np.count_nonzero(signs[1:] != signs[:-1]) / (len(chunk) - 1)
+            skip = zcr > self.noise_zcr
+        if skip:
+            self.skipped += 1
+        return skip
+
+    def feedback(self, session: VADSession, speech_prob: float, is_voice: bool):
+        """根据最终判定结果更新噪声底和统计"""
+        if not session.gate_checked:
+            return
+        session.gate_checked = False
+        if not is_voice:
+            session.noise_floor += self.floor_alpha * (
+                session.last_rms - session.noise_floor
+            )
+        # 只统计真正经过模型推理的音频块
+        if speech_prob is not None:
+            if is_voice:
+                self.passed_voice += 1
+            else:
+                self.passed_silence += 1
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / self.frames if self.frames else 0.0,
+            "passed_voice": self.passed_voice,
+            "passed_silence": self.passed_silence,
+        }
+
+
+class EndpointController:
+    """
+    自适应断句
+    记录每个连接句中停顿(静音后又继续说话)的时长分布，断句静音阈值取停顿分布的高分位数加余量，
+    限制在配置的上下限之间；断句后很快又开始说话视为把话截断了，阈值临时加大，之后逐句回落。
+    流式识别的中间结果以句末标点结尾时，阈值按比例缩短
+    """
+
+    def __init__(self, config, default_ms):
+        self.enabled = bool(config.get("adaptive_endpointing", False))
+        self.default_ms = default_ms
+        self.min_ms = float(config.get("endpoint_min_silence_ms", 400))
+        self.max_ms = float(config.get("endpoint_max_silence_ms", 1200))
+        self.percentile = float(config.get("endpoint_pause_percentile", 90))
+        self.margin_ms = float(config.get("endpoint_margin_ms", 150))
+        # 短于该时长的静音是音节间隙，不计为停顿
+        self.min_pause_ms = float(config.get("endpoint_min_pause_ms", 150))
+        self.min_samples = int(config.get("endpoint_min_samples", 3))
+        self.truncation_window_ms = float(config.get("endpoint_truncation_window_ms", 1000))
+        self.truncation_step_ms = float(config.get("endpoint_truncation_step_ms", 150))
+        self.punctuation_factor = float(config.get("endpoint_punctuation_factor", 0.6))
+
+        self.endpoints = 0
+        self.truncations = 0
+        self.punctuation_endpoints = 0
+        self.threshold_total_ms = 0.0
+
+    def threshold(self, session: VADSession) -> float:
+        """当前应使用的断句静音阈值(毫秒)"""
+        if not self.enabled:
+            return self.default_ms
+        if session.endpoint_threshold_ms is None:
+            self._update(session)
+        if session.sentence_final:
+            return max(self.min_ms, session.endpoint_threshold_ms * self.punctuation_factor)
+        return session.endpoint_threshold_ms
+
+    def on_pause(self, session: VADSession, pause_ms: float):
+        """句中停顿结束，用户继续说话"""
+        if not self.enabled or pause_ms < self.min_pause_ms:
+            return
+        session.pauses.append(pause_ms)
+        self._update(session)
+
+    def on_speech_start(self, session: VADSession, now_ms: float):
+        """一句话开始，检查是否紧接着上一次断句，是则说明上一次断句截断了用户的话"""
+        if not self.enabled or not session.last_endpoint_time:
+            return
+        if now_ms - session.last_endpoint_time < self.truncation_window_ms:
+            self.truncations += 1
+            session.endpoint_bonus_ms += self.truncation_step_ms
+        else:
+            session.endpoint_bonus_ms /= 2
+        session.last_endpoint_time = 0.0
+        self._update(session)
+
+    def awaiting_truncation(self, session: VADSession, now_ms: float) -> bool:
+        """断句后是否仍在截断观察窗口内，窗口内即使本轮对话在处理中也需要继续检测语音"""
+        return (
+            self.enabled
+            and bool(session.last_endpoint_time)
+            and now_ms - session.last_endpoint_time < self.truncation_window_ms
+        )
+
+    def discard_endpoint(self, session: VADSession):
+        """断句得到的音频太短或识别为空，是噪声而不是一句话，之后开始说话不算截断"""
+        session.last_endpoint_time = 0.0
+
+    def on_endpoint(self, session: VADSession, now_ms: float, threshold_ms: float):
+        if not self.enabled:
+            return
+        session.last_endpoint_time = now_ms
+        self.endpoints += 1
+        self.threshold_total_ms += threshold_ms
+        if session.sentence_final:
+            self.punctuation_endpoints += 1
+
+    def _update(self, session: VADSession):
+        if len(session.pauses) >= self.min_samples:
+            base = float(np.percentile(session.pauses, self.percentile)) + self.margin_ms
+        else:
+            base = self.default_ms
+        session.endpoint_threshold_ms = min(
+            max(base + session.endpoint_bonus_ms, self.min_ms), self.max_ms
+        )
+
+    def session_state(self, session: VADSession) -> dict:
+        """单个连接的断句状态"""
+        return {
+            "threshold_ms": self.threshold(session),
+            "pauses": len(session.pauses),
+            "bonus_ms": session.endpoint_bonus_ms,
+            "sentence_final": session.sentence_final,
+        }
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "endpoints": self.endpoints,
+            "truncations": self.truncations,
+            "truncation_ratio": self.truncations / self.endpoints if self.endpoints else 0.0,
+            "punctuation_endpoints": self.punctuation_endpoints,
+            "avg_threshold_ms": (
+                self.threshold_total_ms / self.endpoints if self.endpoints else 0.0
+            ),
+        }
 
 
 class VADProviderBase(ABC):
+    def __init__(self, config):
+        self.vad_threshold = float(config.get("threshold", 0.5))
+        self.silence_threshold_ms = int(config.get("min_silence_duration_ms", 1000))
+        # 推测断句：静音达到该时长时提前开始识别，0表示关闭
+        self.speculative_silence_ms = int(config.get("speculative_silence_ms", 0))
+        self.energy_gate = EnergyGate(config)
+        self.endpointing = EndpointController(config, self.silence_threshold_ms)
+
+    def create_session(self) -> VADSession:
+        """为新连接创建VAD状态"""
+        return VADSession()
+
     @abstractmethod
     def is_vad(self, conn, data) -> bool:
-        """检测音频数据中的语音活动"""
+        """检测音频数据中的语音活动，状态保存在conn.vad_session中"""
         pass
+
+    async def is_vad_async(self, conn, data) -> bool:
+        """异步检测语音活动，支持批量推理的实现可以重写该方法"""
+        return self.is_vad(conn, data)
+
+    def release(self, conn):
+        """连接关闭时释放该连接占用的VAD资源"""
+        pass
+
+    def get_metrics(self) -> dict:
+        """VAD运行指标，用于调优"""
+        return {
+            "energy_gate": self.energy_gate.metrics(),
+            "endpointing": self.endpointing.metrics(),
+        }
+
+    def _gate(self, session: VADSession, chunk: np.ndarray) -> bool:
+        """能量预判，返回True表示该音频块是静音，不需要模型推理"""
+        if not self.energy_gate.enabled or session.have_voice:
+            # 说话过程中不做预判，避免截断轻声的句尾
+            return False
+        return self.energy_gate.check(session, chunk)
+
+    def _read_chunks(self, session: VADSession, opus_packet) -> List[np.ndarray]:
+        """
+        将opus数据直接解码到连接的缓冲区中，取出所有完整的512采样点音频块
+        返回的是缓冲区上的float32视图，需要在下一次解码前使用完毕
+        """
+        session.audio_buffer.decode_into(session.decoder, opus_packet, 960)
+        return session.audio_buffer.read_chunks(CHUNK_SAMPLES)
+
+    def _update_voice_state(self, session: VADSession, speech_prob) -> bool:
+        """
+        根据语音概率更新连接的说话状态，返回本音频块是否有声音
+        speech_prob为None表示该音频块被能量预判为静音
+        """
+        client_have_voice = (
+            speech_prob is not None and speech_prob >= self.vad_threshold
+        )
+        self.energy_gate.feedback(session, speech_prob, client_have_voice)
+
+        now = time.time() * 1000
+        # 如果之前有声音，但本次没有声音，且与上次有声音的时间查已经超过了静默阈值，则认为已经说完一句话
+        if session.have_voice and not client_have_voice:
+            stop_duration = now - session.have_voice_last_time
+            threshold = self.endpointing.threshold(session)
+            if stop_duration >= threshold:
+                if not session.voice_stop:
+                    self.endpointing.on_endpoint(session, now, threshold)
+                session.voice_stop = True
+            elif 0 < self.speculative_silence_ms <= stop_duration:
+                session.early_stop = True
+        if client_have_voice:
+            if session.have_voice:
+                self.endpointing.on_pause(session, now - session.have_voice_last_time)
+            else:
+                self.endpointing.on_speech_start(session, now)
+            session.early_stop = False
+            session.have_voice = True
+            session.have_voice_last_time = now
+        return client_have_voice
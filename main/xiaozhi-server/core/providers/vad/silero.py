@@ -1,16 +1,175 @@
-import time
+import asyncio
+import threading
 import numpy as np
 import torch
 import opuslib_next
+from concurrent.futures import ThreadPoolExecutor
 from config.logger import setup_logging
-from core.providers.vad.base import VADProviderBase
+from core.providers.vad.base import VADProviderBase, VADSession, SAMPLE_RATE
 
 TAG = __name__
 logger = setup_logging()
 
+CONTEXT_SAMPLES = 64  # 16kHz下模型每次携带的上文采样点
+STATE_SIZE = 128
+
+# JIT模型把循环状态保存在模型属性上，调用期间需要独占模型
+_model_lock = threading.Lock()
+
+
+def forward_with_state(model, x, state, context):
+    """
+    使用显式的循环状态调用silero模型
+    x: [batch, 512]，state: [2, batch, 128]，context: [batch, 64]
+    返回: (语音概率[batch, 1], 新的state, 新的context)
+    """
+    with _model_lock:
+        model._state = state
+        model._context = context
+        model._last_sr = SAMPLE_RATE
+        model._last_batch_size = x.shape[0]
+        out = model(x, SAMPLE_RATE)
+        return out, model._state, model._context
+
+
+class SileroVADSession(VADSession):
+    """silero的连接状态：在基础状态上增加模型的循环状态"""
+
+    def __init__(self):
+        super().__init__()
+        self.state = torch.zeros(2, 1, STATE_SIZE)
+        self.context = torch.zeros(1, CONTEXT_SAMPLES)
+
+
+class SileroBatchScheduler:
+    """
+    跨连接的VAD微批处理调度器
+    在batch_max_wait_ms时间窗口内收集所有连接待处理的音频块，合并为一次批量推理；
+    每个连接占用批量状态张量中的一个槽位，推理在独立的单线程中串行执行，不阻塞事件循环
+    """
+
+    def __init__(self, model, max_batch_size=64, max_wait_ms=5):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="vad-batch"
+        )
+        # 以下状态只在推理线程中访问
+        self._state = torch.zeros(2, 0, STATE_SIZE)
+        self._context = torch.zeros(0, CONTEXT_SAMPLES)
+        # 以下状态只在事件循环线程中访问
+        self._slots = {}
+        self._free_slots = []
+        self._next_slot = 0
+        self._reset_slots = []
+        self._pending = []
+        self._timer = None
+
+    async def infer(self, key, chunk: np.ndarray) -> float:
+        """提交一个音频块，返回该音频块的语音概率"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((self._get_slot(key), chunk, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def release(self, key):
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            self._free_slots.append(slot)
+
+    def _get_slot(self, key):
+        slot = self._slots.get(key)
+        if slot is None:
+            if self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot = self._next_slot
+                self._next_slot += 1
+            self._slots[key] = slot
+            # 新分配的槽位需要在下一次推理前清零
+            self._reset_slots.append(slot)
+        return slot
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        # 同一个槽位在一个批次中只能出现一次，否则循环状态会被覆盖
+        batch, rest, used = [], [], set()
+        for item in self._pending:
+            if len(batch) < self.max_batch_size and item[0] not in used:
+                batch.append(item)
+                used.add(item[0])
+            else:
+                rest.append(item)
+        self._pending = rest
+        reset_slots, self._reset_slots = self._reset_slots, []
+
+        loop = asyncio.get_running_loop()
+        if rest:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        slots = [item[0] for item in batch]
+        chunks = [item[1] for item in batch]
+        futures = [item[2] for item in batch]
+        job = loop.run_in_executor(
+            self._executor, self._run_batch, slots, chunks, reset_slots
+        )
+        job.add_done_callback(lambda f: self._resolve(f, futures))
+
+    @staticmethod
+    def _resolve(job, futures):
+        if job.cancelled():
+            error = asyncio.CancelledError()
+        else:
+            error = job.exception()
+        probs = None if error else job.result()
+        for i, future in enumerate(futures):
+            if future.done():
+                continue
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(probs[i])
+
+    def _run_batch(self, slots, chunks, reset_slots):
+        with torch.no_grad():
+            capacity = max(slots + reset_slots) + 1
+            if capacity > self._context.shape[0]:
+                size = self._context.shape[0]
+                grow = max(capacity, size * 2) - size
+                self._state = torch.cat(
+                    [self._state, torch.zeros(2, grow, STATE_SIZE)], dim=1
+                )
+                self._context = torch.cat(
+                    [self._context, torch.zeros(grow, CONTEXT_SAMPLES)], dim=0
+                )
+            if reset_slots:
+                reset_index = torch.tensor(reset_slots)
+                self._state[:, reset_index] = 0
+                self._context[reset_index] = 0
+
+            index = torch.tensor(slots)
+            x = torch.from_numpy(np.stack(chunks))
+            out, state, context = forward_with_state(
+                self.model, x, self._state[:, index], self._context[index]
+            )
+            self._state[:, index] = state
+            self._context[index] = context
+            return out.squeeze(1).tolist()
+
 
 class VADProvider(VADProviderBase):
     def __init__(self, config):
+        super().__init__(config)
         logger.bind(tag=TAG).info("SileroVAD", config)
         self.model, self.utils = torch.hub.load(
             repo_or_dir=config["model_dir"],
@@ -20,45 +179,57 @@ class VADProvider(VADProviderBase):
         )
         (get_speech_timestamps, _, _, _, _) = self.utils
 
-        self.decoder = opuslib_next.Decoder(16000, 1)
-        self.vad_threshold = float(config.get("threshold", 0.5))
-        self.silence_threshold_ms = int(config.get("min_silence_duration_ms", 1000))
+        # 跨连接批量推理
+        self.batch_scheduler = None
+        if config.get("batch_enabled", False):
+            self.batch_scheduler = SileroBatchScheduler(
+                self.model,
+                max_batch_size=int(config.get("batch_max_size", 64)),
+                max_wait_ms=float(config.get("batch_max_wait_ms", 5)),
+            )
+
+    def create_session(self):
+        return SileroVADSession()
 
     def is_vad(self, conn, opus_packet):
+        session = conn.vad_session
         try:
-            pcm_frame = self.decoder.decode(opus_packet, 960)
-            conn.client_audio_buffer.extend(pcm_frame)  # 将新数据加入缓冲区
-
-            # 处理缓冲区中的完整帧（每次处理512采样点）
             client_have_voice = False
-            while len(conn.client_audio_buffer) >= 512 * 2:
-                # 提取前512个采样点（1024字节）
-                chunk = conn.client_audio_buffer[: 512 * 2]
-                conn.client_audio_buffer = conn.client_audio_buffer[512 * 2 :]
-
-                # 转换为模型需要的张量格式
-                audio_int16 = np.frombuffer(chunk, dtype=np.int16)
-                audio_float32 = audio_int16.astype(np.float32) / 32768.0
-                audio_tensor = torch.from_numpy(audio_float32)
-
-                # 检测语音活动
-                with torch.no_grad():
-                    speech_prob = self.model(audio_tensor, 16000).item()
-                client_have_voice = speech_prob >= self.vad_threshold
-
-                # 如果之前有声音，但本次没有声音，且与上次有声音的时间查已经超过了静默阈值，则认为已经说完一句话
-                if conn.client_have_voice and not client_have_voice:
-                    stop_duration = (
-                        time.time() * 1000 - conn.client_have_voice_last_time
-                    )
-                    if stop_duration >= self.silence_threshold_ms:
-                        conn.client_voice_stop = True
-                if client_have_voice:
-                    conn.client_have_voice = True
-                    conn.client_have_voice_last_time = time.time() * 1000
+            for chunk in self._read_chunks(session, opus_packet):
+                speech_prob = None
+                if not self._gate(session, chunk):
+                    # 检测语音活动，使用该连接自己的循环状态
+                    audio_tensor = torch.from_numpy(chunk).unsqueeze(0)
+                    with torch.no_grad():
+                        out, session.state, session.context = forward_with_state(
+                            self.model, audio_tensor, session.state, session.context
+                        )
+                    speech_prob = out.item()
+                client_have_voice = self._update_voice_state(session, speech_prob)
+            return client_have_voice
+        except opuslib_next.OpusError as e:
+            logger.bind(tag=TAG).info(f"解码错误: {e}")
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Error processing audio packet: {e}")
 
+    async def is_vad_async(self, conn, opus_packet):
+        if self.batch_scheduler is None:
+            return self.is_vad(conn, opus_packet)
+        session = conn.vad_session
+        try:
+            client_have_voice = False
+            for chunk in self._read_chunks(session, opus_packet):
+                speech_prob = None
+                if not self._gate(session, chunk):
+                    # 批量推理时循环状态保存在调度器的批量状态张量中
+                    speech_prob = await self.batch_scheduler.infer(session, chunk)
+                client_have_voice = self._update_voice_state(session, speech_prob)
             return client_have_voice
         except opuslib_next.OpusError as e:
             logger.bind(tag=TAG).info(f"解码错误: {e}")
         except Exception as e:
             logger.bind(tag=TAG).error(f"Error processing audio packet: {e}")
+
+    def release(self, conn):
+        if self.batch_scheduler is not None:
+            self.batch_scheduler.release(conn.vad_session)
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import onnxruntime
+import opuslib_next
+from config.logger import setup_logging
+from core.providers.vad.base import (
+    VADProviderBase,
+    VADSession,
+    SAMPLE_RATE,
+    CHUNK_SAMPLES,
+)
+
+TAG = __name__
+logger = setup_logging()
+
+CONTEXT_SAMPLES = 64  # 16kHz下模型每次携带的上文采样点
+STATE_SIZE = 128
+
+
+class SileroOnnxVADSession(VADSession):
+    """silero onnx的连接状态：显式的模型循环状态，以及复用的模型输入(上文+音频块)"""
+
+    def __init__(self):
+        super().__init__()
+        self.state = np.zeros((2, 1, STATE_SIZE), dtype=np.float32)
+        self.input = np.zeros((1, CONTEXT_SAMPLES + CHUNK_SAMPLES), dtype=np.float32)
+
+
+class VADProvider(VADProviderBase):
+    """
+    通过onnxruntime运行silero vad的onnx模型，不依赖torch
+    循环状态由每个连接的session显式传入，InferenceSession可以被多个线程同时调用
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        logger.bind(tag=TAG).info("SileroOnnxVAD", config)
+        model_path = config.get("model_path")
+        if not model_path:
+            model_path = os.path.join(
+                config["model_dir"], "src", "silero_vad", "data", "silero_vad.onnx"
+            )
+
+        opts = onnxruntime.SessionOptions()
+        opts.inter_op_num_threads = 1
+        opts.intra_op_num_threads = int(config.get("num_threads", 1))
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=opts, providers=["CPUExecutionProvider"]
+        )
+        self.sample_rate = np.array(SAMPLE_RATE, dtype=np.int64)
+
+    def create_session(self):
+        return SileroOnnxVADSession()
+
+    def is_vad(self, conn, opus_packet):
+        session = conn.vad_session
+        try:
+            client_have_voice = False
+            for chunk in self._read_chunks(session, opus_packet):
+                speech_prob = None
+                if not self._gate(session, chunk):
+                    speech_prob = self._infer(session, chunk)
+                client_have_voice = self._update_voice_state(session, speech_prob)
+            return client_have_voice
+        except opuslib_next.OpusError as e:
+            logger.bind(tag=TAG).info(f"解码错误: {e}")
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Error processing audio packet: {e}")
+
+    def _infer(self, session, chunk):
+        """对一个512采样点的音频块推理，更新session中的循环状态"""
+        x = session.input
+        x[0, CONTEXT_SAMPLES:] = chunk
+        out, session.state = self.session.run(
+            None, {"input": x, "state": session.state, "sr": self.sample_rate}
+        )
+        # 本次输入的末尾作为下一次推理的上文
+        x[0, :CONTEXT_SAMPLES] = x[0, -CONTEXT_SAMPLES:]
+        return float(out[0][0])
@@ -13,12 +13,23 @@ from config.logger import setup_logging
 TAG = __name__
 logger = setup_logging()
 
-def create_instance(class_name: str, *args, **kwargs) -> ASRProviderBase:
-    """工厂方法创建ASR实例"""
+def load_provider_class(class_name: str):
+    """按类型加载ASR实现类"""
     if os.path.exists(os.path.join('core', 'providers', 'asr', f'{class_name}.py')):
         lib_name = f'core.providers.asr.{class_name}'
         if lib_name not in sys.modules:
             sys.modules[lib_name] = importlib.import_module(f'{lib_name}')
-        return sys.modules[lib_name].ASRProvider(*args, **kwargs)
+        return sys.modules[lib_name].ASRProvider
+
+    raise ValueError(f"不支持的ASR类型: {class_name}，请检查该配置的type是否设置正确")
+
+
+def create_instance(class_name: str, config: dict, *args, **kwargs) -> ASRProviderBase:
+    """工厂方法创建ASR实例"""
+    provider_class = load_provider_class(class_name)
+    if int(config.get("process_workers", 0)) > 0:
+        # 进程池模式：模型在独立的worker进程中加载，当前进程只负责解码和转发音频
+        from core.utils.asr_pool import ProcessPoolASR
 
-    raise ValueError(f"不支持的ASR类型: {class_name}，请检查该配置的type是否设置正确")
\ No newline at end of file
+        return ProcessPoolASR(class_name, provider_class, config, *args, **kwargs)
+    return provider_class(config, *args, **kwargs)
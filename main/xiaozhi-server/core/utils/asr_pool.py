@@ -0,0 +1,358 @@
+import json
+import time
+import atexit
+import signal
+import asyncio
+import itertools
+import threading
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+from typing import Optional, Tuple, List
+
+import numpy as np
+from config.logger import setup_logging
+from core.providers.asr.base import ASRProviderBase
+from core.utils import opus_codec
+
+TAG = __name__
+logger = setup_logging()
+
+SAMPLE_RATE = 16000
+RESTART_INTERVAL = 5  # 同一个worker两次重启之间的最小间隔(秒)
+
+# 相同配置的ASR共用一个进程池，例如多个连接使用相同的私有配置
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class _PoolWorker:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.request_conn = None
+        self.result_conn = None
+        self.outstanding = 0
+        self.ready = False
+        self.started_at = 0.0
+        # 已因请求超时被结束，等待结果线程处理退出后重启
+        self.killed = False
+
+
+class ASRProcessPool:
+    """
+    ASR进程池
+    每个worker进程各自加载一份模型；待识别的PCM写入共享内存中的槽位，
+    通过管道只传递(请求id, 槽位, 采样点数)，识别结果再经管道返回。
+    结果由后台线程接收，回调到发起请求的事件循环；请求超时的worker视为卡死，直接结束后重启
+    """
+
+    def __init__(self, class_name: str, provider_class, config: dict, num_workers: int, slot_seconds: float):
+        self.class_name = class_name
+        self.provider_class = provider_class
+        self.config = config
+        self.num_slots = num_workers * 2
+        self.slot_samples = int(slot_seconds * SAMPLE_RATE)
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=self.num_slots * self.slot_samples * 2
+        )
+        self.pcm = np.ndarray(
+            (self.num_slots, self.slot_samples), dtype=np.int16, buffer=self.shm.buf
+        )
+        self._ctx = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._requests = {}
+        self._free_slots = list(range(self.num_slots))
+        self._slot_semaphore = None
+        self._closed = False
+
+        self.workers = [_PoolWorker(i) for i in range(num_workers)]
+        for worker in self.workers:
+            self._spawn(worker)
+        self._reader = threading.Thread(
+            target=self._read_results, name="asr-pool-reader", daemon=True
+        )
+        self._reader.start()
+        atexit.register(self.close)
+        logger.bind(tag=TAG).info(
+            f"ASR进程池已启动，类型: {class_name}，worker数量: {num_workers}"
+        )
+
+    async def transcribe(self, pcm: np.ndarray, timeout: float) -> str:
+        """识别一段int16 PCM，等待空闲槽位后提交给负载最低的worker"""
+        if self._slot_semaphore is None:
+            self._slot_semaphore = asyncio.Semaphore(self.num_slots)
+        if len(pcm) > self.slot_samples:
+            logger.bind(tag=TAG).warning(
+                f"音频超过进程池槽位长度，只识别前{self.slot_samples / SAMPLE_RATE:.0f}秒"
+            )
+            pcm = pcm[: self.slot_samples]
+
+        loop = asyncio.get_running_loop()
+        await self._slot_semaphore.acquire()
+        with self._lock:
+            slot = self._free_slots.pop()
+        # 槽位在worker返回结果或退出后才释放，即使请求方已经超时放弃
+        self.pcm[slot, : len(pcm)] = pcm
+        future = loop.create_future()
+        request_id = None
+        try:
+            with self._lock:
+                worker = self._select_worker()
+                request_id = next(self._request_ids)
+                # 模型加载期间排队的请求，等待时间包含加载耗时，超时不能说明worker卡死
+                self._requests[request_id] = (loop, future, slot, worker, not worker.ready)
+                worker.outstanding += 1
+                worker.request_conn.send((request_id, slot, len(pcm)))
+        except Exception:
+            self._requests.pop(request_id, None)
+            self._release_slot(slot)
+            raise
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self._kill_hung_worker(request_id)
+            raise
+
+    def _kill_hung_worker(self, request_id):
+        """
+        请求超时仍未返回，结束处理它的worker进程，
+        由结果线程按worker退出处理：回收进程，未完成的请求报错并释放槽位，之后重启worker
+        """
+        with self._lock:
+            request = self._requests.get(request_id)
+            if request is None:
+                return
+            _, future, _, worker, queued_during_load = request
+            # 请求方已经放弃，之后该请求结束时不再设置结果
+            future.cancel()
+            if queued_during_load or worker.killed:
+                return
+            worker.killed = True
+        logger.bind(tag=TAG).error(
+            f"ASR worker-{worker.index} 识别超时，结束进程后重启"
+        )
+        # 只发送信号，不在事件循环中等待进程退出
+        worker.process.kill()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self.workers:
+            try:
+                worker.request_conn.send(None)
+            except (OSError, AttributeError):
+                pass
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+        self.shm.close()
+        self.shm.unlink()
+
+    def _select_worker(self) -> _PoolWorker:
+        # 刚被结束的worker在结果线程处理其退出之前也不再分配请求
+        alive = [w for w in self.workers if w.result_conn is not None and not w.killed]
+        if not alive:
+            raise RuntimeError("ASR进程池没有可用的worker")
+        # 优先交给模型已加载完成的worker，都在加载时才排队等待
+        ready = [w for w in alive if w.ready]
+        return min(ready or alive, key=lambda w: w.outstanding)
+
+    def _spawn(self, worker: _PoolWorker):
+        request_recv, request_send = self._ctx.Pipe(duplex=False)
+        result_recv, result_send = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_pool_worker_main,
+            args=(
+                self.provider_class,
+                self.config,
+                self.shm.name,
+                self.num_slots,
+                self.slot_samples,
+                request_recv,
+                result_send,
+            ),
+            name=f"xiaozhi-asr-{worker.index}",
+            daemon=True,
+        )
+        process.start()
+        request_recv.close()
+        result_send.close()
+        worker.process = process
+        worker.request_conn = request_send
+        worker.result_conn = result_recv
+        worker.ready = False
+        worker.killed = False
+        worker.started_at = time.time()
+
+    def _read_results(self):
+        while not self._closed:
+            conns = {w.result_conn: w for w in self.workers if w.result_conn}
+            for conn in wait(list(conns), timeout=1):
+                worker = conns[conn]
+                try:
+                    request_id, text, error = conn.recv()
+                except (EOFError, OSError):
+                    self._on_worker_exit(worker)
+                    continue
+                if request_id is None:
+                    worker.ready = True
+                    logger.bind(tag=TAG).info(f"ASR worker-{worker.index} 模型加载完成")
+                    continue
+                self._complete(request_id, text, error)
+            self._restart_workers()
+
+    def _complete(self, request_id, text, error):
+        with self._lock:
+            request = self._requests.pop(request_id, None)
+            if request is None:
+                return
+            loop, future, slot, worker, _ = request
+            worker.outstanding -= 1
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._resolve, future, slot, text, error)
+
+    def _resolve(self, future, slot, text, error):
+        """在事件循环线程中执行"""
+        self._release_slot(slot)
+        if future.done():
+            return
+        if error:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(text)
+
+    def _release_slot(self, slot):
+        with self._lock:
+            self._free_slots.append(slot)
+        self._slot_semaphore.release()
+
+    def _on_worker_exit(self, worker: _PoolWorker):
+        if self._closed:
+            return
+        logger.bind(tag=TAG).error(
+            f"ASR worker-{worker.index} 已退出，退出码: {worker.process.exitcode}"
+        )
+        worker.result_conn.close()
+        worker.request_conn.close()
+        with self._lock:
+            worker.result_conn = None
+            worker.ready = False
+            lost = [
+                request_id
+                for request_id, request in self._requests.items()
+                if request[3] is worker
+            ]
+        for request_id in lost:
+            self._complete(request_id, None, "ASR worker进程异常退出")
+        worker.outstanding = 0
+
+    def _restart_workers(self):
+        now = time.time()
+        for worker in self.workers:
+            if self._closed:
+                return
+            if worker.result_conn is not None:
+                continue
+            if now - worker.started_at < RESTART_INTERVAL:
+                continue
+            worker.process.join(timeout=1)
+            with self._lock:
+                self._spawn(worker)
+            logger.bind(tag=TAG).info(f"ASR worker-{worker.index} 正在重启")
+
+
+def get_pool(class_name: str, provider_class, config: dict) -> ASRProcessPool:
+    key = (class_name, json.dumps(config, sort_keys=True, default=str))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ASRProcessPool(
+                class_name,
+                provider_class,
+                config,
+                num_workers=int(config.get("process_workers", 1)),
+                slot_seconds=float(config.get("process_slot_seconds", 60)),
+            )
+            _pools[key] = pool
+        return pool
+
+
+class ProcessPoolASR(ASRProviderBase):
+    """
+    进程池模式的ASR：当前进程只负责opus解码，识别在进程池中完成
+    要求对应的ASR实现声明supports_transcribe
+    """
+
+    def __init__(self, class_name: str, provider_class, config: dict, delete_audio_file: bool = True):
+        super().__init__(config)
+        if not provider_class.supports_transcribe:
+            raise ValueError(f"ASR类型 {class_name} 不支持进程池模式")
+        self.output_dir = config.get("output_dir")
+        self.delete_audio_file = delete_audio_file
+        self.timeout = float(config.get("process_timeout", 30))
+        self.pool = get_pool(class_name, provider_class, config)
+
+    async def speech_to_text(self, opus_data: List[bytes], session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        file_path = None
+        try:
+            start_time = time.time()
+            pcm = opus_codec.decode_packets(opus_data)
+            # 仅在保留音频时落盘，便于调试
+            if not self.delete_audio_file:
+                file_path = self.save_pcm_to_file(pcm, session_id)
+            if len(pcm) == 0:
+                return "", file_path
+
+            text = await self.pool.transcribe(pcm, self.timeout)
+            logger.bind(tag=TAG).debug(
+                f"进程池语音识别耗时: {time.time() - start_time:.3f}s | 结果: {text}"
+            )
+            return text, file_path
+
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"语音识别失败: {e}", exc_info=True)
+            return "", None
+
+
+def _pool_worker_main(
+    provider_class, config, shm_name, num_slots, slot_samples, request_conn, result_conn
+):
+    """ASR worker进程入口，provider_class按模块路径传入，在worker中重新导入"""
+    # 退出由主进程控制
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # worker与主进程共用资源跟踪器，共享内存由主进程创建和释放
+    shm = shared_memory.SharedMemory(name=shm_name)
+    pcm = np.ndarray((num_slots, slot_samples), dtype=np.int16, buffer=shm.buf)
+    try:
+        provider = provider_class(config, True)
+        result_conn.send((None, None, None))
+        while True:
+            try:
+                message = request_conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            request_id, slot, length = message
+            try:
+                text = provider.transcribe(
+                    opus_codec.pcm_to_float32(pcm[slot, :length])
+                )
+                result_conn.send((request_id, text, None))
+            except Exception as e:
+                logger.bind(tag=TAG).error(f"语音识别失败: {e}")
+                result_conn.send((request_id, None, str(e)))
+    except Exception as e:
+        logger.bind(tag=TAG).error(f"ASR worker运行出错: {e}\n{traceback.format_exc()}")
+    finally:
+        del pcm
+        shm.close()
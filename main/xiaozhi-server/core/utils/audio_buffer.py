@@ -0,0 +1,42 @@
+from collections import deque
+
+FRAME_DURATION_MS = 60  # 设备上报的每个opus数据包时长
+
+
+class UtteranceBuffer:
+    """
+    每个连接待识别的音频
+    没有说话时只在固定长度的环形缓冲区中保留最新的几帧，用于补上句首；
+    开始说话后这几帧连同后续音频进入本句缓冲区，本句时长有上限，
+    到达上限时由调用方强制断句，避免VAD一直判为有声时内存无限增长
+    """
+
+    def __init__(self, preroll_frames=10, max_duration_ms=60000):
+        self.preroll = deque(maxlen=preroll_frames)
+        self.frames = []
+        self.max_frames = max(1, max_duration_ms // FRAME_DURATION_MS)
+
+    def __len__(self):
+        return len(self.preroll) + len(self.frames)
+
+    def push_preroll(self, frame):
+        """没有说话时保留最新的几帧"""
+        self.preroll.append(frame)
+
+    def append(self, frame) -> bool:
+        """追加一帧到本句，返回本句是否已达到时长上限"""
+        if self.preroll:
+            self.frames.extend(self.preroll)
+            self.preroll.clear()
+        self.frames.append(frame)
+        return len(self.frames) >= self.max_frames
+
+    def packets(self) -> list:
+        """本句的全部音频，包括句首之前保留的几帧"""
+        if self.preroll:
+            return self.frames + list(self.preroll)
+        return self.frames
+
+    def clear(self):
+        self.preroll.clear()
+        self.frames = []
@@ -1,6 +1,28 @@
+import json
+import time
+import bisect
 import uuid
 from typing import List, Dict
 from datetime import datetime
+from core.providers.llm.base import is_error_output
+
+
+# 压缩较早对话时使用的提示词
+summary_prompt = """
+你是对话摘要助手。请把【已有摘要】和【新增对话】合并为一份新的对话摘要，供后续对话参考。
+要求：
+- 保留用户的身份、偏好、提出的需求、双方约定的事项和尚未完成的话题
+- 保留工具调用得到的关键结果，去掉寒暄和重复内容
+- 使用第三人称陈述，不要编造对话中没有的信息
+- 只输出摘要正文，不超过{max_chars}字
+"""
+
+def estimate_tokens(text) -> int:
+    """粗略估计token数：中文等非ASCII字符每字按1个计算，ASCII字符每4个按1个计算"""
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return len(text) - ascii_chars + ascii_chars // 4 + 1
 
 
 class Message:
@@ -10,16 +32,75 @@ class Message:
         self.content = content
         self.tool_calls = tool_calls
         self.tool_call_id = tool_call_id
+        self._tokens = None
+
+    @property
+    def tokens(self) -> int:
+        """消息的估计token数，除系统消息外内容不会再修改，首次计算后缓存"""
+        if self._tokens is None or self.role == "system":
+            tokens = estimate_tokens(self.content)
+            if self.tool_calls is not None:
+                tokens += estimate_tokens(json.dumps(self.tool_calls, ensure_ascii=False))
+            self._tokens = tokens
+        return self._tokens
 
 
 class Dialogue:
-    def __init__(self):
+    """
+    对话上下文
+    dialogue保存完整的对话记录(用于保存记忆)，发送给LLM的只是其中的一个窗口：
+    系统提示 + 较早对话的摘要 + 最近的对话原文。超出token预算时按整轮丢弃最早的对话，
+    一轮从用户消息开始，工具调用和工具结果总在同一轮内，不会被拆开
+
+    消息只会追加，每条消息转换成的请求格式和token数在put时计算一次并缓存，
+    只有系统提示(含摘要、记忆)变化时才重新生成系统消息。
+    返回的列表每次都是新的，但其中的消息dict是共享的，使用方不能原地修改
+
+    stable_prefix为True时，记忆、位置、时间等每轮可能变化的信息不再拼进系统提示，
+    而是放在本轮用户消息的前面，使请求的前缀在各轮之间保持不变，可以命中服务端的提示词缓存；
+    只转发最后一条用户消息的LLM会把背景信息当作提问，不能开启，见sends_full_dialogue
+    """
+
+    def __init__(self, max_tokens=0, keep_turns=4):
         self.dialogue: List[Message] = []
         # 获取当前时间
         self.current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # 发送给LLM的上下文token预算，0表示不限制
+        self.max_tokens = max_tokens
+        # 始终保留原文的最近对话轮数
+        self.keep_turns = keep_turns
+        self.summary = ""
+        # dialogue中该位置之前的对话已压缩进摘要
+        self.summary_end = 0
+        self.summarizing = False
+        # 系统提示保持不变，易变的信息放在本轮用户消息中
+        self.stable_prefix = False
+
+        # 与dialogue一一对应的请求格式，系统消息为None
+        self._payload = []
+        # _token_sums[i]为dialogue[:i]中非系统消息的token数之和
+        self._token_sums = [0]
+        # 每轮对话(用户消息)的起始位置
+        self._turn_starts = []
+        self._system_message = None
+        self._system_key = None
+        self._system_payload = None
+        self._system_tokens = 0
 
     def put(self, message: Message):
         self.dialogue.append(message)
+        if message.role == "system":
+            self._payload.append(None)
+            self._token_sums.append(self._token_sums[-1])
+            if self._system_message is None:
+                self._system_message = message
+            return
+        payload = []
+        self.getMessages(message, payload)
+        self._payload.append(payload[0])
+        self._token_sums.append(self._token_sums[-1] + message.tokens)
+        if message.role == "user":
+            self._turn_starts.append(len(self.dialogue) - 1)
 
     def getMessages(self, m, dialogue):
         if m.tool_calls is not None:
@@ -30,43 +111,196 @@ class Dialogue:
             dialogue.append({"role": m.role, "content": m.content})
 
     def get_llm_dialogue(self) -> List[Dict[str, str]]:
-        dialogue = []
-        for m in self.dialogue:
-            self.getMessages(m, dialogue)
-        return dialogue
+        return self.get_llm_dialogue_with_memory()
 
     def update_system_message(self, new_content: str):
         """更新或添加系统消息"""
-        # 查找第一个系统消息
-        system_msg = next((msg for msg in self.dialogue if msg.role == "system"), None)
-        if system_msg:
-            system_msg.content = new_content
+        if self._system_message is not None:
+            self._system_message.content = new_content
         else:
             self.put(Message(role="system", content=new_content))
 
-    def get_llm_dialogue_with_memory(self, memory_str: str = None) -> List[Dict[str, str]]:
-        if memory_str is None or len(memory_str) == 0:
-            return self.get_llm_dialogue()
-        
-        # 构建带记忆的对话
+    def get_llm_dialogue_with_memory(
+        self, memory_str: str = None, context: Dict[str, str] = None
+    ) -> List[Dict[str, str]]:
+        """context为记忆之外的其它背景信息，如{"用户位置": "..."}"""
+        context_items = {}
+        if memory_str:
+            context_items["相关记忆"] = memory_str
+        if context:
+            context_items.update((k, v) for k, v in context.items() if v)
+
+        # 构建带摘要和记忆的对话
         dialogue = []
-        
-        # 添加系统提示和记忆
-        system_message = next(
-            (msg for msg in self.dialogue if msg.role == "system"), None
-        )
 
+        # 添加系统提示、摘要和记忆
+        reserved_tokens = 0
+        if self._system_message is not None:
+            dialogue.append(
+                self._get_system_payload(None if self.stable_prefix else context_items)
+            )
+            reserved_tokens = self._system_tokens
+
+        # 添加窗口内的用户和助手的对话，跳过原始的系统消息
+        context_str = self._format_context(context_items) if self.stable_prefix else ""
+        start = self._window_start(reserved_tokens + estimate_tokens(context_str))
+        dialogue.extend(p for p in self._payload[start:] if p is not None)
+
+        if context_str:
+            self._attach_context(dialogue, context_str)
+        return dialogue
 
-        if system_message:
-            enhanced_system_prompt = (
-                f"{system_message.content}\n\n"
-                f"相关记忆：\n{memory_str}"
+    @staticmethod
+    def _format_context(context_items):
+        return "\n\n".join(f"{k}：\n{v}" for k, v in context_items.items())
+
+    def _attach_context(self, dialogue, context_str):
+        """把易变信息放在本轮用户消息的前面，替换为新的dict，不影响缓存"""
+        for i in range(len(dialogue) - 1, 0, -1):
+            if dialogue[i]["role"] == "user":
+                dialogue[i] = {
+                    "role": "user",
+                    "content": f"[背景信息]\n{context_str}\n\n[用户]\n{dialogue[i]['content']}",
+                }
+                return
+        # 没有用户消息时退回到系统提示中
+        if dialogue and dialogue[0]["role"] == "system":
+            dialogue[0] = {
+                "role": "system",
+                "content": f"{dialogue[0]['content']}\n\n{context_str}",
+            }
+
+    def _get_system_payload(self, context_items=None):
+        context_str = self._format_context(context_items) if context_items else ""
+        key = (self._system_message.content, self.summary, context_str)
+        if key != self._system_key:
+            system_prompt = self._system_message.content
+            if self.summary:
+                system_prompt += f"\n\n对话摘要：\n{self.summary}"
+            if context_str:
+                system_prompt += f"\n\n{context_str}"
+            self._system_key = key
+            self._system_payload = {"role": "system", "content": system_prompt}
+            self._system_tokens = estimate_tokens(system_prompt)
+        return self._system_payload
+
+    def _tokens_between(self, start, end):
+        return self._token_sums[end] - self._token_sums[start]
+
+    def _window_start(self, reserved_tokens=0):
+        """发送给LLM的第一条对话的位置，超出预算时按整轮前移，最近keep_turns轮始终保留"""
+        start = self.summary_end
+        if self.max_tokens <= 0:
+            return start
+        end = len(self.dialogue)
+        total = reserved_tokens + self._tokens_between(start, end)
+        first = bisect.bisect_right(self._turn_starts, start)
+        last = len(self._turn_starts) - max(1, self.keep_turns)
+        for i in range(first, last + 1):
+            if total <= self.max_tokens:
+                break
+            cut = self._turn_starts[i]
+            total -= self._tokens_between(start, cut)
+            start = cut
+        return start
+
+    def _summary_target(self):
+        """未压缩的对话超出预算时，返回本次压缩的结束位置(保留最近keep_turns轮)"""
+        if self.max_tokens <= 0:
+            return None
+        total = self._tokens_between(self.summary_end, len(self.dialogue))
+        if total + estimate_tokens(self.summary) <= self.max_tokens:
+            return None
+        first = bisect.bisect_right(self._turn_starts, self.summary_end)
+        keep_turns = max(1, self.keep_turns)
+        if len(self._turn_starts) - first < keep_turns:
+            return None
+        return self._turn_starts[-keep_turns]
+
+    def need_summary(self) -> bool:
+        return not self.summarizing and self._summary_target() is not None
+
+    async def summarize(self, llm) -> bool:
+        """把超出预算的较早对话合并进摘要，在后台任务中调用，期间窗口仍按原文计算"""
+        end = self._summary_target()
+        if end is None or self.summarizing:
+            return False
+        self.summarizing = True
+        try:
+            lines = []
+            for m in self.dialogue[self.summary_end:end]:
+                if m.role == "user":
+                    lines.append(f"User: {m.content}")
+                elif m.role == "assistant" and m.content:
+                    lines.append(f"Assistant: {m.content}")
+                elif m.role == "tool":
+                    lines.append(f"Tool: {m.content}")
+            user_prompt = (
+                f"【已有摘要】\n{self.summary or '无'}\n\n【新增对话】\n" + "\n".join(lines)
             )
-            dialogue.append({"role": "system", "content": enhanced_system_prompt})
+            # 摘要最多占用四分之一的预算
+            prompt = summary_prompt.format(max_chars=max(100, self.max_tokens // 4))
+            result = await llm.aresponse_no_stream(prompt, user_prompt)
+            if not result or is_error_output(result):
+                return False
+            self.summary = result.strip()
+            self.summary_end = end
+            return True
+        finally:
+            self.summarizing = False
 
-        # 添加用户和助手的对话
-        for m in self.dialogue:
-            if m.role != "system":  # 跳过原始的系统消息
-                self.getMessages(m, dialogue)
 
+def _benchmark(turns=100, rounds=20):
+    """
+    每轮对话构造请求消息的开销：python -m core.utils.dialogue
+    原实现每轮从全部Message重新生成请求格式，并在对话结束时用json.dumps(indent=4)输出调试日志
+    """
+    system_prompt = "我是小智，来自中国台湾省的00后女生，讲话超级机车。" * 10
+    memory_str = '{"时空档案": {"身份图谱": {"现用名": "张三丰"}}}'
+
+    def legacy_dialogue(messages):
+        system_message = next((m for m in messages if m.role == "system"), None)
+        dialogue = [
+            {
+                "role": "system",
+                "content": f"{system_message.content}\n\n相关记忆：\n{memory_str}",
+            }
+        ]
+        for m in messages:
+            if m.role == "system":
+                continue
+            if m.tool_calls is not None:
+                dialogue.append({"role": m.role, "tool_calls": m.tool_calls})
+            elif m.role == "tool":
+                dialogue.append(
+                    {"role": m.role, "tool_call_id": m.tool_call_id, "content": m.content}
+                )
+            else:
+                dialogue.append({"role": m.role, "content": m.content})
         return dialogue
+
+    d = Dialogue()
+    d.update_system_message(system_prompt)
+    for i in range(turns):
+        d.put(Message(role="user", content=f"第{i}个问题，今天天气怎么样？"))
+        d.put(Message(role="assistant", content=f"第{i}个回答，今天北京晴，气温21度。" * 3))
+    assert legacy_dialogue(d.dialogue) == d.get_llm_dialogue_with_memory(memory_str)
+
+    def legacy():
+        legacy_dialogue(d.dialogue)
+        json.dumps(legacy_dialogue(d.dialogue), indent=4, ensure_ascii=False)
+
+    def cached():
+        # 调试日志改为惰性求值，DEBUG关闭时不再序列化
+        d.get_llm_dialogue_with_memory(memory_str)
+
+    for name, func in (("legacy", legacy), ("cached", cached)):
+        start_time = time.perf_counter()
+        for _ in range(rounds):
+            func()
+        elapsed = (time.perf_counter() - start_time) / rounds
+        print(f"{name:<10}{elapsed * 1000:8.3f}ms / 轮，{len(d.dialogue) - 1}条消息")
+
+
+if __name__ == "__main__":
+    _benchmark()
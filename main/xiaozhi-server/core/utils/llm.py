@@ -21,3 +21,10 @@ def create_instance(class_name, *args, **kwargs):
         return sys.modules[lib_name].LLMProvider(*args, **kwargs)
 
     raise ValueError(f"不支持的LLM类型: {class_name}，请检查该配置的type是否设置正确")
+
+
+def create_instance_from_config(llm_type, llm_config, llm_configs):
+    """创建LLM实例，对冲LLM按名称引用其它LLM，需要传入同一份LLM配置"""
+    if llm_type == "hedged":
+        return create_instance(llm_type, llm_config, llm_configs)
+    return create_instance(llm_type, llm_config)
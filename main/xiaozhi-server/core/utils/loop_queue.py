@@ -0,0 +1,35 @@
+import asyncio
+
+
+class LoopQueue:
+    """
+    绑定到事件循环的队列
+    任意线程都可以调用put投递数据，由事件循环中的协程通过await get消费
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._queue = asyncio.Queue()
+
+    def put(self, item):
+        """线程安全地投递数据"""
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    async def get(self):
+        return await self._queue.get()
+
+    def empty(self) -> bool:
+        return self._queue.empty()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def clear(self):
+        """清空队列，只能在事件循环线程中调用"""
+        while not self._queue.empty():
+            try:
+                self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
@@ -0,0 +1,249 @@
+import time
+import ctypes
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import opuslib_next
+from opuslib_next.api import decoder as opus_decoder_api
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+SAMPLE_RATE = 16000
+CHANNELS = 1
+FRAME_SIZE = 960  # 设备上报的opus帧长，16kHz下60ms
+
+INT16_SCALE = np.float32(1.0 / 32768.0)
+
+
+class _CodecPool:
+    """
+    opus编解码器对象池
+    编解码器创建开销较大，用完重置状态后放回池中复用，线程安全
+    """
+
+    def __init__(self, factory, max_size=64):
+        self.factory = factory
+        self.max_size = max_size
+        self._items = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._items:
+                return self._items.pop()
+        return self.factory()
+
+    def release(self, item):
+        item.reset_state()
+        with self._lock:
+            if len(self._items) < self.max_size:
+                self._items.append(item)
+
+
+_decoder_pool = _CodecPool(lambda: opuslib_next.Decoder(SAMPLE_RATE, CHANNELS))
+_encoder_pool = _CodecPool(
+    lambda: opuslib_next.Encoder(SAMPLE_RATE, CHANNELS, opuslib_next.APPLICATION_AUDIO)
+)
+
+
+def acquire_decoder():
+    """取出一个16kHz单声道解码器，用于需要跨多次调用保持状态的场景，用完调用release_decoder"""
+    return _decoder_pool.acquire()
+
+
+def release_decoder(item):
+    _decoder_pool.release(item)
+
+
+@contextmanager
+def decoder():
+    """从池中取出一个16kHz单声道解码器，退出时重置并归还"""
+    item = _decoder_pool.acquire()
+    try:
+        yield item
+    finally:
+        _decoder_pool.release(item)
+
+
+@contextmanager
+def encoder():
+    """从池中取出一个16kHz单声道编码器，退出时重置并归还"""
+    item = _encoder_pool.acquire()
+    try:
+        yield item
+    finally:
+        _encoder_pool.release(item)
+
+
+class CodecStats:
+    """批量解码的累计指标"""
+
+    def __init__(self):
+        self.calls = 0
+        self.packets = 0
+        self.concealed = 0
+        self.dropped = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, packets, concealed, dropped, seconds):
+        with self._lock:
+            self.calls += 1
+            self.packets += packets
+            self.concealed += concealed
+            self.dropped += dropped
+            self.seconds += seconds
+
+    def metrics(self) -> dict:
+        return {
+            "calls": self.calls,
+            "packets": self.packets,
+            "concealed": self.concealed,
+            "dropped": self.dropped,
+            "avg_ms": self.seconds * 1000 / self.calls if self.calls else 0.0,
+        }
+
+
+stats = CodecStats()
+
+# 单独取一个opus_decode函数对象，输出缓冲区按地址传入，
+# 避免每次调用都通过ndarray.ctypes创建ctypes对象
+_libopus_decode = opuslib_next.api.libopus["opus_decode"]
+_libopus_decode.argtypes = (
+    opus_decoder_api.DecoderPointer,
+    ctypes.c_char_p,
+    ctypes.c_int32,
+    ctypes.c_void_p,
+    ctypes.c_int,
+    ctypes.c_int,
+)
+_libopus_decode.restype = ctypes.c_int
+
+
+def decode_opus_into(decoder, opus_packet, out: np.ndarray, frame_size=FRAME_SIZE) -> int:
+    """
+    将一个opus数据包直接解码到预分配的int16数组中，不产生中间bytes对象
+    out必须是连续的int16数组且长度不小于frame_size，返回解码得到的采样点数；
+    opus_packet为None时按丢包处理，由解码器根据前面的音频做丢包补偿(PLC)
+    """
+    return decode_opus_to_address(decoder, opus_packet, out.ctypes.data, frame_size)
+
+
+def decode_opus_to_address(decoder, opus_packet, address: int, frame_size=FRAME_SIZE) -> int:
+    """同decode_opus_into，输出位置直接给出内存地址，供缓存了数组地址的调用方使用"""
+    result = _libopus_decode(
+        decoder.decoder_state,
+        opus_packet,
+        len(opus_packet) if opus_packet else 0,
+        address,
+        frame_size,
+        0,
+    )
+    if result < 0:
+        raise opuslib_next.OpusError(result)
+    return result
+
+
+def decode_packets(
+    opus_packets, frame_size=FRAME_SIZE, out: np.ndarray = None, conceal=False
+) -> np.ndarray:
+    """
+    将一组opus数据包解码为连续的int16 PCM，返回有效部分的视图
+    默认跳过空包和损坏的包，识别用的音频中不加入合成的音频；
+    conceal为True时按丢包处理，用PLC补出等长的音频，保持时间轴连续，供播放使用；
+    out可传入预分配的数组，长度不足时重新分配
+    """
+    start_time = time.perf_counter()
+    size = len(opus_packets) * frame_size
+    if out is None or len(out) < size:
+        out = np.empty(size, dtype=np.int16)
+    pos = 0
+    concealed = 0
+    dropped = 0
+    with decoder() as dec:
+        for opus_packet in opus_packets:
+            frame = out[pos : pos + frame_size]
+            decoded = 0
+            if opus_packet:
+                try:
+                    decoded = decode_opus_into(dec, opus_packet, frame, frame_size)
+                except opuslib_next.OpusError:
+                    pass
+            if not decoded:
+                if not conceal:
+                    dropped += 1
+                    continue
+                concealed += 1
+                decoded = _conceal(dec, frame, frame_size)
+            pos += decoded
+    elapsed = time.perf_counter() - start_time
+    stats.record(len(opus_packets), concealed, dropped, elapsed)
+    if concealed:
+        logger.bind(tag=TAG).debug(f"opus解码: {concealed}/{len(opus_packets)}帧做了丢包补偿")
+    if dropped:
+        logger.bind(tag=TAG).debug(f"opus解码: 跳过{dropped}/{len(opus_packets)}个空包或损坏的包")
+    logger.bind(tag=TAG).debug(
+        f"opus解码{len(opus_packets)}帧耗时: {elapsed * 1000:.2f}ms"
+    )
+    return out[:pos]
+
+
+def _conceal(dec, frame: np.ndarray, frame_size: int) -> int:
+    """丢包补偿，失败时补静音"""
+    try:
+        return decode_opus_into(dec, None, frame, frame_size)
+    except opuslib_next.OpusError:
+        frame[:frame_size] = 0
+        return frame_size
+
+
+def decode_to_float32(opus_packets, frame_size=FRAME_SIZE) -> np.ndarray:
+    """将一组opus数据包解码为[-1, 1]范围的float32采样点"""
+    return pcm_to_float32(decode_packets(opus_packets, frame_size))
+
+
+def pcm_to_float32(pcm: np.ndarray) -> np.ndarray:
+    """int16 PCM换算为[-1, 1]范围的float32采样点"""
+    samples = pcm.astype(np.float32)
+    samples *= INT16_SCALE
+    return samples
+
+
+def _benchmark(packets=1000, rounds=20):
+    """
+    与各ASR原有解码循环的对比测试：python -m core.utils.opus_codec
+    原实现每句话新建解码器，逐包decode得到bytes后再b"".join
+    """
+    pcm = (np.sin(np.arange(FRAME_SIZE * packets) / 20) * 8000).astype(np.int16)
+    with encoder() as enc:
+        opus_packets = [
+            enc.encode(pcm[i : i + FRAME_SIZE].tobytes(), FRAME_SIZE)
+            for i in range(0, len(pcm), FRAME_SIZE)
+        ]
+
+    def legacy():
+        dec = opuslib_next.Decoder(SAMPLE_RATE, CHANNELS)
+        pcm_data = []
+        for opus_packet in opus_packets:
+            pcm_data.append(dec.decode(opus_packet, FRAME_SIZE))
+        return b"".join(pcm_data)
+
+    out = np.empty(len(opus_packets) * FRAME_SIZE, dtype=np.int16)
+    for name, func in (
+        ("legacy", legacy),
+        ("decode_packets", lambda: decode_packets(opus_packets)),
+        ("decode_packets(out)", lambda: decode_packets(opus_packets, out=out)),
+    ):
+        func()
+        start_time = time.perf_counter()
+        for _ in range(rounds):
+            func()
+        elapsed = (time.perf_counter() - start_time) / rounds
+        print(f"{name:<22}{elapsed * 1000:8.2f}ms / {packets}帧")
+
+
+if __name__ == "__main__":
+    _benchmark()
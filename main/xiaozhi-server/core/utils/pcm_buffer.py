@@ -0,0 +1,126 @@
+import numpy as np
+from core.utils.opus_codec import decode_opus_to_address, INT16_SCALE
+
+
+class PCMRingBuffer:
+    """
+    固定容量的PCM缓冲区
+    opus数据直接解码写入int16缓冲区，同时换算到等长的float32缓冲区，
+    按固定长度取出的音频块是float32缓冲区上的视图，不复制数据；
+    尾部空间不足时把未读取的少量数据搬到头部，整个生命周期内不再分配内存。
+    取出的视图在下一次写入前有效
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.pcm = np.zeros(capacity, dtype=np.int16)
+        self.samples = np.zeros(capacity, dtype=np.float32)
+        # pcm的起始地址，解码时按偏移直接写入
+        self._pcm_address = self.pcm.ctypes.data
+        self.read_pos = 0
+        self.write_pos = 0
+
+    def __len__(self):
+        return self.write_pos - self.read_pos
+
+    def decode_into(self, decoder, opus_packet: bytes, frame_size=960) -> int:
+        """解码一个opus数据包写入缓冲区，返回写入的采样点数"""
+        if self.write_pos + frame_size > self.capacity:
+            self._compact()
+        start = self.write_pos
+        written = decode_opus_to_address(
+            decoder,
+            opus_packet,
+            self._pcm_address + start * self.pcm.itemsize,
+            frame_size,
+        )
+        # 先原样转换再原地缩放，int16直接乘float32会额外分配类型转换缓冲区
+        samples = self.samples[start : start + written]
+        samples[...] = self.pcm[start : start + written]
+        samples *= INT16_SCALE
+        self.write_pos += written
+        return written
+
+    def read_chunks(self, chunk_size: int):
+        """取出所有完整的音频块，返回float32视图列表"""
+        chunks = []
+        while self.write_pos - self.read_pos >= chunk_size:
+            chunks.append(self.samples[self.read_pos : self.read_pos + chunk_size])
+            self.read_pos += chunk_size
+        return chunks
+
+    def clear(self):
+        self.read_pos = 0
+        self.write_pos = 0
+
+    def _compact(self):
+        remaining = self.write_pos - self.read_pos
+        if remaining and self.read_pos:
+            self.pcm[:remaining] = self.pcm[self.read_pos : self.write_pos]
+            self.samples[:remaining] = self.samples[self.read_pos : self.write_pos]
+        self.read_pos = 0
+        self.write_pos = remaining
+
+
+def _benchmark(streams=500, seconds=2):
+    """
+    VAD分帧的内存分配对比：python -m core.utils.pcm_buffer
+    模拟streams个连接各自每60ms收到一个opus包，统计每秒临时分配的内存；
+    原实现每个512采样点的音频块都重新切片bytearray，并新建int16和float32数组
+    """
+    import time
+    import tracemalloc
+    import opuslib_next
+    from core.utils import opus_codec
+
+    frame_size = opus_codec.FRAME_SIZE
+    pcm = (np.sin(np.arange(frame_size) / 20) * 8000).astype(np.int16)
+    with opus_codec.encoder() as enc:
+        opus_packet = enc.encode(pcm.tobytes(), frame_size)
+    packets = streams * seconds * 1000 // 60
+
+    def legacy():
+        decoders = [opuslib_next.Decoder(16000, 1) for _ in range(streams)]
+        buffers = [bytearray() for _ in range(streams)]
+
+        def step(i):
+            buffers[i].extend(decoders[i].decode(opus_packet, frame_size))
+            while len(buffers[i]) >= 512 * 2:
+                chunk = buffers[i][: 512 * 2]
+                buffers[i] = buffers[i][512 * 2 :]
+                audio_int16 = np.frombuffer(chunk, dtype=np.int16)
+                audio_int16.astype(np.float32) / 32768.0
+
+        return step
+
+    def ring_buffer():
+        decoders = [opus_codec.acquire_decoder() for _ in range(streams)]
+        buffers = [PCMRingBuffer() for _ in range(streams)]
+
+        def step(i):
+            buffers[i].decode_into(decoders[i], opus_packet, frame_size)
+            buffers[i].read_chunks(512)
+
+        return step
+
+    for name, factory in (("legacy", legacy), ("PCMRingBuffer", ring_buffer)):
+        step = factory()
+        tracemalloc.start()
+        allocated = 0
+        start_time = time.perf_counter()
+        for n in range(packets):
+            # 每个包处理期间的内存峰值减去处理前的占用，即该包产生的临时分配
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            step(n % streams)
+            allocated += tracemalloc.get_traced_memory()[1] - before
+        elapsed = time.perf_counter() - start_time
+        tracemalloc.stop()
+        print(
+            f"{name:<16}{allocated / seconds / 1024:10.1f}KB/秒 临时分配，"
+            f"{streams}路共{packets}包，耗时{elapsed * 1000:.0f}ms(含tracemalloc开销)"
+        )
+
+
+if __name__ == "__main__":
+    _benchmark()
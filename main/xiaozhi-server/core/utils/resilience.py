@@ -0,0 +1,181 @@
+import time
+import random
+import threading
+from collections import deque
+
+import numpy as np
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def backoff_delay(attempt, base=0.2, max_delay=2.0) -> float:
+    """
+    第attempt次重试(从0开始)前的等待秒数：指数退避加随机抖动
+    取上限的一半再加上0~一半的随机值，既保证间隔，又避免多个请求同时重试
+    """
+    ceiling = min(max_delay, base * (2 ** attempt))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class CircuitBreaker:
+    """
+    远程服务的熔断器，多个连接、多个线程共用
+    closed: 正常放行，统计窗口内的错误率和延迟；错误率超过阈值后打开
+    open: 直接拒绝，冷却open_s秒后进入half_open
+    half_open: 只放行一个探测请求，成功则恢复，失败则重新打开并加倍冷却时间
+    """
+
+    def __init__(
+        self,
+        name,
+        window_s=60,
+        min_requests=5,
+        error_rate=0.5,
+        slow_call_ms=0,
+        open_s=10,
+        max_open_s=120,
+    ):
+        self.name = name
+        self.window_s = window_s
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        # 超过该耗时的调用按失败计算，0表示不限制
+        self.slow_call_ms = slow_call_ms
+        self.open_s = open_s
+        self.max_open_s = max_open_s
+        self.state = CLOSED
+        self.opened = 0  # 打开的次数
+        self._calls = deque()  # (时间, 是否成功, 耗时秒)
+        self._open_until = 0.0
+        self._open_duration = open_s
+        self._probe_time = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, name, config):
+        return cls(
+            name,
+            window_s=float(config.get("window_s", 60)),
+            min_requests=int(config.get("min_requests", 5)),
+            error_rate=float(config.get("error_rate", 0.5)),
+            slow_call_ms=float(config.get("slow_call_ms", 0)),
+            open_s=float(config.get("open_s", 10)),
+            max_open_s=float(config.get("max_open_s", 120)),
+        )
+
+    def allow(self) -> bool:
+        """本次是否可以请求，half_open时只有一个请求能拿到探测机会"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if now < self._open_until:
+                    return False
+                self.state = HALF_OPEN
+                self._probe_time = None
+            # 探测请求没有结果(例如被取消)时，超过冷却时间后允许再探测一次
+            if self._probe_time is not None and now - self._probe_time < self._open_duration:
+                return False
+            self._probe_time = now
+            return True
+
+    def available(self) -> bool:
+        """不占用探测机会的检查，冷却中返回False"""
+        with self._lock:
+            return self.state != OPEN or time.monotonic() >= self._open_until
+
+    def record(self, ok, latency):
+        """记录一次调用的结果，latency为耗时(秒)"""
+        if ok and self.slow_call_ms > 0 and latency * 1000 > self.slow_call_ms:
+            ok = False
+        with self._lock:
+            now = time.monotonic()
+            self._calls.append((now, ok, latency))
+            self._trim(now)
+            if self.state == HALF_OPEN:
+                self._probe_time = None
+                if ok:
+                    self.state = CLOSED
+                    self._calls.clear()
+                    self._open_duration = self.open_s
+                    logger.bind(tag=TAG).info(f"{self.name} 探测成功，恢复请求")
+                else:
+                    self._open_duration = min(self.max_open_s, self._open_duration * 2)
+                    self._open(now, "探测失败")
+                return
+            if self.state == OPEN:
+                # 打开之前发出的请求陆续返回，不影响状态
+                return
+            failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            if (
+                len(self._calls) >= self.min_requests
+                and failures / len(self._calls) >= self.error_rate
+            ):
+                self._open(now, "错误率过高")
+
+    def _open(self, now, reason):
+        # 冷却时间加上抖动，避免各进程同时探测
+        duration = self._open_duration * random.uniform(0.9, 1.1)
+        self.state = OPEN
+        self.opened += 1
+        self._open_until = now + duration
+        logger.bind(tag=TAG).warning(
+            f"{self.name} {reason}，熔断{duration:.1f}秒"
+        )
+
+    def _trim(self, now):
+        while self._calls and now - self._calls[0][0] > self.window_s:
+            self._calls.popleft()
+
+    def health(self) -> float:
+        """健康分0~1：窗口内的成功率，打开时为0，探测中减半"""
+        with self._lock:
+            self._trim(time.monotonic())
+            if self.state == OPEN:
+                return 0.0
+            if not self._calls:
+                score = 1.0
+            else:
+                score = sum(1 for _, ok, _ in self._calls if ok) / len(self._calls)
+            return score / 2 if self.state == HALF_OPEN else score
+
+    def metrics(self) -> dict:
+        health = self.health()
+        with self._lock:
+            calls = list(self._calls)
+            state = self.state
+        result = {"state": state, "health": health, "opened": self.opened, "calls": len(calls)}
+        if calls:
+            latencies = [latency * 1000 for _, _, latency in calls]
+            result["error_rate"] = sum(1 for _, ok, _ in calls if not ok) / len(calls)
+            result["avg_ms"] = sum(latencies) / len(latencies)
+            result["p90_ms"] = float(np.percentile(latencies, 90))
+        return result
+
+
+# 按服务名共用熔断器，私有配置重新创建的实例也使用同一个熔断器
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, config) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker.from_config(name, config)
+            _breakers[name] = breaker
+        return breaker
+
+
+def metrics() -> dict:
+    """所有熔断器的状态，用于心跳上报"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.metrics() for breaker in breakers}
@@ -0,0 +1,235 @@
+import time
+
+# 句末标点，遇到后切出一段送去TTS
+SENTENCE_END = set("。？！；：…?!;:.")
+# 逗号类标点，只用于第一段的提前切分
+COMMAS = set("，、,")
+# 西文标点后面必须跟空白或非西文字符才算断句，避免切开小数、时间、缩写等
+ASCII_PUNCTUATION = set(".?!;:,")
+# 断句标点之后紧跟的引号、括号归入当前段
+CLOSING = set("\"'”’」』）)]】》")
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc",
+    "fig", "approx", "inc", "ltd",
+}
+# 只在后面跟数字时才是缩写，如 No. 5；否则按句末处理，如 I said no.
+NUMBER_ABBREVIATIONS = {"no", "nos", "vol", "p", "pp"}
+# 判断小数和缩写时向前查看的字符数，不小于最长的缩写
+LOOKBEHIND = 8
+
+_DEFER = -1
+
+
+class StreamingSegmenter:
+    """
+    LLM流式输出的增量断句器
+    只扫描新到达的字符和前面少量已扫描的字符，未切分的文本以列表保存，切出分段时才拼接，
+    总开销与输出长度成线性关系，即使长时间没有标点也不会重复复制已有文本；
+    第一段可以在逗号处提前切出，让TTS尽早开始合成
+    """
+
+    def __init__(self, min_chars=0, first_comma=True, first_min_chars=4, first_max_chars=0):
+        self.min_chars = min_chars
+        self.first_comma = first_comma
+        self.first_min_chars = first_min_chars
+        # 第一段超过该长度仍没有标点时直接切出，0表示不限制
+        self.first_max_chars = first_max_chars
+        self.segments = 0
+        self.reset()
+
+    def feed(self, token: str) -> list:
+        """送入一个token，返回新切出的分段(保留标点)"""
+        if not token:
+            return []
+        self._parts.append(token)
+        self._length += len(token)
+        # 扫描窗口：已扫描的末尾几个字符 + 等待下一个字符的西文标点 + 新token
+        window = self._context + self._pending + token
+        # 窗口起点在未切分文本中的位置
+        base = self._length - len(window)
+        segments = []
+        start = 0
+        i = len(self._context)
+        while i < len(window):
+            if window[i] in SENTENCE_END or window[i] in COMMAS:
+                end = self._boundary(window, start, i, base + i)
+                if end == _DEFER:
+                    # 西文标点在末尾，要等下一个字符才能判断
+                    break
+                if end is not None:
+                    segments.append(self._cut(base + end))
+                    base = -end
+                    start = i = end
+                    continue
+            i += 1
+        self._pending = window[i:]
+        self._context = window[max(start, i - LOOKBEHIND) : i]
+        if self.segments == 0 and 0 < self.first_max_chars <= self._length:
+            segments.append(self._cut_first())
+        return segments
+
+    def _cut(self, end):
+        """切出未切分文本的前end个字符"""
+        text = "".join(self._parts)
+        self._parts = [text[end:]]
+        self._length -= end
+        self.segments += 1
+        return text[:end]
+
+    def _cut_first(self):
+        """第一段过长时提前切出，西文在最后一个空格处切分，避免切断单词"""
+        text = "".join(self._parts)
+        end = len(text)
+        if text[-1].isascii():
+            space = text.rfind(" ", self.first_min_chars)
+            if space > 0:
+                end = space + 1
+        segment = self._cut(end)
+        rest = self._parts[0]
+        if len(rest) <= len(self._pending):
+            self._pending = rest
+        self._context = rest[: len(rest) - len(self._pending)][-LOOKBEHIND:]
+        return segment
+
+    def flush(self) -> str:
+        """输出结束，返回剩余的文本"""
+        text = "".join(self._parts)
+        if text:
+            self.segments += 1
+        self.reset()
+        return text
+
+    def reset(self):
+        """丢弃未切分的文本"""
+        self._parts = []
+        self._length = 0
+        self._context = ""
+        self._pending = ""
+
+    def _boundary(self, text, start, i, position):
+        """
+        判断text中位置i的标点是否为断句点，是则返回本段在text中的结束位置
+        start为本段在text中的起点(可能早于text的开头)，position为标点在本段中的位置
+        """
+        char = text[i]
+        if char in COMMAS:
+            if not (self.first_comma and self.segments == 0):
+                return None
+            min_chars = self.first_min_chars
+        else:
+            min_chars = self.min_chars
+        if position < min_chars:
+            return None
+
+        if char in ASCII_PUNCTUATION:
+            if i + 1 >= len(text):
+                return _DEFER
+            next_char = text[i + 1]
+            if char in ".,:" and text[i - 1 : i].isdigit() and next_char.isdigit():
+                # 小数、千分位、时间
+                return None
+            if char == ".":
+                abbreviation = self._is_abbreviation(text, start, i)
+                if abbreviation is None:
+                    return _DEFER
+                if abbreviation:
+                    return None
+            if next_char.isascii() and not next_char.isspace() and next_char not in CLOSING:
+                return None
+
+        end = i + 1
+        while end < len(text) and (text[end] in CLOSING or text[end] in SENTENCE_END):
+            end += 1
+        if end >= len(text):
+            # 后面可能还有引号、括号，等下一个字符再切
+            return _DEFER
+        return end
+
+    @staticmethod
+    def _is_abbreviation(text, start, i):
+        """位置i的句点是否属于缩写，还需要等待后面的字符时返回None"""
+        j = i
+        while j > start and (text[j - 1].isalpha() or text[j - 1] == "."):
+            j -= 1
+        word = text[j:i].lower()
+        if word in ABBREVIATIONS:
+            return True
+        if "." in word and all(len(part) == 1 for part in word.split(".")):
+            # 逐字母缩写，如 e.g. i.e. a.m. U.S.
+            return True
+        if word in NUMBER_ABBREVIATIONS:
+            # No. 5 这类缩写要看空格之后的字符
+            if i + 2 >= len(text):
+                return None
+            return text[i + 2].isdigit()
+        return False
+
+
+def _benchmark(repeat=200, rounds=5):
+    """
+    与原有断句方式的对比测试：python -m core.utils.segmenter
+    原实现每个token都拼接全部已输出文本，并在未处理部分中查找最后一个标点
+    """
+    sample = (
+        "好的，我来帮你查一下。今天北京晴，气温21.5度，湿度6%！"
+        "The meeting is at 3:30 p.m. with Dr. Smith, right? "
+        "明天可能会降温；建议多穿点衣服：外套、围巾……"
+    )
+    # 按2~3个字符一个token模拟流式输出
+    tokens = []
+    for _ in range(repeat):
+        pos = 0
+        while pos < len(sample):
+            size = 2 + pos % 2
+            tokens.append(sample[pos : pos + size])
+            pos += size
+
+    def legacy():
+        response_message = []
+        processed_chars = 0
+        segments = []
+        for content in tokens:
+            response_message.append(content)
+            full_text = "".join(response_message)
+            current_text = full_text[processed_chars:]
+            last_punct_pos = -1
+            for punct in ("。", "？", "！", "；", "："):
+                pos = current_text.rfind(punct)
+                if pos > last_punct_pos:
+                    last_punct_pos = pos
+            if last_punct_pos != -1:
+                segments.append(current_text[: last_punct_pos + 1])
+                processed_chars += last_punct_pos + 1
+        segments.append("".join(response_message)[processed_chars:])
+        return segments
+
+    def segmenter():
+        seg = StreamingSegmenter()
+        segments = []
+        for content in tokens:
+            segments.extend(seg.feed(content))
+        segments.append(seg.flush())
+        return segments
+
+    expected = "".join(tokens)
+    for name, func in (("legacy", legacy), ("StreamingSegmenter", segmenter)):
+        segments = func()
+        assert "".join(segments) == expected
+        start_time = time.perf_counter()
+        for _ in range(rounds):
+            func()
+        elapsed = (time.perf_counter() - start_time) / rounds
+        print(
+            f"{name:<20}{elapsed * 1000:8.2f}ms / {len(tokens)}个token，{len(segments)}段"
+        )
+
+    print("示例分段:")
+    seg = StreamingSegmenter()
+    for content in tokens[: len(tokens) // repeat]:
+        for segment in seg.feed(content):
+            print(f"  {segment!r}")
+    print(f"  {seg.flush()!r}")
+
+
+if __name__ == "__main__":
+    _benchmark()
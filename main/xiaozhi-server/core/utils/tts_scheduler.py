@@ -0,0 +1,166 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+# 每轮对话第一段的TTS使用独立的线程池，不与其它连接后续分段的TTS排队
+_priority_executor = None
+_priority_lock = threading.Lock()
+
+
+def get_priority_executor(max_workers=4) -> ThreadPoolExecutor:
+    global _priority_executor
+    with _priority_lock:
+        if _priority_executor is None:
+            _priority_executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="tts-first"
+            )
+        return _priority_executor
+
+
+class FirstAudioStats:
+    """首段语音延迟(说完话到开始播放)的统计，用于上报"""
+
+    def __init__(self, window=500):
+        self.turns = 0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.turns += 1
+            self._samples.append(seconds * 1000)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return {"turns": self.turns}
+        p50, p90 = np.percentile(samples, [50, 90])
+        return {
+            "turns": self.turns,
+            "avg_ms": sum(samples) / len(samples),
+            "p50_ms": float(p50),
+            "p90_ms": float(p90),
+        }
+
+
+stats = FirstAudioStats()
+
+
+class TTSScheduler:
+    """
+    单个连接的TTS调度
+    每轮对话的第一段立即提交到专用线程池；后续分段按顺序提交到连接的线程池，
+    同时合成的分段数不超过lookahead，避免长回复一次占满TTS并发、拖慢其它连接的首段。
+    submit立即返回占位的Future，可以直接放入tts_queue，消费方按顺序等待即可
+    """
+
+    def __init__(self, conn, lookahead=2, priority_workers=4):
+        self.conn = conn
+        self.lookahead = max(1, lookahead)
+        self.priority_workers = priority_workers
+        self.turn_start_time = None
+        self.first_audio_time = None
+        self._submitted = 0
+        self._running = 0
+        self._pending = deque()
+        self._lock = threading.Lock()
+
+    def start_turn(self, start_time=None):
+        """新一轮对话开始，start_time为用户说完话的时间"""
+        with self._lock:
+            self.turn_start_time = start_time or time.time()
+            self.first_audio_time = None
+            self._submitted = 0
+        # 上一轮还没开始合成的分段不再占用TTS并发
+        self.discard_pending()
+
+    def submit(self, text, text_index) -> Future:
+        """提交一段文本的TTS，可以在任意线程中调用"""
+        placeholder = Future()
+        with self._lock:
+            first = self._submitted == 0
+            self._submitted += 1
+            if not first:
+                self._pending.append((placeholder, text, text_index))
+        if first:
+            self._start(
+                get_priority_executor(self.priority_workers), placeholder, text, text_index
+            )
+        else:
+            self._pump()
+        return placeholder
+
+    def discard_pending(self):
+        """丢弃还没开始合成的分段，打断或新一轮对话开始时调用"""
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+        for placeholder, _, _ in pending:
+            # 消费方可能已因等待超时取消了占位Future
+            if not placeholder.done():
+                placeholder.set_exception(RuntimeError("TTS分段已丢弃"))
+
+    def on_audio_start(self):
+        """开始向设备发送音频时调用，记录本轮的首段语音延迟"""
+        if self.turn_start_time is None or self.first_audio_time is not None:
+            return
+        self.first_audio_time = time.time()
+        latency = self.first_audio_time - self.turn_start_time
+        stats.record(latency)
+        logger.bind(tag=TAG).info(f"首段语音延迟: {latency * 1000:.0f}ms")
+
+    def _pump(self):
+        while True:
+            with self._lock:
+                if not self._pending or self._running >= self.lookahead:
+                    return
+                placeholder, text, text_index = self._pending.popleft()
+                self._running += 1
+            self._start(self.conn.executor, placeholder, text, text_index, counted=True)
+
+    def _start(self, executor, placeholder, text, text_index, counted=False):
+        # 置为运行状态后消费方等待超时也无法再取消占位Future，结果总能写入；
+        # 已被取消的分段直接跳过，不再合成
+        if not placeholder.set_running_or_notify_cancel():
+            self._release(counted)
+            return
+        try:
+            if executor is None:
+                raise RuntimeError("连接已关闭")
+            job = executor.submit(self.conn.speak_and_play, text, text_index)
+        except Exception as e:
+            self._finish(placeholder, None, e, counted)
+            return
+        job.add_done_callback(lambda f: self._on_done(f, placeholder, counted))
+
+    def _on_done(self, job, placeholder, counted):
+        if job.cancelled():
+            self._finish(placeholder, None, RuntimeError("TTS任务已取消"), counted)
+        elif job.exception() is not None:
+            self._finish(placeholder, None, job.exception(), counted)
+        else:
+            self._finish(placeholder, job.result(), None, counted)
+
+    def _finish(self, placeholder, result, error, counted):
+        try:
+            if error is not None:
+                placeholder.set_exception(error)
+            else:
+                placeholder.set_result(result)
+        finally:
+            self._release(counted)
+
+    def _release(self, counted):
+        """归还预合成名额，并提交排队中的下一段"""
+        if counted:
+            with self._lock:
+                self._running -= 1
+            self._pump()
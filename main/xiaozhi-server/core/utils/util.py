@@ -4,7 +4,7 @@ import subprocess
 import re
 import requests
 from typing import Dict, Any
-from core.utils import tts, llm, intent, memory, vad, asr
+from core.utils import tts, llm, intent, memory, vad, asr, resilience
 
 TAG = __name__
 
@@ -217,6 +217,37 @@ def extract_json_from_string(input_string):
     return None
 
 
+def attach_resilience(logger, instance, config, module, name, create):
+    """
+    为远程服务挂上熔断器，并按配置中的fallback创建备用服务
+    熔断参数取全局circuit_breaker，服务自己的circuit_breaker优先；create(type, config)用于创建备用服务
+    """
+    module_config = config[module][name]
+    breaker_config = dict(config.get("circuit_breaker") or {})
+    breaker_config.update(module_config.get("circuit_breaker") or {})
+    if not breaker_config.get("enabled", True):
+        return instance
+    instance.breaker = resilience.get_breaker(f"{module}:{name}", breaker_config)
+
+    fallback_name = module_config.get("fallback")
+    if not fallback_name:
+        return instance
+    if fallback_name == name or fallback_name not in config[module]:
+        logger.bind(tag=TAG).error(f"{module}.{name} 的备用服务配置无效: {fallback_name}")
+        return instance
+    fallback_config = config[module][fallback_name]
+    try:
+        fallback = create(fallback_config.get("type", fallback_name), fallback_config)
+    except Exception as e:
+        logger.bind(tag=TAG).error(f"创建备用服务 {module}.{fallback_name} 失败: {e}")
+        return instance
+    # 备用服务只挂熔断器，不再级联备用
+    fallback.breaker = resilience.get_breaker(f"{module}:{fallback_name}", breaker_config)
+    instance.fallback = fallback
+    logger.bind(tag=TAG).info(f"{module}.{name} 的备用服务: {fallback_name}")
+    return instance
+
+
 def initialize_modules(
     logger,
     config: Dict[str, Any],
@@ -246,10 +277,16 @@ def initialize_modules(
             if "type" not in config["TTS"][select_tts_module]
             else config["TTS"][select_tts_module]["type"]
         )
-        modules["tts"] = tts.create_instance(
-            tts_type,
-            config["TTS"][select_tts_module],
-            str(config.get("delete_audio", True)).lower() in ("true", "1", "yes"),
+        delete_audio = str(config.get("delete_audio", True)).lower() in ("true", "1", "yes")
+        modules["tts"] = attach_resilience(
+            logger,
+            tts.create_instance(
+                tts_type, config["TTS"][select_tts_module], delete_audio
+            ),
+            config,
+            "TTS",
+            select_tts_module,
+            lambda t, c: tts.create_instance(t, c, delete_audio),
         )
         logger.bind(tag=TAG).info(f"初始化组件: tts成功 {select_tts_module}")
 
@@ -261,9 +298,17 @@ def initialize_modules(
             if "type" not in config["LLM"][select_llm_module]
             else config["LLM"][select_llm_module]["type"]
         )
-        modules["llm"] = llm.create_instance(
-            llm_type,
-            config["LLM"][select_llm_module],
+        modules["llm"] = attach_resilience(
+            logger,
+            llm.create_instance_from_config(
+                llm_type,
+                config["LLM"][select_llm_module],
+                config["LLM"],
+            ),
+            config,
+            "LLM",
+            select_llm_module,
+            lambda t, c: llm.create_instance_from_config(t, c, config["LLM"]),
         )
         logger.bind(tag=TAG).info(f"初始化组件: llm成功 {select_llm_module}")
 
@@ -289,9 +334,16 @@ def initialize_modules(
             if "type" not in config["Memory"][select_memory_module]
             else config["Memory"][select_memory_module]["type"]
         )
-        modules["memory"] = memory.create_instance(
-            memory_type,
-            config["Memory"][select_memory_module],
+        modules["memory"] = attach_resilience(
+            logger,
+            memory.create_instance(
+                memory_type,
+                config["Memory"][select_memory_module],
+            ),
+            config,
+            "Memory",
+            select_memory_module,
+            memory.create_instance,
         )
         logger.bind(tag=TAG).info(f"初始化组件: memory成功 {select_memory_module}")
 
@@ -317,10 +369,16 @@ def initialize_modules(
             if "type" not in config["ASR"][select_asr_module]
             else config["ASR"][select_asr_module]["type"]
         )
-        modules["asr"] = asr.create_instance(
-            asr_type,
-            config["ASR"][select_asr_module],
-            str(config.get("delete_audio", True)).lower() in ("true", "1", "yes"),
+        delete_audio = str(config.get("delete_audio", True)).lower() in ("true", "1", "yes")
+        modules["asr"] = attach_resilience(
+            logger,
+            asr.create_instance(
+                asr_type, config["ASR"][select_asr_module], delete_audio
+            ),
+            config,
+            "ASR",
+            select_asr_module,
+            lambda t, c: asr.create_instance(t, c, delete_audio),
         )
         logger.bind(tag=TAG).info(f"初始化组件: asr成功 {select_asr_module}")
 
@@ -1,5 +1,6 @@
 import asyncio
 import websockets
+from concurrent.futures import ThreadPoolExecutor
 from config.logger import setup_logging
 from core.connection import ConnectionHandler
 from core.utils.util import get_local_ip, initialize_modules
@@ -8,8 +9,10 @@ TAG = __name__
 
 
 class WebSocketServer:
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, reuse_port: bool = False):
         self.config = config
+        # 多进程模式下各worker通过SO_REUSEPORT监听同一端口
+        self.reuse_port = reuse_port
         self.logger = setup_logging()
         modules = initialize_modules(
             self.logger, self.config, True, True, True, True, True, True
@@ -22,6 +25,19 @@ class WebSocketServer:
         self._memory = modules["memory"]
         self.active_connections = set()
 
+        # asyncio模式下，所有连接共享一个有界线程池执行阻塞的provider调用
+        server_config = self.config["server"]
+        self.pipeline_mode = server_config.get("pipeline_mode", "thread")
+        self.executor = None
+        if self.pipeline_mode == "asyncio":
+            max_workers = int(server_config.get("executor_max_workers", 32))
+            self.executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="xiaozhi-worker"
+            )
+            self.logger.bind(tag=TAG).info(
+                f"连接处理模式: asyncio，共享线程池大小: {max_workers}"
+            )
+
     async def start(self):
         server_config = self.config["server"]
         host = server_config["ip"]
@@ -39,8 +55,17 @@ class WebSocketServer:
         self.logger.bind(tag=TAG).info(
             "=============================================================\n"
         )
-        async with websockets.serve(self._handle_connection, host, port):
-            await asyncio.Future()
+        try:
+            serve_kwargs = {"reuse_port": True} if self.reuse_port else {}
+            async with websockets.serve(
+                self._handle_connection, host, port, **serve_kwargs
+            ):
+                await asyncio.Future()
+        finally:
+            if self.executor:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+            if self._asr is not None:
+                await self._asr.close()
 
     async def _handle_connection(self, websocket):
         """处理新连接，每次创建独立的ConnectionHandler"""
@@ -53,6 +78,7 @@ class WebSocketServer:
             self._tts,
             self._memory,
             self._intent,
+            self.executor,
         )
         self.active_connections.add(handler)
         try:
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+from config.logger import setup_logging
+from core.websocket_server import WebSocketServer
+from core.utils import tts_scheduler, resilience
+from core.providers.llm.base import prompt_cache_stats
+
+TAG = __name__
+
+HEARTBEAT_INTERVAL = 5  # worker上报心跳的间隔(秒)
+# worker心跳中除状态字段外上报的运行指标
+HEALTH_METRICS = ("vad", "first_audio", "prompt_cache", "breakers")
+RESTART_INTERVAL = 5  # 同一个worker两次重启之间的最小间隔(秒)
+
+
+def is_reuse_port_supported():
+    """SO_REUSEPORT负载均衡仅在Linux上可用"""
+    return sys.platform.startswith("linux") and hasattr(socket, "SO_REUSEPORT")
+
+
+class WorkerProcess:
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.process = None
+        self.health_conn = None
+        self.started_at = 0.0
+        self.ready = False
+        self.last_heartbeat = 0.0
+        self.connections = 0
+        self.metrics = {}
+
+
+class WorkerManager:
+    """
+    多进程模式的主进程
+    主进程只负责派生worker进程并监控其健康状态，不加载任何模型；
+    每个worker进程通过SO_REUSEPORT监听同一端口，各自初始化VAD/ASR/LLM/TTS等组件
+    """
+
+    def __init__(self, config: dict, num_workers: int):
+        self.config = config
+        self.num_workers = num_workers
+        self.logger = setup_logging()
+        self.health_timeout = int(
+            config["server"].get("worker_health_timeout", HEARTBEAT_INTERVAL * 6)
+        )
+        # 加载组件期间不上报心跳，超过该时间仍未就绪视为启动卡死
+        self.startup_timeout = int(config["server"].get("worker_startup_timeout", 300))
+        # 主进程定期在日志中输出各worker的健康状态，0表示不输出
+        self.health_log_interval = int(
+            config["server"].get("worker_health_log_interval", 60)
+        )
+        self._health_logged_at = time.time()
+        self.workers = {}
+        self.stopping = False
+        self._ctx = multiprocessing.get_context("fork")
+
+    def run(self):
+        """启动所有worker并阻塞监控，直到收到退出信号"""
+        signal.signal(signal.SIGINT, self._on_signal)
+        signal.signal(signal.SIGTERM, self._on_signal)
+
+        for worker_id in range(self.num_workers):
+            self.workers[worker_id] = WorkerProcess(worker_id)
+            self._spawn(self.workers[worker_id])
+        self.logger.bind(tag=TAG).info(
+            f"多进程模式已启动，worker数量: {self.num_workers}，主进程pid: {os.getpid()}"
+        )
+
+        try:
+            while not self.stopping:
+                conns = [
+                    w.health_conn
+                    for w in self.workers.values()
+                    if w.health_conn is not None
+                ]
+                for conn in wait(conns, timeout=1):
+                    self._receive_health(conn)
+                self._check_workers()
+                self._log_health()
+        finally:
+            self._shutdown()
+
+    def _on_signal(self, signum, frame):
+        self.stopping = True
+
+    def _spawn(self, worker):
+        parent_conn, child_conn = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.config, worker.worker_id, child_conn),
+            name=f"xiaozhi-worker-{worker.worker_id}",
+            daemon=False,
+        )
+        process.start()
+        child_conn.close()
+        if worker.health_conn is not None:
+            worker.health_conn.close()
+        worker.process = process
+        worker.health_conn = parent_conn
+        worker.started_at = time.time()
+        worker.ready = False
+        worker.last_heartbeat = 0.0
+        worker.connections = 0
+        worker.metrics = {}
+        self.logger.bind(tag=TAG).info(
+            f"worker-{worker.worker_id} 已启动，pid: {process.pid}"
+        )
+
+    def _receive_health(self, conn):
+        worker = next(
+            (w for w in self.workers.values() if w.health_conn is conn), None
+        )
+        if worker is None:
+            return
+        try:
+            while conn.poll():
+                message = conn.recv()
+                worker.last_heartbeat = time.time()
+                worker.connections = message.get("connections", 0)
+                worker.metrics = {
+                    key: message[key] for key in HEALTH_METRICS if key in message
+                }
+                if message.get("state") == "ready" and not worker.ready:
+                    worker.ready = True
+                    self.logger.bind(tag=TAG).info(
+                        f"worker-{worker.worker_id} 组件加载完成，开始接收连接"
+                    )
+        except (EOFError, OSError):
+            # worker已退出，管道关闭，由_check_workers负责重启
+            worker.health_conn.close()
+            worker.health_conn = None
+
+    def _check_workers(self):
+        now = time.time()
+        for worker in self.workers.values():
+            if self.stopping:
+                return
+            process = worker.process
+            if process is not None and process.is_alive():
+                if worker.ready:
+                    hung = now - worker.last_heartbeat > self.health_timeout
+                    reason = "心跳超时"
+                else:
+                    # 加载组件时卡死的worker不会就绪，也不会上报心跳
+                    hung = now - worker.started_at > self.startup_timeout
+                    reason = "启动超时"
+                if not hung:
+                    continue
+                self.logger.bind(tag=TAG).error(
+                    f"worker-{worker.worker_id} {reason}，强制重启"
+                )
+                process.kill()
+                process.join()
+            if now - worker.started_at < RESTART_INTERVAL:
+                continue
+            if process is not None:
+                self.logger.bind(tag=TAG).error(
+                    f"worker-{worker.worker_id} 已退出，退出码: {process.exitcode}，正在重启"
+                )
+            self._spawn(worker)
+
+    def _shutdown(self):
+        self.logger.bind(tag=TAG).info("正在关闭所有worker进程...")
+        for worker in self.workers.values():
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self.workers.values():
+            if worker.process is None:
+                continue
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            if worker.health_conn is not None:
+                worker.health_conn.close()
+
+    def health(self):
+        """当前各worker的健康状态"""
+        return {
+            worker.worker_id: {
+                "pid": worker.process.pid if worker.process else None,
+                "alive": worker.process is not None and worker.process.is_alive(),
+                "ready": worker.ready,
+                "connections": worker.connections,
+                "last_heartbeat": worker.last_heartbeat,
+                **worker.metrics,
+            }
+            for worker in self.workers.values()
+        }
+
+    def _log_health(self):
+        if self.health_log_interval <= 0:
+            return
+        now = time.time()
+        if now - self._health_logged_at < self.health_log_interval:
+            return
+        self._health_logged_at = now
+        self.logger.bind(tag=TAG).info(
+            f"worker健康状态: {json.dumps(self.health(), ensure_ascii=False)}"
+        )
+
+
+def _worker_main(config, worker_id, health_conn):
+    """worker进程入口"""
+    # 主进程的信号处理不应被继承，worker在自己的事件循环中处理退出信号
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        asyncio.run(_run_worker(config, worker_id, health_conn))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger = setup_logging()
+        logger.bind(tag=TAG).error(
+            f"worker-{worker_id} 运行出错: {e}\n{traceback.format_exc()}"
+        )
+        sys.exit(1)
+    finally:
+        health_conn.close()
+
+
+async def _run_worker(config, worker_id, health_conn):
+    logger = setup_logging()
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+    loop.add_signal_handler(signal.SIGINT, stop_event.set)
+    loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+
+    ws_server = WebSocketServer(config, reuse_port=True)
+    ws_task = asyncio.create_task(ws_server.start())
+    _report_health(health_conn, worker_id, ws_server, "ready")
+
+    try:
+        while not stop_event.is_set() and not ws_task.done():
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            _report_health(health_conn, worker_id, ws_server, "running")
+    finally:
+        if ws_task.done():
+            # 服务异常退出时抛出异常，让主进程重启该worker
+            ws_task.result()
+        ws_task.cancel()
+        try:
+            await ws_task
+        except asyncio.CancelledError:
+            pass
+        logger.bind(tag=TAG).info(f"worker-{worker_id} 已退出")
+
+
+def _report_health(health_conn, worker_id, ws_server, state):
+    try:
+        health_conn.send(
+            {
+                "worker_id": worker_id,
+                "pid": os.getpid(),
+                "state": state,
+                "connections": len(ws_server.active_connections),
+                "vad": ws_server._vad.get_metrics(),
+                "first_audio": tts_scheduler.stats.metrics(),
+                "prompt_cache": prompt_cache_stats.metrics(),
+                "breakers": resilience.metrics(),
+                "time": time.time(),
+            }
+        )
+    except (BrokenPipeError, OSError):
+        pass
@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import asyncio
+
+import numpy as np
+import opuslib_next
+import pytest
+
+# 测试从xiaozhi-server目录导入core、config等模块
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+# config_loader会解析命令行参数，不能让它看到pytest自己的参数
+sys.argv = sys.argv[:1]
+
+FRAME_SIZE = 960  # 设备上报的opus帧长，16kHz下60ms
+
+
+@pytest.fixture
+def encode_frames():
+    """返回编码函数：encode_frames(count)编码count帧正弦波，返回opus数据包列表"""
+
+    def encode(count):
+        pcm = (np.sin(np.arange(FRAME_SIZE * count) / 20) * 8000).astype(np.int16)
+        enc = opuslib_next.Encoder(16000, 1, opuslib_next.APPLICATION_AUDIO)
+        return [
+            enc.encode(pcm[i : i + FRAME_SIZE].tobytes(), FRAME_SIZE)
+            for i in range(0, len(pcm), FRAME_SIZE)
+        ]
+
+    return encode
+
+
+@pytest.fixture
+def reference_pcm():
+    """返回对照解码函数：新建解码器，用opuslib_next自带的decode逐包解码后拼接"""
+
+    def decode(opus_packets):
+        dec = opuslib_next.Decoder(16000, 1)
+        return np.frombuffer(
+            b"".join(dec.decode(packet, FRAME_SIZE) for packet in opus_packets),
+            dtype=np.int16,
+        )
+
+    return decode
+
+
+class FakeOpenAIServer:
+    """
+    本地的假OpenAI兼容服务，chat/completions按SSE流式返回
+    等待first_token_delay秒后输出第一个chunk，之后每隔interval秒输出一个；
+    客户端提前断开时计入disconnected，完整输出时计入completed
+    """
+
+    def __init__(self, first_token_delay=0.0, chunks=("你好，", "我是测试服务。"), interval=0.0):
+        self.first_token_delay = first_token_delay
+        self.chunks = chunks
+        self.interval = interval
+        self.requests = 0
+        self.completed = 0
+        self.disconnected = 0
+        self.server = None
+        self.base_url = None
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/v1"
+        return self
+
+    async def __aexit__(self, *args):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def llm_config(self):
+        return {
+            "type": "openai",
+            "base_url": self.base_url,
+            "model_name": "fake",
+            "api_key": "fake-key",
+        }
+
+    async def handle(self, reader, writer):
+        try:
+            await self.respond(reader, writer)
+        except ConnectionError:
+            self.disconnected += 1
+        finally:
+            writer.close()
+
+    async def respond(self, reader, writer):
+        header = await reader.readuntil(b"\r\n\r\n")
+        length = 0
+        for line in header.decode().split("\r\n"):
+            if line.lower().startswith("content-length:"):
+                length = int(line.split(":")[1])
+        await reader.readexactly(length)
+        self.requests += 1
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        await writer.drain()
+        # 客户端关闭连接时read返回空
+        closed = asyncio.ensure_future(reader.read())
+        try:
+            delays = [self.first_token_delay] + [self.interval] * (len(self.chunks) - 1)
+            for delay, text in zip(delays, self.chunks):
+                await asyncio.wait([closed], timeout=delay)
+                if closed.done():
+                    self.disconnected += 1
+                    return
+                chunk = {
+                    "id": "1",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": "fake",
+                    "choices": [{"index": 0, "delta": {"content": text}}],
+                }
+                writer.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+                await writer.drain()
+            writer.write(b"data: [DONE]\n\n")
+            await writer.drain()
+            self.completed += 1
+        finally:
+            closed.cancel()
+
+
+@pytest.fixture
+def fake_openai_server():
+    """返回FakeOpenAIServer类，测试中用async with启动"""
+    return FakeOpenAIServer
@@ -0,0 +1,144 @@
+import time
+import asyncio
+
+import numpy as np
+import pytest
+
+from core.utils import asr_pool
+from core.utils.asr_pool import ASRProcessPool, ProcessPoolASR
+from core.providers.asr.base import ASRProviderBase
+
+
+class LengthASR(ASRProviderBase):
+    """返回采样点数的ASR，音频以满幅采样点开头时模拟卡死的模型"""
+
+    supports_transcribe = True
+
+    def __init__(self, config, delete_audio_file):
+        super().__init__(config)
+        # 模拟加载较慢的模型
+        time.sleep(config.get("load_delay", 0))
+
+    async def speech_to_text(self, opus_data, session_id):
+        return "", None
+
+    def transcribe(self, samples):
+        if samples[0] > 0.99:
+            time.sleep(600)
+        return str(len(samples))
+
+
+class UnsupportedASR(LengthASR):
+    supports_transcribe = False
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    monkeypatch.setattr(asr_pool, "RESTART_INTERVAL", 0)
+    pools = []
+
+    def make(**config):
+        pool = ASRProcessPool("length", LengthASR, config, num_workers=1, slot_seconds=1)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+@pytest.fixture
+def pool(make_pool):
+    return make_pool()
+
+
+def speech(samples):
+    return np.arange(samples, dtype=np.int16) % 100
+
+
+def hang():
+    return np.full(1600, 32767, dtype=np.int16)
+
+
+async def wait_restarted(pool):
+    worker = pool.workers[0]
+    for _ in range(100):
+        if worker.ready and not worker.killed:
+            return
+        await asyncio.sleep(0.1)
+    raise AssertionError("worker没有重启")
+
+
+def test_pool_transcribes_in_worker(pool):
+    async def run():
+        results = await asyncio.gather(
+            *(pool.transcribe(speech(n), 30) for n in (1600, 3200, 4800))
+        )
+        # 超过槽位长度的音频被截断
+        results.append(await pool.transcribe(speech(20000), 30))
+        return results
+
+    assert asyncio.run(run()) == ["1600", "3200", "4800", "16000"]
+    assert sorted(pool._free_slots) == list(range(pool.num_slots))
+
+
+def test_hung_worker_is_killed_and_restarted(pool):
+    async def run():
+        await pool.transcribe(speech(1600), 30)
+        first_pid = pool.workers[0].process.pid
+        # 卡死的次数超过槽位数，之后的请求也不会一直等待槽位
+        for _ in range(pool.num_slots + 1):
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.transcribe(hang(), 1)
+            await wait_restarted(pool)
+        text = await pool.transcribe(speech(1600), 30)
+        return first_pid, text
+
+    first_pid, text = asyncio.run(run())
+    assert text == "1600"
+    assert pool.workers[0].process.pid != first_pid
+    assert sorted(pool._free_slots) == list(range(pool.num_slots))
+
+
+def test_requests_queued_during_load_do_not_kill_the_worker(make_pool):
+    pool = make_pool(load_delay=2)
+
+    async def run():
+        pid = pool.workers[0].process.pid
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.transcribe(speech(1600), 0.5)
+        await wait_restarted(pool)
+        text = await pool.transcribe(speech(3200), 30)
+        # 加载期间排队的请求在加载完成后照常识别，槽位随之释放
+        for _ in range(100):
+            if len(pool._free_slots) == pool.num_slots:
+                break
+            await asyncio.sleep(0.01)
+        return pid, text
+
+    pid, text = asyncio.run(run())
+    assert text == "3200"
+    assert pool.workers[0].process.pid == pid
+    assert sorted(pool._free_slots) == list(range(pool.num_slots))
+
+
+def test_ready_workers_are_preferred():
+    pool = ASRProcessPool.__new__(ASRProcessPool)
+    pool.workers = [asr_pool._PoolWorker(i) for i in range(3)]
+    for worker, (ready, outstanding) in zip(pool.workers, [(False, 0), (True, 3), (True, 2)]):
+        worker.result_conn = object()
+        worker.ready = ready
+        worker.outstanding = outstanding
+    assert pool._select_worker() is pool.workers[2]
+
+    pool.workers[2].killed = True
+    assert pool._select_worker() is pool.workers[1]
+
+    # 都在加载时交给排队最少的worker
+    pool.workers[1].ready = False
+    assert pool._select_worker() is pool.workers[0]
+
+
+def test_process_pool_requires_transcribe_capability():
+    with pytest.raises(ValueError):
+        ProcessPoolASR("unsupported", UnsupportedASR, {"process_workers": 1})
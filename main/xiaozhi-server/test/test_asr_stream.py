@@ -0,0 +1,49 @@
+import asyncio
+
+from core.providers.asr.base import ASRProviderBase
+
+
+class CountingASR(ASRProviderBase):
+    def __init__(self, config):
+        super().__init__(config)
+        self.requests = []
+
+    async def speech_to_text(self, opus_data, session_id):
+        self.requests.append(list(opus_data))
+        return f"{len(opus_data)}帧", None
+
+
+def create_provider():
+    return CountingASR({"stream_min_chunk_ms": 120, "stream_pause_ms": 60})
+
+
+def test_chunks_are_submitted_at_pauses():
+    provider = create_provider()
+
+    async def run():
+        stream = provider.start_stream("test")
+        for opus_packet, is_voice in ((b"a", True), (b"b", True), (b"c", False), (b"d", True)):
+            await provider.feed(stream, opus_packet, is_voice)
+        return await provider.finish(stream)
+
+    assert asyncio.run(run()) == ("3帧1帧", None)
+    assert provider.requests == [[b"a", b"b", b"c"], [b"d"]]
+
+
+def test_finish_without_new_audio_makes_no_request():
+    provider = create_provider()
+
+    async def run():
+        stream = provider.start_stream("test")
+        for opus_packet, is_voice in ((b"a", True), (b"b", True), (b"c", False)):
+            await provider.feed(stream, opus_packet, is_voice)
+        # 停顿处已经提交了全部音频
+        await asyncio.sleep(0)
+        first = await provider.finish(stream)
+        empty = await provider.finish(provider.start_stream("test"))
+        return first, empty
+
+    first, empty = asyncio.run(run())
+    assert first == ("3帧", None)
+    assert empty == ("", None)
+    assert provider.requests == [[b"a", b"b", b"c"]]
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from core.utils import llm as llm_utils
+from core.utils.dialogue import Dialogue, Message
+from core.providers.llm.base import sends_full_dialogue
+
+MEMORY = "用户喜欢猫"
+
+
+@pytest.fixture(autouse=True)
+def server_dir(monkeypatch):
+    # create_instance按相对路径查找LLM实现
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_dialogue(stable_prefix):
+    dialogue = Dialogue()
+    dialogue.stable_prefix = stable_prefix
+    dialogue.update_system_message("你是小智")
+    dialogue.put(Message(role="user", content="你好"))
+    dialogue.put(Message(role="assistant", content="你好呀"))
+    dialogue.put(Message(role="user", content="我喜欢什么"))
+    return dialogue
+
+
+def create_dify():
+    return llm_utils.create_instance("dify", {"api_key": "test"})
+
+
+def test_stable_prefix_keeps_system_message_unchanged():
+    dialogue = make_dialogue(stable_prefix=True)
+    messages = dialogue.get_llm_dialogue_with_memory(MEMORY, {"当前时间": "12:00"})
+    assert messages[0] == {"role": "system", "content": "你是小智"}
+    assert MEMORY in messages[-1]["content"]
+    assert messages[-1]["content"].endswith("我喜欢什么")
+    # 记录的用户消息和之后各轮发送的历史消息不带背景信息
+    assert dialogue.dialogue[-1].content == "我喜欢什么"
+    assert dialogue.get_llm_dialogue()[-1]["content"] == "我喜欢什么"
+
+
+def test_last_message_providers_do_not_use_stable_prefix(fake_openai_server):
+    dify = create_dify()
+    assert not sends_full_dialogue(dify)
+
+    # 背景信息放在系统提示中，转发给dify的提问只有用户的原话
+    dialogue = make_dialogue(stable_prefix=False)
+    messages = dialogue.get_llm_dialogue_with_memory(MEMORY, {"当前时间": "12:00"})
+    assert MEMORY in messages[0]["content"]
+    assert dify._build_request("test", messages)["query"] == "我喜欢什么"
+
+    openai = llm_utils.create_instance("openai", fake_openai_server().llm_config())
+    assert sends_full_dialogue(openai)
+    openai.fallback = dify
+    assert not sends_full_dialogue(openai)
+
+
+def test_hedged_with_a_last_message_provider(fake_openai_server):
+    configs = {
+        "OpenAILLM": fake_openai_server().llm_config(),
+        "DifyLLM": {"type": "dify", "api_key": "test"},
+    }
+    hedged = llm_utils.create_instance_from_config(
+        "hedged", {"type": "hedged", "providers": ["OpenAILLM"]}, configs
+    )
+    assert sends_full_dialogue(hedged)
+    hedged = llm_utils.create_instance_from_config(
+        "hedged", {"type": "hedged", "providers": ["OpenAILLM", "DifyLLM"]}, configs
+    )
+    assert not sends_full_dialogue(hedged)
@@ -0,0 +1,231 @@
+"""
+豆包流式识别对本地假服务的测试
+假服务按parse_response解析的二进制帧格式实现：首包返回参数确认，之后每个音频包返回一次识别结果，
+收到负序号的尾包时返回整句结果并以负序号结束
+"""
+import gzip
+import json
+import socket
+import asyncio
+
+import websockets
+
+from core.utils import opus_codec
+from core.providers.asr import doubao
+from core.utils.resilience import CircuitBreaker, OPEN
+
+FINAL_TEXT = "今天天气怎么样"
+
+
+def server_response(payload: dict) -> bytes:
+    """服务端完整响应：4字节头 + 4字节负载长度 + gzip压缩的JSON"""
+    body = gzip.compress(json.dumps(payload).encode())
+    header = bytes(
+        [
+            (0b0001 << 4) | 1,
+            (doubao.SERVER_FULL_RESPONSE << 4) | doubao.NO_SEQUENCE,
+            (doubao.JSON << 4) | doubao.GZIP,
+            0,
+        ]
+    )
+    return header + len(body).to_bytes(4, "big", signed=True) + body
+
+
+def parse_client_request(message: bytes):
+    """解析客户端请求，返回(消息类型, 标志位, 解压后的负载)"""
+    header_size = message[0] & 0x0F
+    message_type = message[1] >> 4
+    flags = message[1] & 0x0F
+    payload = message[header_size * 4 :]
+    size = int.from_bytes(payload[:4], "big")
+    return message_type, flags, gzip.decompress(payload[4 : 4 + size])
+
+
+class FakeDoubaoServer:
+    def __init__(self, code=1000):
+        self.code = code
+        self.connections = 0
+        self.requests = []  # 每个会话首包中的识别参数
+        self.audio = []  # 每个会话收到的音频
+        self.server = None
+        self.url = None
+
+    async def __aenter__(self):
+        self.server = await websockets.serve(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *args):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, websocket):
+        self.connections += 1
+        try:
+            message_type, _, payload = parse_client_request(await websocket.recv())
+        except websockets.ConnectionClosed:
+            # 预建的会话在测试结束时被关闭
+            return
+        assert message_type == doubao.CLIENT_FULL_REQUEST
+        self.requests.append(json.loads(payload))
+        await websocket.send(server_response({"code": self.code, "sequence": 1}))
+        if self.code != 1000:
+            return
+
+        audio = bytearray()
+        sequence = 1
+        async for message in websocket:
+            message_type, flags, payload = parse_client_request(message)
+            assert message_type == doubao.CLIENT_AUDIO_ONLY_REQUEST
+            audio += payload
+            sequence += 1
+            last = flags == doubao.NEG_SEQUENCE
+            text = FINAL_TEXT if last else FINAL_TEXT[: sequence]
+            await websocket.send(
+                server_response(
+                    {
+                        "code": 1000,
+                        "sequence": -sequence if last else sequence,
+                        "result": [{"text": text}],
+                    }
+                )
+            )
+            if last:
+                break
+        self.audio.append(bytes(audio))
+
+
+def create_provider(url, tmp_path, **config):
+    return doubao.ASRProvider(
+        {
+            "appid": "test",
+            "cluster": "test",
+            "access_token": "test",
+            "output_dir": str(tmp_path),
+            "ws_url": url,
+            "streaming": True,
+            "stream_chunk_ms": 120,
+            **config,
+        },
+        delete_audio_file=True,
+    )
+
+
+async def stream_utterance(provider, opus_packets):
+    stream = provider.start_stream("test")
+    for opus_packet in opus_packets:
+        await provider.feed(stream, opus_packet)
+    return stream, await provider.finish(stream)
+
+
+def test_streaming_session_sends_raw_pcm(tmp_path, encode_frames):
+    opus_packets = encode_frames(10)
+
+    async def run():
+        async with FakeDoubaoServer() as server:
+            provider = create_provider(server.url, tmp_path)
+            stream, (text, _) = await stream_utterance(provider, opus_packets)
+            return server, stream, text
+
+    server, stream, text = asyncio.run(run())
+    assert text == FINAL_TEXT
+    assert server.requests[0]["audio"]["format"] == "raw"
+    # 说话过程中就分包发送，收到的是逐帧解码的原始PCM
+    assert server.audio[0] == opus_codec.decode_packets(opus_packets).tobytes()
+    assert stream.decoder is None
+
+
+def test_prewarmed_session_is_reused(tmp_path, encode_frames):
+    opus_packets = encode_frames(4)
+
+    async def run():
+        async with FakeDoubaoServer() as server:
+            provider = create_provider(server.url, tmp_path, prewarm_sessions=1)
+            _, (first, _) = await stream_utterance(provider, opus_packets)
+            # 等待后台补充的会话建立
+            for _ in range(100):
+                if provider.session_pool._idle:
+                    break
+                await asyncio.sleep(0.01)
+            connections = server.connections
+            _, (second, _) = await stream_utterance(provider, opus_packets)
+            return server, connections, first, second
+
+    server, connections, first, second = asyncio.run(run())
+    assert first == second == FINAL_TEXT
+    # 第一句现建一个会话并补充一个预建会话，第二句直接使用预建的会话
+    assert connections == 2
+    assert len(server.audio) == 2
+
+
+def test_whole_utterance_request(tmp_path, encode_frames):
+    opus_packets = encode_frames(5)
+
+    async def run():
+        async with FakeDoubaoServer() as server:
+            provider = create_provider(server.url, tmp_path, streaming=False)
+            result = await provider.speech_to_text(opus_packets, "test")
+            return server, result
+
+    server, (text, _) = asyncio.run(run())
+    assert text == FINAL_TEXT
+    assert server.requests[0]["audio"]["format"] == "wav"
+
+
+def test_session_error_falls_back_to_whole_utterance(tmp_path, encode_frames):
+    opus_packets = encode_frames(4)
+
+    async def run():
+        async with FakeDoubaoServer(code=1001) as server:
+            provider = create_provider(server.url, tmp_path)
+            _, (text, _) = await stream_utterance(provider, opus_packets)
+            return server, text
+
+    server, text = asyncio.run(run())
+    # 流式会话被拒绝，整句识别同样失败，最终返回空文本
+    assert text == ""
+    assert [r["audio"]["format"] for r in server.requests] == ["raw", "wav"]
+
+
+def test_refused_connection_opens_breaker(tmp_path, encode_frames):
+    # 先占用一个端口再关闭，连接该端口会被拒绝
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    opus_packets = encode_frames(4)
+    provider = create_provider(f"ws://127.0.0.1:{port}", tmp_path, streaming=False)
+    provider.breaker = CircuitBreaker("asr:doubao", min_requests=2, error_rate=0.5)
+
+    async def run():
+        text, _ = await provider.speech_to_text(opus_packets, "test")
+        assert text is None
+        for _ in range(2):
+            text, _ = await provider.speech_to_text_guarded(opus_packets, "test")
+            assert text == ""
+
+    asyncio.run(run())
+    assert provider.breaker.state == OPEN
+    assert not provider.breaker.allow()
+
+
+def test_cancel_closes_the_session_in_background(tmp_path, encode_frames):
+    opus_packets = encode_frames(4)
+
+    async def run():
+        async with FakeDoubaoServer() as server:
+            provider = create_provider(server.url, tmp_path)
+            stream = provider.start_stream("test")
+            for opus_packet in opus_packets:
+                await provider.feed(stream, opus_packet)
+            provider.cancel(stream)
+            # 关闭任务在完成前一直被引用
+            assert len(provider._closing_tasks) == 1
+            await asyncio.gather(*provider._closing_tasks)
+            await asyncio.sleep(0)
+            return provider, stream
+
+    provider, stream = asyncio.run(run())
+    assert not provider._closing_tasks
+    assert stream.decoder is None
+    assert stream.websocket.state is websockets.protocol.State.CLOSED
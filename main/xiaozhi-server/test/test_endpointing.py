@@ -0,0 +1,142 @@
+import types
+
+import pytest
+
+from core.providers.vad import base
+from core.providers.vad.base import EndpointController, VADProviderBase, VADSession
+
+
+def make_controller(**config):
+    config = {
+        "adaptive_endpointing": True,
+        "endpoint_min_silence_ms": 400,
+        "endpoint_max_silence_ms": 1200,
+        "endpoint_pause_percentile": 90,
+        "endpoint_margin_ms": 150,
+        "endpoint_min_pause_ms": 150,
+        "endpoint_min_samples": 3,
+        "endpoint_truncation_window_ms": 1000,
+        "endpoint_truncation_step_ms": 150,
+        "endpoint_punctuation_factor": 0.6,
+        **config,
+    }
+    return EndpointController(config, 800)
+
+
+def test_disabled_uses_default_threshold():
+    controller = make_controller(adaptive_endpointing=False)
+    session = VADSession()
+    for pause in (300, 300, 300):
+        controller.on_pause(session, pause)
+    controller.on_endpoint(session, 1000, 800)
+    assert controller.threshold(session) == 800
+    assert not controller.awaiting_truncation(session, 1000)
+    assert controller.metrics()["endpoints"] == 0
+
+
+def test_default_until_enough_pauses():
+    controller = make_controller()
+    session = VADSession()
+    assert controller.threshold(session) == 800
+    controller.on_pause(session, 300)
+    controller.on_pause(session, 300)
+    assert controller.threshold(session) == 800
+    # 音节间隙不计为停顿
+    controller.on_pause(session, 100)
+    assert controller.threshold(session) == 800
+    controller.on_pause(session, 300)
+    assert controller.threshold(session) == 450
+
+
+def test_threshold_follows_pause_percentile_within_bounds():
+    controller = make_controller()
+    session = VADSession()
+    for pause in (200, 200, 200):
+        controller.on_pause(session, pause)
+    assert controller.threshold(session) == 400
+    for pause in (2000, 2000, 2000):
+        controller.on_pause(session, pause)
+    assert controller.threshold(session) == 1200
+
+
+def test_sentence_final_shortens_threshold():
+    controller = make_controller()
+    session = VADSession()
+    session.sentence_final = True
+    assert controller.threshold(session) == pytest.approx(480)
+    for pause in (200, 200, 200):
+        controller.on_pause(session, pause)
+    # 缩短后仍不低于下限
+    assert controller.threshold(session) == 400
+
+
+def test_truncation_raises_threshold_and_late_speech_decays_it():
+    controller = make_controller()
+    session = VADSession()
+    controller.on_endpoint(session, 10_000, 800)
+    assert controller.awaiting_truncation(session, 10_500)
+    controller.on_speech_start(session, 10_500)
+    assert controller.threshold(session) == 950
+    assert not controller.awaiting_truncation(session, 10_600)
+
+    controller.on_endpoint(session, 20_000, 950)
+    controller.on_speech_start(session, 20_300)
+    assert controller.threshold(session) == 1100
+
+    controller.on_endpoint(session, 30_000, 1100)
+    assert not controller.awaiting_truncation(session, 31_000)
+    controller.on_speech_start(session, 35_000)
+    assert session.endpoint_bonus_ms == 150
+    assert controller.threshold(session) == 950
+
+    metrics = controller.metrics()
+    assert metrics["endpoints"] == 3
+    assert metrics["truncations"] == 2
+
+
+def test_noise_endpoint_is_not_a_truncation():
+    controller = make_controller()
+    session = VADSession()
+    controller.on_endpoint(session, 10_000, 800)
+    controller.discard_endpoint(session)
+    assert not controller.awaiting_truncation(session, 10_200)
+    controller.on_speech_start(session, 10_200)
+    assert controller.threshold(session) == 800
+    assert controller.metrics()["truncations"] == 0
+
+
+class FakeVAD(VADProviderBase):
+    def is_vad(self, conn, data):
+        return False
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=100.0)
+    monkeypatch.setattr(base, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def test_voice_state_reports_truncation(clock):
+    vad = FakeVAD(
+        {
+            "adaptive_endpointing": True,
+            "min_silence_duration_ms": 800,
+            "endpoint_truncation_window_ms": 1000,
+            "endpoint_truncation_step_ms": 150,
+        }
+    )
+    session = VADSession()
+
+    vad._update_voice_state(session, 0.9)
+    clock.now += 0.9
+    vad._update_voice_state(session, 0.1)
+    assert session.voice_stop
+    session.reset()
+
+    # 本轮对话处理期间用户紧接着继续说话
+    clock.now += 0.3
+    assert vad.endpointing.awaiting_truncation(session, clock.now * 1000)
+    vad._update_voice_state(session, 0.9)
+    assert vad.endpointing.metrics()["truncations"] == 1
+    assert vad.endpointing.threshold(session) == 950
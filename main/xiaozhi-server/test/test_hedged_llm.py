@@ -0,0 +1,105 @@
+import os
+import asyncio
+
+import pytest
+
+from core.utils import llm as llm_utils
+
+DIALOGUE = [{"role": "user", "content": "你好"}]
+
+
+@pytest.fixture(autouse=True)
+def server_dir(monkeypatch):
+    # create_instance按相对路径查找LLM实现
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def ask(hedged):
+    return "".join([token async for token in hedged.aresponse("test", DIALOGUE)])
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_hedge_fires_cancels_loser_and_reorders(fake_openai_server):
+    async def main():
+        async with fake_openai_server(
+            first_token_delay=1.0, chunks=("慢服务。",)
+        ) as slow, fake_openai_server(
+            first_token_delay=0.05, chunks=("快服务。",)
+        ) as fast:
+            llm_configs = {"SlowLLM": slow.llm_config(), "FastLLM": fast.llm_config()}
+            hedged = llm_utils.create_instance_from_config(
+                "hedged",
+                {
+                    "type": "hedged",
+                    "providers": ["SlowLLM", "FastLLM"],
+                    "hedge_delay_ms": 150,
+                    "min_samples": 2,
+                },
+                llm_configs,
+            )
+
+            for i in range(2):
+                assert [name for name, _ in hedged.get_order()] == ["SlowLLM", "FastLLM"]
+                # 慢服务超过hedge_delay没有首字，对冲请求快服务
+                assert await ask(hedged) == "快服务。"
+                assert fast.requests == i + 1
+                # 落败的请求被取消，连接随之断开
+                await wait_for(lambda: slow.disconnected == i + 1)
+            assert slow.completed == 0
+
+            metrics = hedged.get_metrics()
+            # 被取消的等待只是下限，不计入实际延迟
+            assert metrics["SlowLLM"]["samples"] == 0
+            assert metrics["SlowLLM"]["censored"] == 2
+            assert metrics["FastLLM"]["samples"] == 2
+
+            assert [name for name, _ in hedged.get_order()] == ["FastLLM", "SlowLLM"]
+            assert await ask(hedged) == "快服务。"
+            # 快服务在hedge_delay内输出了首字，不再请求慢服务
+            assert slow.requests == 2
+
+    asyncio.run(main())
+
+
+def test_backup_cancelled_early_is_not_moved_to_front(fake_openai_server):
+    async def main():
+        async with fake_openai_server(
+            first_token_delay=0.25, chunks=("主服务。",)
+        ) as primary, fake_openai_server(
+            first_token_delay=1.0, chunks=("备用服务。",)
+        ) as backup:
+            llm_configs = {
+                "PrimaryLLM": primary.llm_config(),
+                "BackupLLM": backup.llm_config(),
+            }
+            hedged = llm_utils.create_instance_from_config(
+                "hedged",
+                {
+                    "type": "hedged",
+                    "providers": ["PrimaryLLM", "BackupLLM"],
+                    "hedge_delay_ms": 150,
+                    "min_samples": 2,
+                },
+                llm_configs,
+            )
+            for _ in range(4):
+                # 备用请求发起约100ms后就被取消，这个下限不能让它排到主服务前面
+                assert [name for name, _ in hedged.get_order()] == ["PrimaryLLM", "BackupLLM"]
+                assert await ask(hedged) == "主服务。"
+            assert backup.requests == 4
+            assert backup.completed == 0
+
+    asyncio.run(main())
+
+
+def test_referenced_config_must_exist():
+    with pytest.raises(ValueError):
+        llm_utils.create_instance_from_config(
+            "hedged", {"type": "hedged", "providers": ["MissingLLM"]}, {}
+        )
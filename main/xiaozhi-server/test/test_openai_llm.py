@@ -0,0 +1,42 @@
+import asyncio
+
+from core.providers.llm.openai.openai import LLMProvider
+
+DIALOGUE = [{"role": "user", "content": "你好"}]
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_aresponse_streams_all_chunks(fake_openai_server):
+    async def main():
+        async with fake_openai_server() as server:
+            llm = LLMProvider(server.llm_config())
+            text = "".join([token async for token in llm.aresponse("test", DIALOGUE)])
+        assert text == "你好，我是测试服务。"
+        assert server.completed == 1
+
+    asyncio.run(main())
+
+
+def test_closing_aresponse_early_closes_the_stream(fake_openai_server):
+    async def main():
+        chunks = [f"第{i}段。" for i in range(50)]
+        async with fake_openai_server(chunks=chunks, interval=0.05) as server:
+            llm = LLMProvider(server.llm_config())
+            for call in (
+                lambda: llm.aresponse("test", DIALOGUE),
+                lambda: llm.aresponse_with_functions("test", DIALOGUE, None),
+            ):
+                generator = call()
+                await generator.__anext__()
+                # 打断时chat()只关闭外层生成器，HTTP响应也要随之关闭
+                await generator.aclose()
+            await wait_for(lambda: server.disconnected == 2)
+        assert server.completed == 0
+
+    asyncio.run(main())
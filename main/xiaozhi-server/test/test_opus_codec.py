@@ -0,0 +1,84 @@
+import asyncio
+
+import numpy as np
+
+from core.utils import opus_codec
+from core.providers.asr.base import PCMStream
+
+FRAME_SIZE = opus_codec.FRAME_SIZE
+
+
+def test_decode_packets_matches_legacy_loop(encode_frames, reference_pcm):
+    opus_packets = encode_frames(10)
+    pcm = opus_codec.decode_packets(opus_packets)
+    assert pcm.dtype == np.int16
+    assert np.array_equal(pcm, reference_pcm(opus_packets))
+
+
+def test_decode_packets_reuses_out_array(encode_frames, reference_pcm):
+    opus_packets = encode_frames(4)
+    out = np.empty(FRAME_SIZE * 8, dtype=np.int16)
+    pcm = opus_codec.decode_packets(opus_packets, out=out)
+    assert pcm.base is out
+    assert np.array_equal(pcm, reference_pcm(opus_packets))
+
+
+def test_decode_opus_into_writes_at_offset(encode_frames, reference_pcm):
+    opus_packet = encode_frames(1)[0]
+    out = np.zeros(FRAME_SIZE * 3, dtype=np.int16)
+    with opus_codec.decoder() as dec:
+        samples = opus_codec.decode_opus_into(
+            dec, opus_packet, out[FRAME_SIZE : FRAME_SIZE * 2]
+        )
+    assert samples == FRAME_SIZE
+    assert not out[:FRAME_SIZE].any() and not out[FRAME_SIZE * 2 :].any()
+    assert np.array_equal(out[FRAME_SIZE : FRAME_SIZE * 2], reference_pcm([opus_packet]))
+
+
+def test_lost_and_corrupt_packets_are_skipped(encode_frames, reference_pcm):
+    opus_packets = encode_frames(6)
+    lossy = list(opus_packets)
+    lossy[2] = b""
+    lossy[4] = b"\xff\xff\xff"
+    dropped_before = opus_codec.stats.dropped
+    pcm = opus_codec.decode_packets(lossy)
+    # 识别用的音频不加入合成的音频，与逐包跳过的结果一致
+    assert len(pcm) == 4 * FRAME_SIZE
+    assert opus_codec.stats.dropped - dropped_before == 2
+    expected = reference_pcm([p for i, p in enumerate(opus_packets) if i not in (2, 4)])
+    assert np.array_equal(pcm, expected)
+
+
+def test_lost_and_corrupt_packets_are_concealed(encode_frames, reference_pcm):
+    opus_packets = encode_frames(6)
+    opus_packets[2] = b""
+    opus_packets[4] = b"\xff\xff\xff"
+    concealed_before = opus_codec.stats.concealed
+    pcm = opus_codec.decode_packets(opus_packets, conceal=True)
+    # 时间轴保持连续，丢失的帧用PLC补齐
+    assert len(pcm) == len(opus_packets) * FRAME_SIZE
+    assert opus_codec.stats.concealed - concealed_before == 2
+    expected = reference_pcm(opus_packets[:2])
+    assert np.array_equal(pcm[: FRAME_SIZE * 2], expected)
+
+
+def test_pooled_decoder_state_is_reset(encode_frames):
+    opus_packets = encode_frames(3)
+    first = opus_codec.decode_packets(opus_packets).copy()
+    # 第二次会从池中取到用过的解码器，结果必须和新解码器一致
+    second = opus_codec.decode_packets(opus_packets)
+    assert np.array_equal(first, second)
+
+
+def test_pcm_stream_decode(encode_frames, reference_pcm):
+    opus_packets = encode_frames(3)
+    stream = PCMStream("test")
+    try:
+        for opus_packet in opus_packets:
+            stream.decode(opus_packet)
+        chunk = stream.take_pcm()
+    finally:
+        asyncio.run(stream.close())
+    assert np.array_equal(np.frombuffer(chunk, dtype=np.int16), reference_pcm(opus_packets))
+    assert stream.take_pcm() == b""
+    assert stream.decoder is None
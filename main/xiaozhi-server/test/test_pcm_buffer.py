@@ -0,0 +1,50 @@
+import numpy as np
+import opuslib_next
+
+from core.utils.pcm_buffer import PCMRingBuffer
+
+FRAME_SIZE = 960
+
+
+def test_decode_into_matches_reference_decoder(encode_frames, reference_pcm):
+    opus_packets = encode_frames(1)
+    buffer = PCMRingBuffer()
+    dec = opuslib_next.Decoder(16000, 1)
+    written = buffer.decode_into(dec, opus_packets[0], FRAME_SIZE)
+
+    expected = reference_pcm(opus_packets)
+    assert written == FRAME_SIZE
+    assert len(buffer) == FRAME_SIZE
+    assert np.array_equal(buffer.pcm[:written], expected)
+    # 非静音，确认确实解码出了音频
+    assert np.abs(expected).max() > 1000
+    np.testing.assert_allclose(buffer.samples[:written], expected / 32768.0, rtol=1e-6)
+
+
+def test_chunks_are_views_and_survive_compaction(encode_frames, reference_pcm):
+    opus_packets = encode_frames(20)
+    expected = reference_pcm(opus_packets) / 32768.0
+    # 容量只比一帧略大，每写入一帧都要把剩余数据搬到头部
+    buffer = PCMRingBuffer(capacity=FRAME_SIZE + 512)
+    dec = opuslib_next.Decoder(16000, 1)
+    chunks = []
+    for opus_packet in opus_packets:
+        buffer.decode_into(dec, opus_packet, FRAME_SIZE)
+        for chunk in buffer.read_chunks(512):
+            assert chunk.base is buffer.samples or chunk.base is buffer.samples.base
+            assert chunk.dtype == np.float32
+            # 视图只在下一次写入前有效，这里先复制出来
+            chunks.append(chunk.copy())
+
+    decoded = np.concatenate(chunks)
+    assert len(decoded) == len(expected) // 512 * 512
+    np.testing.assert_allclose(decoded, expected[: len(decoded)], rtol=1e-6)
+    assert len(buffer) == len(expected) - len(decoded)
+
+
+def test_clear_resets_positions(encode_frames):
+    buffer = PCMRingBuffer()
+    buffer.decode_into(opuslib_next.Decoder(16000, 1), encode_frames(1)[0], FRAME_SIZE)
+    buffer.clear()
+    assert len(buffer) == 0
+    assert buffer.read_chunks(512) == []
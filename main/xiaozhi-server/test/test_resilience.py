@@ -0,0 +1,247 @@
+import asyncio
+import types
+
+import pytest
+
+from core.utils import resilience
+from core.utils.resilience import CircuitBreaker, backoff_delay, CLOSED, OPEN, HALF_OPEN
+from core.providers.asr.base import ASRProviderBase
+from core.providers.memory.base import MemoryProviderBase
+from core.providers.memory.mem0ai.mem0ai import MemoryProvider as Mem0Provider
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    # 只替换resilience模块看到的time和random，不影响事件循环
+    monkeypatch.setattr(resilience, "time", clock)
+    monkeypatch.setattr(
+        resilience, "random", types.SimpleNamespace(uniform=lambda a, b: (a + b) / 2)
+    )
+    return clock
+
+
+def make_breaker(**config):
+    config = {"window_s": 60, "min_requests": 4, "error_rate": 0.5, "open_s": 10, "max_open_s": 35, **config}
+    return CircuitBreaker("test", **config)
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.min_requests):
+        assert breaker.allow()
+        breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+
+
+def test_opens_when_error_rate_reached(clock):
+    breaker = make_breaker()
+    for ok in (True, False, True):
+        breaker.record(ok, 0.1)
+    # 请求数不足min_requests时不打开
+    assert breaker.state == CLOSED
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+    assert breaker.opened == 1
+    assert not breaker.allow()
+    assert breaker.health() == 0.0
+
+
+def test_old_failures_leave_the_window(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record(False, 0.1)
+    clock.advance(61)
+    breaker.record(False, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.metrics()["calls"] == 1
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = make_breaker(slow_call_ms=500)
+    for _ in range(4):
+        breaker.record(True, 0.6)
+    assert breaker.state == OPEN
+
+
+def test_half_open_allows_a_single_probe(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+    clock.advance(9.9)
+    assert not breaker.allow()
+    assert not breaker.available()
+    clock.advance(0.2)
+    assert breaker.available()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # 探测请求还没有结果，其它请求继续被拒绝
+    assert not breaker.allow()
+
+
+def test_probe_without_result_times_out(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+    clock.advance(10)
+    assert breaker.allow()
+    # 探测请求被取消，没有调用record；冷却时间过后允许再探测一次
+    clock.advance(9)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow()
+
+
+def test_probe_success_closes_and_resets_cooldown(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+    clock.advance(10)
+    assert breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+    clock.advance(20)
+    assert breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+    # 恢复后冷却时间回到open_s
+    open_breaker(breaker)
+    clock.advance(10)
+    assert breaker.allow()
+
+
+def test_probe_failure_doubles_cooldown_up_to_max(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+    for cooldown in (10, 20, 35, 35):
+        clock.advance(cooldown - 0.1)
+        assert not breaker.allow()
+        clock.advance(0.1)
+        assert breaker.allow()
+        breaker.record(False, 0.1)
+        assert breaker.state == OPEN
+    assert breaker.opened == 5
+
+
+def test_late_results_while_open_are_ignored(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+    breaker.record(True, 0.1)
+    assert breaker.state == OPEN
+    clock.advance(10)
+    assert breaker.allow()
+
+
+def test_backoff_delay_bounds(monkeypatch):
+    monkeypatch.setattr(resilience, "random", types.SimpleNamespace(uniform=lambda a, b: a))
+    assert [backoff_delay(n) for n in range(5)] == pytest.approx([0.1, 0.2, 0.4, 0.8, 1.0])
+    monkeypatch.setattr(resilience, "random", types.SimpleNamespace(uniform=lambda a, b: b))
+    assert [backoff_delay(n) for n in range(5)] == pytest.approx([0.2, 0.4, 0.8, 1.6, 2.0])
+    assert backoff_delay(10, base=1, max_delay=5) == pytest.approx(5)
+
+
+class FakeMem0Client:
+    def __init__(self):
+        self.fail = True
+
+    def search(self, query, **kwargs):
+        if self.fail:
+            raise ConnectionError("mem0 unreachable")
+        return {"results": [{"updated_at": "2026-01-01T08:00:00.000", "memory": "喜欢猫"}]}
+
+    def add(self, messages, **kwargs):
+        if self.fail:
+            raise ConnectionError("mem0 unreachable")
+        return {"id": "1"}
+
+
+class LocalMemory(MemoryProviderBase):
+    async def save_memory(self, msgs):
+        return "saved"
+
+    async def query_memory(self, query):
+        return "本地记忆"
+
+
+def make_mem0(client):
+    # 不经过构造函数，避免MemoryClient联网校验api_key
+    provider = Mem0Provider.__new__(Mem0Provider)
+    MemoryProviderBase.__init__(provider, {})
+    provider.use_mem0 = True
+    provider.api_version = "v1.1"
+    provider.client = client
+    return provider
+
+
+def test_mem0_failures_open_the_memory_breaker(clock):
+    client = FakeMem0Client()
+    provider = make_mem0(client)
+    provider.breaker = make_breaker()
+    message = types.SimpleNamespace(role="user", content="你好")
+
+    async def main():
+        for _ in range(2):
+            assert await provider.query_memory_guarded("猫") == ""
+            assert await provider.save_memory_guarded([message, message]) is None
+        assert provider.breaker.state == OPEN
+
+        # 熔断期间改用备用记忆服务
+        provider.fallback = LocalMemory({})
+        assert await provider.query_memory_guarded("猫") == "本地记忆"
+
+        clock.advance(10)
+        client.fail = False
+        assert await provider.query_memory_guarded("猫") == "- [2026-01-01 08:00:00] 喜欢猫"
+        assert provider.breaker.state == CLOSED
+
+    asyncio.run(main())
+
+
+class FailingASR(ASRProviderBase):
+    def __init__(self, config):
+        super().__init__(config)
+        self.calls = 0
+
+    async def speech_to_text(self, opus_data, session_id):
+        self.calls += 1
+        raise ConnectionError("asr unreachable")
+
+
+class LocalASR(ASRProviderBase):
+    async def speech_to_text(self, opus_data, session_id):
+        return f"{len(opus_data)}帧", None
+
+
+def test_streaming_chunks_go_through_the_asr_breaker(clock):
+    provider = FailingASR({"stream_min_chunk_ms": 120, "stream_pause_ms": 60})
+    provider.breaker = make_breaker()
+
+    async def utterance():
+        stream = provider.start_stream("test")
+        await provider.feed(stream, b"voice", True)
+        await provider.feed(stream, b"voice", True)
+        # 停顿处切出第一段，剩下的在finish时提交
+        await provider.feed(stream, b"pause", False)
+        await provider.feed(stream, b"voice", True)
+        return await provider.finish(stream)
+
+    async def main():
+        for _ in range(2):
+            assert await utterance() == ("", None)
+        assert provider.breaker.state == OPEN
+        calls = provider.calls
+
+        # 熔断期间分段不再发给故障的ASR，改用备用ASR
+        provider.fallback = LocalASR({})
+        assert await utterance() == ("3帧1帧", None)
+        assert provider.calls == calls
+
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+import pytest
+
+from core.utils.segmenter import StreamingSegmenter
+
+
+def segment(text, step=1, **config):
+    """按step个字符一个token送入断句器，返回全部分段(含flush的剩余部分)"""
+    segmenter = StreamingSegmenter(**config)
+    segments = []
+    for i in range(0, len(text), step):
+        segments.extend(segmenter.feed(text[i : i + step]))
+    rest = segmenter.flush()
+    if rest:
+        segments.append(rest)
+    return segments
+
+
+@pytest.mark.parametrize("step", [1, 2, 3, 100])
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("今天晴。明天雨！", ["今天晴。", "明天雨！"]),
+        ("气温21.5度。湿度6%", ["气温21.5度。", "湿度6%"]),
+        ("共有1,000人。", ["共有1,000人。"]),
+        ("The meeting is at 3:30 today. OK", ["The meeting is at 3:30 today.", " OK"]),
+        ("Ask Dr. Smith, e.g. now. Done", ["Ask Dr. Smith, e.g. now.", " Done"]),
+        ("See No. 5 please. Bye", ["See No. 5 please.", " Bye"]),
+        ("So do I. Then we go.", ["So do I.", " Then we go."]),
+        ("I said no. OK then.", ["I said no.", " OK then."]),
+        ("Plan A. Next step.", ["Plan A.", " Next step."]),
+        ('He said "hi." Then left.', ['He said "hi."', " Then left."]),
+        ("它说：“好的。”然后走了。", ["它说：", "“好的。”", "然后走了。"]),
+        ("真的吗？！好吧……", ["真的吗？！", "好吧……"]),
+        ("version1.2is out", ["version1.2is out"]),
+    ],
+)
+def test_sentence_boundaries(text, expected, step):
+    assert segment(text, step, first_comma=False) == expected
+
+
+def test_ascii_punctuation_waits_for_next_character():
+    segmenter = StreamingSegmenter(first_comma=False)
+    # 句点在token末尾时可能是小数点，不能立即切分
+    assert segmenter.feed("Pi is 3.") == []
+    assert segmenter.feed("14. Next") == ["Pi is 3.14."]
+    assert segmenter.flush() == " Next"
+
+
+def test_first_segment_cut_at_comma():
+    segments = segment("好的，我来帮你查一下，稍等。然后，再说。", first_min_chars=2)
+    # 只有第一段在逗号处提前切出
+    assert segments == ["好的，", "我来帮你查一下，稍等。", "然后，再说。"]
+
+
+def test_first_comma_respects_min_chars():
+    assert segment("好，我来帮你查一下。", first_min_chars=4) == ["好，我来帮你查一下。"]
+
+
+def test_first_max_chars_cuts_long_first_segment():
+    segments = segment("hello world this is long. Next.", step=2, first_max_chars=12)
+    assert segments[0] == "hello world "
+    assert segments[1:] == ["this is long.", " Next."]
+    assert segment("一二三四五六七八九十。", first_max_chars=4)[0] == "一二三四"
+
+
+def test_min_chars_merges_short_sentences():
+    assert segment("好。我来查一下。", min_chars=3, first_comma=False) == ["好。我来查一下。"]
+
+
+@pytest.mark.parametrize("step", [1, 2, 5, 7])
+def test_segments_rejoin_to_input(step):
+    text = (
+        "好的，我来帮你查一下。今天北京晴，气温21.5度，湿度6%！"
+        "The meeting is at 3:30 p.m. with Dr. Smith, right? "
+        "明天可能会降温；建议多穿点衣服：外套、围巾……“注意保暖。”"
+    ) * 3
+    segments = segment(text, step, first_max_chars=20)
+    assert "".join(segments) == text
+    assert len(segments) > 10
+
+
+def test_long_run_without_punctuation_is_not_recopied():
+    segmenter = StreamingSegmenter()
+    for _ in range(1000):
+        assert segmenter.feed("没有标点") == []
+    # 未切分的文本按token保存，扫描窗口只包含末尾几个字符
+    assert len(segmenter._parts) == 1000
+    assert len(segmenter._context) <= 8
+    assert segmenter.flush() == "没有标点" * 1000
+
+
+def test_reset_discards_pending_text():
+    segmenter = StreamingSegmenter()
+    segmenter.feed("说到一半")
+    segmenter.reset()
+    assert segmenter.feed("新的一句。下") == ["新的一句。"]
@@ -0,0 +1,319 @@
+"""
+腾讯云语音识别对本地假服务的测试
+一句话识别的假服务是一个保持连接的HTTP服务，按TC3-HMAC-SHA256校验签名；
+实时识别的假服务按腾讯云的协议先返回握手结果，之后每收到一包音频返回一次中间结果，
+收到{"type": "end"}后返回final=1
+"""
+import json
+import base64
+import hashlib
+import hmac
+import asyncio
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import websockets
+
+from core.utils import opus_codec
+from core.providers.asr import tencent
+
+SECRET_ID = "test-id"
+SECRET_KEY = "test-key"
+SENTENCE_TEXT = "一句话识别结果"
+REALTIME_TEXT = ["今天天气", "怎么样"]
+
+
+def tc3_signature(timestamp, date, body):
+    """按腾讯云文档独立计算一句话识别请求的签名"""
+
+    def sign(key, msg):
+        return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+    canonical_request = "\n".join(
+        [
+            "POST",
+            "/",
+            "",
+            "content-type:application/json; charset=utf-8\n"
+            "host:asr.tencentcloudapi.com\n"
+            "x-tc-action:sentencerecognition\n",
+            "content-type;host;x-tc-action",
+            hashlib.sha256(body).hexdigest(),
+        ]
+    )
+    string_to_sign = "\n".join(
+        [
+            "TC3-HMAC-SHA256",
+            timestamp,
+            f"{date}/asr/tc3_request",
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ]
+    )
+    key = sign(f"TC3{SECRET_KEY}".encode("utf-8"), date)
+    key = sign(key, "asr")
+    key = sign(key, "tc3_request")
+    return hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class FakeSentenceAPI:
+    """一句话识别接口，同一个连接上可以处理多个请求"""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = []  # 每个请求的(请求头, 请求体JSON)
+        self.server = None
+        self.url = None
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/"
+        return self
+
+    async def __aexit__(self, *args):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    return
+                lines = head.decode().split("\r\n")
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                writer.write(self.respond(headers, body))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def respond(self, headers, body):
+        self.requests.append((headers, json.loads(body)))
+        credential = dict(
+            part.strip().split("=", 1)
+            for part in headers["authorization"].split(" ", 1)[1].split(",")
+        )
+        date = credential["Credential"].split("/")[1]
+        expected = tc3_signature(headers["x-tc-timestamp"], date, body)
+        if credential["Signature"] != expected:
+            payload = {"Response": {"Error": {"Code": "AuthFailure", "Message": "签名错误"}}}
+        else:
+            payload = {"Response": {"Result": SENTENCE_TEXT, "RequestId": "1"}}
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        return (
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            + f"Content-Length: {len(data)}\r\n\r\n".encode()
+            + data
+        )
+
+
+class FakeRealtimeServer:
+    def __init__(self, code=0):
+        self.code = code
+        self.paths = []
+        self.audio = []  # 每个会话收到的PCM
+        self.server = None
+        self.url = None
+
+    async def __aenter__(self):
+        self.server = await websockets.serve(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}/asr/v2/"
+        return self
+
+    async def __aexit__(self, *args):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, websocket):
+        path = websocket.request.path
+        self.paths.append(path)
+        if not self.signature_valid(path):
+            await websocket.send(json.dumps({"code": 4002, "message": "签名错误"}))
+            return
+        await websocket.send(json.dumps({"code": self.code, "message": "success"}))
+        if self.code != 0:
+            return
+        audio = bytearray()
+        packets = 0
+        async for message in websocket:
+            if isinstance(message, str):
+                assert json.loads(message) == {"type": "end"}
+                result = {"index": 1, "voice_text_str": REALTIME_TEXT[1], "slice_type": 2}
+                await websocket.send(json.dumps({"code": 0, "result": result, "final": 1}))
+                break
+            audio.extend(message)
+            packets += 1
+            # 第一句的中间结果逐步变长，后面的结果覆盖前面的
+            text = REALTIME_TEXT[0][: packets * 2]
+            result = {"index": 0, "voice_text_str": text, "slice_type": 1}
+            await websocket.send(json.dumps({"code": 0, "result": result}))
+        self.audio.append(bytes(audio))
+
+    def signature_valid(self, path):
+        """签名为对不含协议头、不含signature参数的地址做HMAC-SHA1"""
+        unsigned, signature = path.rsplit("&signature=", 1)
+        netloc = urlsplit(self.url).netloc
+        expected = base64.b64encode(
+            hmac.new(
+                SECRET_KEY.encode("utf-8"),
+                f"{netloc}{unsigned}".encode("utf-8"),
+                hashlib.sha1,
+            ).digest()
+        ).decode("utf-8")
+        return unquote(signature) == expected
+
+
+def create_provider(tmp_path, api_url, ws_url="ws://127.0.0.1:1/asr/v2/", **config):
+    return tencent.ASRProvider(
+        {
+            "appid": "1250000000",
+            "secret_id": SECRET_ID,
+            "secret_key": SECRET_KEY,
+            "output_dir": str(tmp_path),
+            "api_url": api_url,
+            "ws_url": ws_url,
+            "stream_chunk_ms": 120,
+            **config,
+        },
+        delete_audio_file=True,
+    )
+
+
+async def stream_utterance(provider, opus_packets, wait_partial=False):
+    stream = provider.start_stream("test")
+    for opus_packet in opus_packets:
+        await provider.feed(stream, opus_packet)
+    # 等待说话过程中返回的中间结果
+    for _ in range(100 if wait_partial else 0):
+        if provider.partial_text(stream) == REALTIME_TEXT[0]:
+            break
+        await asyncio.sleep(0.01)
+    partial = provider.partial_text(stream)
+    return partial, await provider.finish(stream)
+
+
+def test_sentence_recognition_reuses_connection(tmp_path, encode_frames):
+    opus_packets = encode_frames(5)
+
+    async def run():
+        async with FakeSentenceAPI() as api:
+            provider = create_provider(tmp_path, api.url)
+            results = [await provider.speech_to_text(opus_packets, "test") for _ in range(3)]
+            client = provider._client
+            await provider.close()
+            assert client.is_closed and provider._client is None
+            return api, results
+
+    api, results = asyncio.run(run())
+    assert [text for text, _ in results] == [SENTENCE_TEXT] * 3
+    # 共用的HTTP客户端保持连接，三次请求只建一个连接
+    assert api.connections == 1
+    headers, body = api.requests[0]
+    assert headers["x-tc-action"] == "SentenceRecognition"
+    assert body["VoiceFormat"] == "pcm"
+    pcm = opus_codec.decode_packets(opus_packets).tobytes()
+    assert base64.b64decode(body["Data"]) == pcm
+
+
+def test_signing_key_is_cached_per_day(tmp_path, monkeypatch):
+    provider = create_provider(tmp_path, "http://127.0.0.1:1/")
+    derivations = []
+    original = provider._hmac_sha256
+
+    def counting_hmac(key, data):
+        if isinstance(key, str) and key.startswith("TC3"):
+            derivations.append(data)
+        return original(key, data)
+
+    monkeypatch.setattr(provider, "_hmac_sha256", counting_hmac)
+    first = provider._get_signing_key("2026-10-16", "asr")
+    assert provider._get_signing_key("2026-10-16", "asr") is first
+    provider._get_auth_headers("{}")
+    provider._get_auth_headers("{}")
+    # 同一天只派生一次，日期变化后重新派生
+    today = derivations[-1]
+    assert derivations.count("2026-10-16") == 1 and derivations.count(today) == 1
+    assert provider._get_signing_key("2026-10-17", "asr") != first
+    assert derivations[-1] == "2026-10-17"
+
+
+def test_wrong_signature_is_rejected(tmp_path, encode_frames):
+    async def run():
+        async with FakeSentenceAPI() as api:
+            provider = create_provider(tmp_path, api.url)
+            # 错误的缓存密钥会得到错误的签名
+            today = tencent.datetime.now(tencent.timezone.utc).strftime("%Y-%m-%d")
+            provider._signing_key = (today, b"x")
+            result = await provider.speech_to_text(encode_frames(2), "test")
+            await provider.close()
+            return result
+
+    text, _ = asyncio.run(run())
+    assert text is None
+
+
+def test_realtime_stream(tmp_path, encode_frames):
+    opus_packets = encode_frames(10)
+
+    async def run():
+        async with FakeRealtimeServer() as server, FakeSentenceAPI() as api:
+            provider = create_provider(tmp_path, api.url, server.url, streaming=True)
+            partial, (text, _) = await stream_utterance(
+                provider, opus_packets, wait_partial=True
+            )
+            return server, api, partial, text
+
+    server, api, partial, text = asyncio.run(run())
+    assert text == "".join(REALTIME_TEXT)
+    assert partial == REALTIME_TEXT[0]
+    assert len(server.paths) == 1
+    params = dict(parse_qsl(server.paths[0].split("?", 1)[1]))
+    assert params["secretid"] == SECRET_ID and params["voice_format"] == "1"
+    # 说话过程中就分包发送逐帧解码的PCM，不需要一句话识别
+    assert server.audio[0] == opus_codec.decode_packets(opus_packets).tobytes()
+    assert api.requests == []
+
+
+def test_rejected_realtime_session_falls_back_to_sentence_api(tmp_path, encode_frames):
+    opus_packets = encode_frames(6)
+
+    async def run():
+        async with FakeRealtimeServer(code=4001) as server, FakeSentenceAPI() as api:
+            provider = create_provider(tmp_path, api.url, server.url, streaming=True)
+            _, (text, _) = await stream_utterance(provider, opus_packets)
+            await provider.close()
+            return server, api, text
+
+    server, api, text = asyncio.run(run())
+    assert text == SENTENCE_TEXT
+    assert len(server.paths) == 1
+    # 退回一句话识别时使用保留的全部原始音频
+    _, body = api.requests[0]
+    assert base64.b64decode(body["Data"]) == opus_codec.decode_packets(opus_packets).tobytes()
+
+
+def test_cancel_closes_the_realtime_session_in_background(tmp_path, encode_frames):
+    async def run():
+        async with FakeRealtimeServer() as server:
+            provider = create_provider(tmp_path, "http://127.0.0.1:1/", server.url, streaming=True)
+            stream = provider.start_stream("test")
+            for opus_packet in encode_frames(6):
+                await provider.feed(stream, opus_packet)
+            provider.cancel(stream)
+            # 关闭任务在完成前一直被引用
+            assert len(provider._closing_tasks) == 1
+            await asyncio.gather(*provider._closing_tasks)
+            await asyncio.sleep(0)
+            return provider, stream
+
+    provider, stream = asyncio.run(run())
+    assert not provider._closing_tasks
+    assert stream.decoder is None
+    assert stream.websocket.state is websockets.protocol.State.CLOSED
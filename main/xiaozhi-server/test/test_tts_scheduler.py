@@ -0,0 +1,70 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core.utils.tts_scheduler import TTSScheduler
+
+
+class FakeConnection:
+    """speak_and_play阻塞到测试放行为止，记录合成过的分段"""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=8)
+        self.release = threading.Event()
+        self.spoken = []
+
+    def speak_and_play(self, text, text_index):
+        self.spoken.append(text)
+        self.release.wait(5)
+        return None, text, text_index
+
+
+@pytest.fixture
+def conn():
+    conn = FakeConnection()
+    yield conn
+    conn.release.set()
+    conn.executor.shutdown(wait=True)
+
+
+def test_timed_out_segments_release_lookahead(conn):
+    scheduler = TTSScheduler(conn, lookahead=2)
+    scheduler.start_turn()
+    scheduler.submit("first", 0)
+
+    async def wait_with_timeout(future):
+        # 与asyncio模式的TTS消化任务一样，超时后取消对占位Future的等待
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(asyncio.wrap_future(future), timeout=0.05)
+
+    slow = [scheduler.submit(f"slow{i}", i + 1) for i in range(2)]
+    for future in slow:
+        asyncio.run(wait_with_timeout(future))
+    conn.release.set()
+    for future in slow:
+        assert future.result(timeout=5)[1].startswith("slow")
+
+    later = scheduler.submit("later", 3)
+    assert later.result(timeout=5)[1] == "later"
+    assert scheduler._running == 0
+
+
+def test_discard_pending_frees_quota_for_next_turn(conn):
+    scheduler = TTSScheduler(conn, lookahead=1)
+    scheduler.start_turn()
+    scheduler.submit("first", 0)
+    running = scheduler.submit("running", 1)
+    queued = [scheduler.submit(f"queued{i}", i + 2) for i in range(3)]
+
+    # 打断后新一轮对话开始，上一轮排队的分段不再合成
+    scheduler.start_turn()
+    for future in queued:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=1)
+    conn.release.set()
+    running.result(timeout=5)
+
+    assert scheduler.submit("next", 0).result(timeout=5)[1] == "next"
+    assert not any(text.startswith("queued") for text in conn.spoken)